@@ -13,5 +13,21 @@
     :license: MIT, see LICENSE for more details.
 
 """
+__version__ = '0.3.0.dev0'
+
+from .cache import CodeCache, DiskCache
+from .context import RunContext
+from .forkserver import ForkServer
 from .livesource import LiveSource, LSTree
-__all__ = ['LiveSource', 'LSTree']
+from .pool import (EvaluationCancelled, EvaluationError, EvaluationTimeout,
+                   WorkerPool)
+from .profile import Profile
+from .recorder import Backoff, Delta, Every, TimeBudget
+from .snapshot import Snapshots, Summary
+from .statistics import ProbeStatistics
+from .stream import Stream
+__all__ = ['Backoff', 'CodeCache', 'Delta', 'DiskCache',
+           'EvaluationCancelled', 'EvaluationError', 'EvaluationTimeout',
+           'Every', 'ForkServer', 'LiveSource', 'LSTree', 'ProbeStatistics',
+           'Profile', 'RunContext', 'Snapshots', 'Stream', 'Summary',
+           'TimeBudget', 'WorkerPool']
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation of source code from asyncio event loop.
+
+Usage::
+
+    source = LiveSource(code)
+    values = await source.get_values_async()
+
+"""
+import asyncio
+
+from .pool import EvaluationCancelled
+
+
+async def get_values(source, executor=None):
+    """
+    Evaluates source code in thread pool.
+
+    Concurrent callers share one evaluation. When source code is updated
+    during evaluation, the evaluation is cancelled and started again with
+    the latest code, so rapid successive updates are evaluated only once.
+
+    Evaluation in current process is cancelled at its next probe, so loop
+    without probes cannot be superseded until it ends (and blocks shutdown
+    of event loop until then). Evaluate such code by WorkerPool.
+
+    Args:
+        source (LiveSource): Evaluated source code.
+        executor (concurrent.futures.Executor): Executor of blocking
+            evaluation, default executor of event loop by default.
+
+    Returns:
+        Mapping type object: Values of the latest source code.
+
+    """
+    evaluation = source._evaluation
+    if evaluation is None or evaluation.done():
+        evaluation = asyncio.ensure_future(_evaluate_latest(source,
+                                                            executor))
+        source._evaluation = evaluation
+    # cancelled caller must not cancel evaluation shared with others
+    return await asyncio.shield(evaluation)
+
+
+async def _evaluate_latest(source, executor):
+    """
+    Evaluates source code until result matches its latest version.
+
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        generation = source._generation
+        try:
+            values = await loop.run_in_executor(executor, source.get_values)
+        except EvaluationCancelled:
+            if source._generation == generation:
+                raise  # cancelled by cancel(), not by update()
+            continue
+        if source._generation == generation:
+            return values
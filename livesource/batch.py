@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation of many source files in parallel.
+
+"""
+import collections
+import glob
+import os
+import timeit
+try:
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+except ImportError:  # Python 2 without futures backport
+    ThreadPoolExecutor = as_completed = None
+
+from .export import json_listing
+from .forkserver import ForkServer
+from .pool import EvaluationError, WorkerPool
+
+
+def find_sources(patterns):
+    """
+    Expands file names, glob patterns and directories to source files.
+
+    Directories are searched recursively for *.py files.
+
+    Args:
+        patterns (list): File names, glob patterns or directories.
+
+    Returns:
+        list: Paths without duplicates, in order of patterns.
+
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                paths.extend(os.path.join(root, name)
+                             for name in sorted(files)
+                             if name.endswith('.py'))
+        elif glob.has_magic(pattern):
+            try:
+                paths.extend(sorted(glob.glob(pattern, recursive=True)))
+            except TypeError:  # Python < 3.5
+                paths.extend(sorted(glob.glob(pattern)))
+        else:
+            paths.append(pattern)
+
+    seen = set()
+    return [path for path in paths if not (path in seen or seen.add(path))]
+
+
+def evaluate_file(pool, path, **options):
+    """
+    Evaluates source file in worker process.
+
+    Args:
+        pool (WorkerPool): Pool of worker processes.
+        path (str): Path of source file.
+        **options: Options of WorkerPool.evaluate().
+
+    Returns:
+        OrderedDict: path, time (seconds), values and error (message or
+        None).
+
+    """
+    result = collections.OrderedDict([('path', path), ('time', 0.0),
+                                      ('values', None), ('error', None)])
+    start = timeit.default_timer()
+    try:
+        with open(path) as source_file:
+            code = source_file.read()
+        result['values'] = pool.evaluate(code, **options)
+    except (IOError, OSError) as err:
+        result['error'] = str(err)
+    except EvaluationError as err:
+        result['error'] = str(err).strip().split('\n')[-1]
+    result['time'] = timeit.default_timer() - start
+    return result
+
+
+def evaluate_files(paths, processes=None, timeout=None, memory_limit=None,
+                   preload=(), fork=False, **options):
+    """
+    Evaluates source files in pool of worker processes.
+
+    Args:
+        paths (list): Paths of source files.
+        processes (int): Number of worker processes (default: number of
+            CPUs).
+        timeout (float): Time limit of every file in seconds.
+        memory_limit (int): Address space limit of worker in bytes.
+        preload (iterable): Names of modules imported by every worker at
+            start.
+        fork (bool): Evaluate every file in new child of fork server
+            instead of worker pool.
+        **options: Options of WorkerPool.evaluate().
+
+    Yields:
+        Results of evaluate_file(), in order of completion.
+
+    """
+    executor_class = ForkServer if fork else WorkerPool
+    with executor_class(processes, timeout, memory_limit, preload) as pool:
+        with ThreadPoolExecutor(pool.processes) as threads:
+            futures = [threads.submit(evaluate_file, pool, path, **options)
+                       for path in paths]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+def portable_result(result):
+    """
+    Converts result of evaluate_file() to JSON-serializable dict.
+
+    Values are replaced by their repr().
+
+    Args:
+        result (dict): Result of evaluate_file().
+
+    Returns:
+        OrderedDict
+
+    """
+    portable = collections.OrderedDict(result)
+    if result['values'] is not None:
+        portable['values'] = json_listing(result['values'])
+    return portable
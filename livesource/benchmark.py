@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of LiveSource overhead.
+
+Usage::
+
+    python -m livesource.benchmark [--repeat N] [--scale X] [workload ...]
+    python -m livesource.benchmark --scaling [--repeat N] [--scale X]
+
+Results are printed as JSON document. Besides stages of evaluation,
+execution of plain code is compared with execution of instrumented code
+(``slowdown``), traced code (``trace_slowdown``) and code instrumented in
+profile mode (``profile_slowdown``, see LiveSource.get_profile).
+
+Scaling benchmark instruments growing files (10k+ lines) and reports time
+per line, which stays flat when instrumentation scales linearly.
+
+"""
+from __future__ import print_function
+import argparse
+import ast
+import collections
+import json
+import platform
+import sys
+import timeit
+
+from . import __version__
+from .livesource import LiveSource, LSTree
+from .profile import Profile
+from .trace import Tracer, bound_names
+
+
+def straight(size):
+    """
+    Long straight-line module.
+
+    """
+    lines = ['v0 = 0']
+    for index in range(1, size):
+        lines.append('v{0} = v{1} + {0}'.format(index, index - 1))
+    return '\n'.join(lines) + '\n'
+
+
+def loops(size):
+    """
+    Deeply nested loops.
+
+    """
+    return ('total = 0\n'
+            'i = 0\n'
+            'while i < {0}:\n'
+            '    j = 0\n'
+            '    while j < {0}:\n'
+            '        k = 0\n'
+            '        while k < 10:\n'
+            '            total += i * j + k\n'
+            '            k += 1\n'
+            '        j += 1\n'
+            '    i += 1\n').format(size)
+
+
+def objects(size):
+    """
+    Attribute-heavy object-oriented code.
+
+    """
+    return ('class Point(object):\n'
+            '    pass\n'
+            'p = Point()\n'
+            'p.x = 0\n'
+            'p.y = 0\n'
+            'v = Point()\n'
+            'v.x = 1\n'
+            'v.y = 2\n'
+            'i = 0\n'
+            'while i < {0}:\n'
+            '    p.x = p.x + v.x\n'
+            '    p.y = p.y + v.y\n'
+            '    v.x = v.y - p.x % 7\n'
+            '    i += 1\n').format(size)
+
+
+def calls(size):
+    """
+    Many calls of small recursive function.
+
+    """
+    return ('def fib(n):\n'
+            '    if n < 2:\n'
+            '        return n\n'
+            '    result = fib(n - 1) + fib(n - 2)\n'
+            '    return result\n'
+            'i = 0\n'
+            'while i < {0}:\n'
+            '    value = fib(10)\n'
+            '    i += 1\n').format(size)
+
+
+def unpacking(size):
+    """
+    Loop with tuple unpacking and calls of functions with many arguments,
+    many names are recorded at every line.
+
+    """
+    return ('def scale(x, y, z, factor):\n'
+            '    a, b, c = x * factor, y * factor, z * factor\n'
+            '    return a, b, c\n'
+            'x, y, z = 1, 2, 3\n'
+            'i = 0\n'
+            'while i < {0}:\n'
+            '    u, v, w = scale(x, y, z, i % 3)\n'
+            '    x, y, z = v, w, u + 1\n'
+            '    i += 1\n').format(size)
+
+
+def large(size):
+    """
+    Large file with many small blocks.
+
+    """
+    lines = []
+    for index in range(size // 4):
+        lines.append('a{0} = {0}'.format(index))
+        lines.append('if a{0} > 2:'.format(index))
+        lines.append('    b = a{0} * 2'.format(index))
+        lines.append('')
+    return '\n'.join(lines) + '\n'
+
+
+#: line counts of scaling benchmark
+SCALING_SIZES = (2500, 5000, 10000, 20000, 40000)
+
+#: workload name -> (code generator, default size)
+WORKLOADS = collections.OrderedDict([
+    ('straight', (straight, 2000)),
+    ('loops', (loops, 60)),
+    ('objects', (objects, 20000)),
+    ('calls', (calls, 100)),
+    ('unpacking', (unpacking, 10000)),
+    ('large', (large, 10000)),
+])
+
+
+def measure(func, repeat):
+    """
+    Returns:
+        float: Best time of func call in seconds.
+
+    """
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def run_workload(code, repeat=3):
+    """
+    Measures every stage of LiveSource evaluation.
+
+    Args:
+        code (str): Source code.
+        repeat (int): Number of measurements of every stage.
+
+    Returns:
+        dict: Times in seconds, instrumented/plain, traced/plain and
+        profiled/plain execution ratios.
+
+    """
+    source = LiveSource(code)
+    tree = source._parse()
+    instrumented_code = compile(tree, '<livesource>', 'exec')
+    plain_code = compile(code, '<livesource>', 'exec')
+    probes = tuple(source.lst.probes)
+    batches = dict(source.lst.batches)
+
+    def exec_plain():
+        exec(plain_code, {})
+
+    def exec_instrumented():
+        source.lst.recorder.start(probes, batches=batches)
+        exec(instrumented_code, dict(source.lst.globals))
+
+    stores = bound_names(plain_code)
+
+    def exec_traced():
+        Tracer(source.max_deep).run(plain_code, {}, stores)
+
+    profiler = LSTree()
+    profiler.profiled = True
+    profiled_code = compile(profiler.visit(ast.parse(code)), '<livesource>',
+                            'exec')
+    size = code.count('\n') + 2
+
+    def exec_profiled():
+        exec(profiled_code, Profile(size).namespace())
+
+    edited = code.replace('1', '2', 1)
+
+    def update():
+        source.update(edited)
+        source.update(code)
+
+    result = collections.OrderedDict()
+    result['lines'] = code.count('\n')
+    result['parse'] = measure(lambda: ast.parse(code), repeat)
+    result['instrument'] = instrument_time(code, repeat)
+    result['full_parse'] = measure(LiveSource(code)._parse, repeat)
+    result['compile'] = measure(
+        lambda: compile(tree, '<livesource>', 'exec'), repeat)
+    result['update'] = measure(update, repeat) / 2
+    result['exec_plain'] = measure(exec_plain, repeat)
+    result['exec_instrumented'] = measure(exec_instrumented, repeat)
+    result['slowdown'] = result['exec_instrumented'] / result['exec_plain']
+    result['trace_analysis'] = measure(lambda: bound_names(plain_code),
+                                       repeat)
+    result['exec_traced'] = measure(exec_traced, repeat)
+    result['trace_slowdown'] = result['exec_traced'] / result['exec_plain']
+    result['exec_profiled'] = measure(exec_profiled, repeat)
+    result['profile_slowdown'] = (result['exec_profiled'] /
+                                  result['exec_plain'])
+    return result
+
+
+def instrument_time(code, repeat=3):
+    """
+    Returns:
+        float: Best time of instrumentation of parsed code in seconds.
+
+    """
+    times = []
+    for _ in range(repeat):
+        tree = ast.parse(code)
+        lst = LSTree()
+        start = timeit.default_timer()
+        lst.visit(tree)
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+
+def run_scaling(names=None, repeat=3, scale=1.0):
+    """
+    Measures instrumentation time of workloads of growing size.
+
+    Args:
+        names (list): Workload names, 'straight' and 'large' by default.
+        repeat (int): Number of measurements of every size.
+        scale (float): Multiplier of sizes.
+
+    Returns:
+        dict: Environment description and for every workload list of
+        ``lines``, ``instrument`` (seconds) and ``per_line``
+        (microseconds), plus ``growth``: per-line time of the largest file
+        divided by per-line time of the smallest one (1 for linear
+        scaling).
+
+    """
+    results = collections.OrderedDict()
+    for name in names or ('straight', 'large'):
+        generate = WORKLOADS[name][0]
+        sizes = []
+        for size in SCALING_SIZES:
+            code = generate(max(int(size * scale), 4))
+            lines = code.count('\n')
+            seconds = instrument_time(code, repeat)
+            result = collections.OrderedDict()
+            result['lines'] = lines
+            result['instrument'] = seconds
+            result['per_line'] = seconds / lines * 1e6
+            sizes.append(result)
+        results[name] = collections.OrderedDict([
+            ('sizes', sizes),
+            ('growth', sizes[-1]['per_line'] / sizes[0]['per_line'])])
+    return _report(results)
+
+
+def run(names=None, repeat=3, scale=1.0):
+    """
+    Runs benchmarks.
+
+    Args:
+        names (list): Workload names, all by default.
+        repeat (int): Number of measurements of every stage.
+        scale (float): Multiplier of workload sizes.
+
+    Returns:
+        dict: Environment description and results of every workload.
+
+    """
+    results = collections.OrderedDict()
+    for name in names or WORKLOADS:
+        generate, size = WORKLOADS[name]
+        code = generate(max(int(size * scale), 1))
+        results[name] = run_workload(code, repeat)
+    return _report(results)
+
+
+def _report(results):
+    """
+    Returns:
+        dict: Environment description and results.
+
+    """
+    report = collections.OrderedDict()
+    report['livesource'] = __version__
+    report['python'] = platform.python_version()
+    report['implementation'] = platform.python_implementation()
+    report['results'] = results
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m livesource.benchmark',
+        description='LiveSource benchmarks.')
+    parser.add_argument('workloads',
+                        nargs='*',
+                        metavar='workload',
+                        help='one of: {0} (default: all)'.format(
+                            ', '.join(WORKLOADS)))
+    parser.add_argument('-r', '--repeat',
+                        type=int,
+                        default=3,
+                        help='measurements of every stage (default: 3)')
+    parser.add_argument('-s', '--scale',
+                        type=float,
+                        default=1.0,
+                        help='multiplier of workload sizes (default: 1)')
+    parser.add_argument('--scaling',
+                        action='store_true',
+                        help='measure instrumentation of growing files')
+    args = parser.parse_args(argv)
+    for name in args.workloads:
+        if name not in WORKLOADS:
+            parser.error('unknown workload: {0}'.format(name))
+
+    if args.scaling:
+        report = run_scaling(args.workloads, args.repeat, args.scale)
+    else:
+        report = run(args.workloads, args.repeat, args.scale)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
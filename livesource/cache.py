@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Caches of instrumented code.
+
+"""
+import collections
+import errno
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import threading
+
+
+class CodeCache(object):
+    """
+    Least recently used cache of instrumented code objects.
+
+    Attributes:
+        maxsize (int): Maximal number of cached code objects.
+        hits (int): Number of successful lookups.
+        misses (int): Number of failed lookups.
+
+    """
+    def __init__(self, maxsize=128):
+        """
+
+        Args:
+            maxsize (int): Maximal number of cached code objects.
+
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    @staticmethod
+    def key(code, *options):
+        """
+        Computes cache key of source code.
+
+        Args:
+            code (str): Source code.
+            *options: Instrumentation options which change the code object.
+
+        Returns:
+            str: Hex digest.
+
+        """
+        digest = hashlib.sha1(code.encode('utf-8'))
+        digest.update(repr(options).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns cached item.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Cached item or None.
+
+        """
+        with self._lock:
+            try:
+                item = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._items[key] = item  # most recently used goes last
+            self.hits += 1
+            return item
+
+    def set(self, key, item):
+        """
+        Stores item in cache.
+
+        Args:
+            key (str): Cache key.
+            item: Cached item.
+
+        """
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = item
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes all items and resets counters.
+
+        """
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class DiskCache(object):
+    """
+    Persistent cache of instrumented code objects.
+
+    Code objects are marshalled into separate files, named after digest of
+    cache key, Python version and LiveSource version. Files are written
+    atomically, so concurrent processes can share one directory.
+
+    Attributes:
+        path (str): Cache directory.
+        hits (int): Number of successful lookups.
+        misses (int): Number of failed lookups.
+
+    """
+    magic = b'LSC3'
+
+    def __init__(self, path):
+        """
+
+        Args:
+            path (str): Cache directory, created when needed.
+
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+    def filename(self, key):
+        """
+        Returns path of cache file.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            str: File path.
+
+        """
+        from . import __version__
+        digest = hashlib.sha1(key.encode('utf-8'))
+        digest.update(sys.version.encode('utf-8'))
+        digest.update(__version__.encode('utf-8'))
+        return os.path.join(self.path, digest.hexdigest() + '.lsc')
+
+    def get(self, key):
+        """
+        Returns cached code object.
+
+        Unreadable and corrupted files are treated as missing.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Code object or None.
+
+        """
+        filename = self.filename(key)
+        try:
+            with open(filename, 'rb') as cache_file:
+                data = cache_file.read()
+            if not data.startswith(self.magic):
+                raise ValueError('invalid cache file')
+            code = marshal.loads(data[len(self.magic):])
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        except (EOFError, ValueError, TypeError):
+            self._remove(filename)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return code
+
+    def set(self, key, code):
+        """
+        Stores code object.
+
+        Write errors are ignored, cache is only an optimization.
+
+        Args:
+            key (str): Cache key.
+            code: Code object.
+
+        """
+        filename = self.filename(key)
+        tmp_filename = None
+        try:
+            try:
+                os.makedirs(self.path)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+            fd, tmp_filename = tempfile.mkstemp(dir=self.path,
+                                                suffix='.tmp')
+            with os.fdopen(fd, 'wb') as cache_file:
+                cache_file.write(self.magic)
+                cache_file.write(marshal.dumps(code))
+            getattr(os, 'replace', os.rename)(tmp_filename, filename)
+        except (IOError, OSError):
+            if tmp_filename is not None:
+                self._remove(tmp_filename)
+
+    def clear(self):
+        """
+        Removes all cache files and resets counters.
+
+        """
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            names = []
+        for name in names:
+            if name.endswith(('.lsc', '.tmp')):
+                self._remove(os.path.join(self.path, name))
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _remove(filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Run context: namespaces of evaluations and warm import cache.
+
+Every evaluation gets fresh namespace, so names defined by previous run
+(e.g. by removed statement) do not leak into the next one. Modules are
+cached by interpreter (sys.modules), so import statements of repeated
+runs only bind already imported modules. Heavy modules (e.g. numpy) can
+be preloaded once, before the first run, or when worker process starts.
+
+"""
+import importlib
+import threading
+
+
+class RunContext(object):
+    """
+    Creates namespaces of runs and keeps preloaded modules imported.
+
+    One context can be shared by many LiveSource instances (documents of
+    evaluation server).
+
+    Attributes:
+        modules (dict): Name -> preloaded module.
+        preload (tuple): Names of modules imported before the first run.
+
+    """
+    def __init__(self, preload=()):
+        """
+
+        Args:
+            preload (iterable): Names of modules imported before the first
+                run, e.g. ['numpy'].
+
+        """
+        self.preload = tuple(preload or ())
+        self.modules = {}
+        self._lock = threading.Lock()
+
+    def warm(self):
+        """
+        Imports preloaded modules, only once.
+
+        Raises:
+            ImportError: Preloaded module cannot be imported.
+
+        """
+        if len(self.modules) == len(self.preload):
+            return
+        with self._lock:
+            for name in self.preload:
+                if name not in self.modules:
+                    self.modules[name] = importlib.import_module(name)
+
+    def namespace(self, tables):
+        """
+        Returns fresh namespace of run.
+
+        Args:
+            tables (dict): Probe tables of instrumented code, see
+                LSTree.globals.
+
+        Returns:
+            dict: Namespace with probe tables only.
+
+        """
+        self.warm()
+        return dict(tables)
+
+    def __repr__(self):
+        return '{0}(preload={1!r})'.format(type(self).__name__,
+                                           list(self.preload))
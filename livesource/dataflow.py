@@ -0,0 +1,700 @@
+# -*- coding: utf-8 -*-
+"""
+Partial re-run of changed source code.
+
+Top-level statements are executed one by one and namespace is copied
+(shallowly) at every statement boundary. After update, execution starts
+from namespace of the first changed statement and unchanged statements
+which do not depend on changed ones are skipped: names they bound are
+taken from namespace of previous run.
+
+Namespace copy is valid only when objects in it were not changed in place
+by later statements, so effects of statements are found by static
+analysis. Analysis is conservative: attribute and item assignments, calls
+of methods and passing objects to functions other than PURE_FUNCTIONS are
+considered mutations, and aliases (b = a) are followed. State of imported
+modules is not restored.
+
+"""
+import ast
+import bisect
+import types
+
+#: builtins which do not change their arguments
+PURE_FUNCTIONS = frozenset([
+    'abs', 'all', 'any', 'ascii', 'bin', 'bool', 'bytes', 'callable', 'chr',
+    'complex', 'dict', 'divmod', 'enumerate', 'filter', 'float', 'format',
+    'frozenset', 'getattr', 'hasattr', 'hash', 'hex', 'id', 'int',
+    'isinstance', 'issubclass', 'len', 'list', 'map', 'max', 'min', 'oct',
+    'ord', 'pow', 'print', 'range', 'repr', 'reversed', 'round', 'set',
+    'sorted', 'str', 'sum', 'tuple', 'type', 'zip'])
+
+#: methods of builtin types which do not change their object
+PURE_METHODS = frozenset([
+    'copy', 'count', 'decode', 'difference', 'encode', 'endswith', 'find',
+    'format', 'get', 'index', 'intersection', 'isdigit', 'isdisjoint',
+    'issubset', 'issuperset', 'items', 'join', 'keys', 'lower', 'lstrip',
+    'replace', 'rfind', 'rsplit', 'rstrip', 'split', 'splitlines',
+    'startswith', 'strip', 'symmetric_difference', 'union', 'upper',
+    'values'])
+
+#: builtins which can change any name
+OPAQUE_FUNCTIONS = frozenset(['__import__', 'delattr', 'eval', 'exec',
+                              'globals', 'locals', 'setattr', 'vars'])
+
+#: marks name missing in namespace
+MISSING = object()
+
+
+class Effects(object):
+    """
+    Names touched by top-level statement.
+
+    Attributes:
+        aliases (dict): Bound name -> names whose objects its value may
+            reference.
+        binds (set): Names bound or deleted.
+        functions (dict): Name of defined function or class -> (names read,
+            names mutated) by its body (by methods of class) when called.
+        mutates (set): Names whose objects may be changed in place.
+        opaque (bool): Statement can change any name (e.g. exec, import *).
+        uses (set): Names read.
+
+    """
+    __slots__ = ('aliases', 'binds', 'functions', 'mutates', 'opaque', 'uses')
+
+    def __init__(self):
+        self.aliases = {}
+        self.binds = set()
+        self.functions = {}
+        self.mutates = set()
+        self.opaque = False
+        self.uses = set()
+
+
+def effects(nodes):
+    """
+    Analyzes top-level statement.
+
+    Probes emitted by LSTree are not considered calls.
+
+    Args:
+        nodes (list): Instrumented ast nodes of statement.
+
+    Returns:
+        Effects
+
+    """
+    visitor = _EffectsVisitor(Effects())
+    for node in nodes:
+        visitor.visit(node)
+    return visitor.effects
+
+
+class _EffectsVisitor(ast.NodeVisitor):
+    """
+    Collects effects of statement. In function and class bodies
+    (local=True) only read and mutated names are collected. Class body runs
+    when class is defined, bodies of its methods are collected in deferred
+    effects.
+
+    """
+    def __init__(self, effects, local=False, deferred=None):
+        self.effects = effects
+        self.local = local
+        self.deferred = deferred
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and \
+                not node.id.startswith('_livesource'):
+            self.effects.uses.add(node.id)
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        for target in node.targets:
+            self._bind(target, node.value)
+
+    def visit_AnnAssign(self, node):
+        self.visit(node.annotation)
+        if node.value is not None:
+            self.visit(node.value)
+            self._bind(node.target, node.value)
+
+    def visit_AugAssign(self, node):
+        self.visit(node.value)
+        self.visit(node.target)
+        if isinstance(node.target, ast.Name):
+            self.effects.uses.add(node.target.id)
+            self._bind(node.target, ast.Tuple(elts=[node.target, node.value],
+                                              ctx=ast.Load()))
+        else:
+            self._bind(node.target, node.value)
+
+    def visit_NamedExpr(self, node):
+        self.visit(node.value)
+        self._bind(node.target, node.value)
+
+    def visit_For(self, node):
+        self.visit(node.iter)
+        self._bind(node.target, node.iter)
+        for statement in node.body + node.orelse:
+            self.visit(statement)
+
+    visit_AsyncFor = visit_For
+
+    def visit_With(self, node):
+        for item in node.items:
+            self.visit(item.context_expr)
+            if item.optional_vars is not None:
+                self._bind(item.optional_vars, item.context_expr)
+        for statement in node.body:
+            self.visit(statement)
+
+    visit_AsyncWith = visit_With
+
+    def visit_ExceptHandler(self, node):
+        if node.name and not self.local:
+            self.effects.binds.add(node.name)
+            self.effects.aliases[node.name] = set()
+        self.generic_visit(node)
+
+    def visit_Delete(self, node):
+        for target in node.targets:
+            for name in _names(target):
+                self.effects.uses.add(name)
+            self._bind(target, None)
+
+    def visit_Import(self, node):
+        if not self.local:
+            for alias in node.names:
+                name = alias.asname or alias.name.split('.')[0]
+                self.effects.binds.add(name)
+
+    def visit_ImportFrom(self, node):
+        if self.local:
+            return
+        for alias in node.names:
+            if alias.name == '*':
+                self.effects.opaque = True
+            else:
+                self.effects.binds.add(alias.asname or alias.name)
+
+    def visit_Global(self, node):
+        if self.local:
+            # rebinding of global name is seen by its readers as mutation
+            self.effects.mutates.update(node.names)
+
+    def visit_FunctionDef(self, node):
+        for expr in (node.decorator_list + node.args.defaults +
+                     [default for default in node.args.kw_defaults
+                      if default is not None]):
+            self.visit(expr)
+        self._define(node.name, node.body)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        for expr in (node.decorator_list + node.bases +
+                     [keyword.value for keyword in node.keywords]):
+            self.visit(expr)
+        visitor = _EffectsVisitor(Effects(), local=True, deferred=Effects())
+        for statement in node.body:
+            visitor.visit(statement)
+        body_effects, methods = visitor.effects, visitor.deferred
+        if body_effects.opaque:
+            self.effects.opaque = True
+        self.effects.uses.update(body_effects.uses)
+        self.effects.mutates.update(body_effects.mutates)
+        self._defined(node.name, methods)
+
+    def visit_Call(self, node):
+        func = node.func
+        arguments = node.args + [keyword.value for keyword in node.keywords]
+        if isinstance(func, ast.Subscript) and isinstance(func.value,
+                                                          ast.Name) and \
+                func.value.id.startswith('_livesource'):
+            # probe
+            for argument in arguments:
+                self.visit(argument)
+            return
+
+        self.visit(func)
+        for argument in arguments:
+            self.visit(argument)
+        if isinstance(func, ast.Name):
+            if func.id in OPAQUE_FUNCTIONS:
+                self.effects.opaque = True
+            if func.id in PURE_FUNCTIONS:
+                return
+        elif isinstance(func, ast.Attribute) and \
+                func.attr not in PURE_METHODS:
+            self._mutate(func.value)
+        for argument in arguments:
+            self._mutate(argument)
+
+    def _bind(self, target, value):
+        """
+        Records binding of target to value.
+
+        """
+        if isinstance(target, (ast.Tuple, ast.List)):
+            for element in target.elts:
+                self._bind(element, value)
+        elif isinstance(target, ast.Starred):
+            self._bind(target.value, value)
+        elif isinstance(target, ast.Name):
+            if self.local:
+                return
+            self.effects.binds.add(target.id)
+            sources = set()
+            if value is not None:
+                sources = set(_names(value))
+            self.effects.aliases[target.id] = sources
+        else:  # attribute or item
+            self.visit(target)
+            self._mutate(target)
+
+    def _mutate(self, node):
+        """
+        Records name of object which may be changed through node.
+
+        """
+        while isinstance(node, (ast.Attribute, ast.Subscript, ast.Starred)):
+            node = node.value
+        if isinstance(node, ast.Name) and \
+                not node.id.startswith('_livesource'):
+            self.effects.mutates.add(node.id)
+
+    def _define(self, name, body):
+        """
+        Records function defined by statement.
+
+        """
+        body_effects = Effects()
+        visitor = _EffectsVisitor(body_effects, local=True)
+        for statement in body:
+            visitor.visit(statement)
+        self._defined(name, body_effects)
+
+    def _defined(self, name, body_effects):
+        """
+        Records function or class whose body (methods) has given effects
+        when called.
+
+        """
+        if body_effects.opaque:
+            self.effects.opaque = True
+        if self.local:
+            # method of class body runs later, nested function with its
+            # enclosing one
+            effects = self.deferred if self.deferred is not None \
+                else self.effects
+            effects.uses.update(body_effects.uses)
+            effects.mutates.update(body_effects.mutates)
+        else:
+            self.effects.binds.add(name)
+            self.effects.aliases[name] = set()
+            self.effects.functions[name] = (body_effects.uses,
+                                            body_effects.mutates)
+
+
+def _tainted(mutated, namespace):
+    """
+    Tells if objects of namespace may be changed by mutations.
+
+    Args:
+        mutated (set): Mutated names, None for any name.
+        namespace (dict): Name -> value.
+
+    Returns:
+        bool
+
+    """
+    if mutated is None:
+        return True
+    return any(name in namespace and
+               not isinstance(namespace[name], types.ModuleType)
+               for name in mutated)
+
+
+def _names(node):
+    """
+    Yields names read by expression.
+
+    """
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name) and \
+                not child.id.startswith('_livesource'):
+            yield child.id
+
+
+class Dataflow(object):
+    """
+    Effects of statements in order of execution.
+
+    Calls of functions defined by earlier statements add effects of their
+    bodies, mutations are propagated to aliased names.
+
+    """
+    def __init__(self):
+        self._aliases = {}  # name -> names which may share its objects
+        self._functions = {}  # name -> (names read, names mutated)
+
+    def add(self, effects):
+        """
+        Args:
+            effects (Effects): Effects of next statement.
+
+        Returns:
+            (names read, names mutated) tuple of sets.
+
+        """
+        uses = set(effects.uses)
+        mutates = set(effects.mutates)
+        # methods of objects are found through aliases, e.g. c = C()
+        reached = uses.union(*[self._aliases.get(name, ()) for name in uses])
+        stack = [name for name in reached if name in self._functions]
+        called = set(stack)
+        while stack:
+            reads, changes = self._functions[stack.pop()]
+            uses.update(reads)
+            mutates.update(changes)
+            for name in reads:
+                if name in self._functions and name not in called:
+                    called.add(name)
+                    stack.append(name)
+        # objects are shared by aliases in both directions
+        mutates.update(*[self._aliases.get(name, ())
+                         for name in list(mutates)])
+        mutates.update([name for name, sources in self._aliases.items()
+                        if not mutates.isdisjoint(sources)])
+
+        for name in effects.binds:
+            self._functions.pop(name, None)
+            sources = effects.aliases.get(name, set())
+            self._aliases[name] = sources.union(
+                *[self._aliases.get(source, ()) for source in sources])
+        self._functions.update(effects.functions)
+        return uses, mutates
+
+
+class Step(object):
+    """
+    Statement executed (or skipped) by run.
+
+    Attributes:
+        binds (set): Names bound by statement.
+        calls (list): (first, last) ranges of ids of function calls made by
+            statement, exclusive.
+        mutates (set): Names mutated by statement.
+        nodes (list): Instrumented ast nodes of statement.
+        opaque (bool): Statement can change any name.
+        start (int): First line of statement.
+
+    """
+    __slots__ = ('binds', 'calls', 'mutates', 'nodes', 'opaque', 'start')
+
+    def __init__(self, nodes, start, binds, mutates, opaque):
+        self.nodes = nodes
+        self.start = start
+        self.binds = binds
+        self.mutates = mutates
+        self.opaque = opaque
+        self.calls = []
+
+
+class Plan(object):
+    """
+    Partial run of statements.
+
+    Attributes:
+        actions (list): (step, code object, namespace changes, recorded
+            values) tuples of statements from restart on. Skipped statement
+            has no code object, its namespace changes and values recorded
+            by previous run are restored instead.
+        restart (int): Index of the first statement executed or skipped.
+        restored (list): Recorded values of statements before restart.
+
+    """
+    def __init__(self, restart, actions, restored):
+        self.restart = restart
+        self.actions = actions
+        self.restored = restored
+
+    @property
+    def executed(self):
+        """
+        Returns:
+            int: Number of executed statements.
+
+        """
+        return sum(1 for action in self.actions if action[1] is not None)
+
+
+class Rerun(object):
+    """
+    Executes top-level statements of instrumented code one by one and
+    reuses results of previous run.
+
+    Values recorded by previous run are restored for statements which are
+    not executed again (values of function bodies are assigned to
+    statements by ids of calls). Values evicted from ring buffers in
+    previous run are not restored.
+
+    Attributes:
+        lst (LSTree): Instrumenting tree visitor.
+        namespace (dict): Private namespace of executed code seeded with
+            copy of probe tables, restored in place (functions keep it as
+            their globals).
+
+    """
+    def __init__(self, lst):
+        """
+
+        Args:
+            lst (LSTree): Instrumenting tree visitor.
+
+        """
+        self.lst = lst
+        self.namespace = dict(lst.globals)  # lst.globals stays clean
+        self._steps = []  # completed steps of previous run
+        self._snapshots = [self._initial()]  # namespace before every step
+        self._failed = None  # step which raised exception
+        self._analysis = {}  # id(nodes) -> (nodes, effects)
+        self._compiled = {}  # id(nodes) -> (nodes, start, code object)
+
+    def _initial(self):
+        """
+        Returns:
+            dict: Namespace before the first statement.
+
+        """
+        return dict((name, value) for name, value in self.namespace.items()
+                    if name.startswith('_livesource'))
+
+    def reset(self):
+        """
+        Forgets previous run, next run executes all statements.
+
+        """
+        self._steps = []
+        self._snapshots = [self._initial()]
+        self._failed = None
+
+    def plan(self, chunks, listing):
+        """
+        Decides which statements are executed.
+
+        Args:
+            chunks (list): (first line, instrumented nodes) of top-level
+                statements.
+            listing (Listing): Values recorded by previous run.
+
+        Returns:
+            Plan
+
+        """
+        steps = self._steps
+        completed = len(steps)
+        first = 0  # first changed statement
+        while (first < min(len(chunks), completed) and
+               chunks[first][1] is steps[first].nodes):
+            first += 1
+
+        # names mutated by old steps from index on, None when unknown
+        later = [None] * (completed + 1)
+        failed = self._failed
+        if failed is None:
+            later[completed] = set()
+        elif not failed.opaque:
+            later[completed] = set(failed.mutates)
+        for index in range(completed - 1, -1, -1):
+            if later[index + 1] is not None and not steps[index].opaque:
+                later[index] = later[index + 1].union(steps[index].mutates)
+
+        # restart from the latest namespace not changed by later steps
+        restart = first
+        while restart > 0 and _tainted(later[restart],
+                                       self._snapshots[restart]):
+            restart -= 1
+
+        current = set(id(nodes) for _, nodes in chunks)
+        matched = {}
+        dirty = set()
+        for index, step in enumerate(steps[first:], first):
+            if id(step.nodes) in current:
+                matched[id(step.nodes)] = index
+            else:
+                dirty.update(step.binds, step.mutates)
+
+        dataflow = Dataflow()
+        actions = []
+        kept = {}  # old index -> new step
+        last_match = restart - 1
+        for index, (start, nodes) in enumerate(chunks):
+            effects = self._effects(nodes)
+            uses, mutates = dataflow.add(effects)
+            step = Step(nodes, start, effects.binds, mutates, effects.opaque)
+            if index < restart:
+                step.calls = steps[index].calls
+                kept[index] = step
+                continue
+
+            old = matched.get(id(nodes), index if index < first else None)
+            if old is not None and old <= last_match:
+                old = None  # statements were reordered
+            changes = None
+            if (old is not None and not effects.opaque and not mutates and
+                    not steps[old].mutates and dirty.isdisjoint(uses)):
+                changes = self._changes(old, effects.binds)
+                if _tainted(later[old + 1], changes):
+                    changes = None
+            if old is not None:
+                last_match = old
+
+            if changes is None:
+                actions.append((step, self._compile(start, nodes), None, ()))
+                dirty.update(effects.binds, mutates)
+            else:
+                step.calls = steps[old].calls
+                kept[old] = step
+                actions.append((step, None, changes, []))
+
+        self._prune(current)
+        restored = self._restore(listing, kept)
+        actions = [(step, code, changes, restored.get(id(step), ()))
+                   for step, code, changes, _ in actions]
+        prefix = [entry for index in range(restart)
+                  for entry in restored.get(id(kept[index]), ())]
+        return Plan(restart, actions, prefix)
+
+    def execute(self, plan, recorder):
+        """
+        Executes plan in namespace.
+
+        Namespace is copied before every statement, so the next run can
+        start from it.
+
+        Args:
+            plan (Plan): Result of plan().
+            recorder (Recorder): Recorder started for this run.
+
+        """
+        restart = plan.restart
+        snapshots = self._snapshots[:restart + 1]
+        steps = self._steps[:restart]
+        namespace = self.namespace
+        namespace.clear()
+        namespace.update(snapshots[-1])
+        self._steps = steps
+        self._snapshots = snapshots
+        self._failed = None
+        recorder.restore(plan.restored)
+        for step, code, changes, restored in plan.actions:
+            if code is None:
+                for name, value in changes.items():
+                    if value is MISSING:
+                        namespace.pop(name, None)
+                    else:
+                        namespace[name] = value
+                recorder.restore(restored)
+            else:
+                first_call = recorder.calls()
+                try:
+                    exec(code, namespace)
+                except BaseException:
+                    self._failed = step
+                    raise
+                step.calls = [(first_call, recorder.calls())]
+            steps.append(step)
+            snapshots.append(dict(namespace))
+
+    def _restore(self, listing, kept):
+        """
+        Assigns values recorded by previous run to kept steps.
+
+        Values of function bodies belong to step which made the call.
+
+        Args:
+            listing (Listing): Values recorded by previous run.
+            kept (dict): Old index -> new step of statements which are not
+                executed.
+
+        Returns:
+            dict: id(step) -> list of (probe id, call id, value) tuples.
+
+        """
+        owners = {}  # probe id -> step
+        calls = []  # (first, last, step)
+        for step in kept.values():
+            for probe_id in self.lst.probe_ids(step.nodes):
+                owners[probe_id] = step
+            calls.extend((first, last, step) for first, last in step.calls)
+        calls.sort(key=lambda item: item[0])
+        starts = [first for first, _, _ in calls]
+
+        probes = self.lst.probes
+        restored = {}
+        for probe_id, call_id, value in listing.entries():
+            if probe_id >= len(probes) or probes[probe_id] is None:
+                continue
+            if call_id is None:
+                owner = owners.get(probe_id)
+            else:
+                index = bisect.bisect_right(starts, call_id) - 1
+                owner = None
+                if index >= 0 and call_id < calls[index][1]:
+                    owner = calls[index][2]
+            if owner is not None:
+                restored.setdefault(id(owner), []).append(
+                    (probe_id, call_id, value))
+        return restored
+
+    def _changes(self, index, binds):
+        """
+        Args:
+            index (int): Index of old step.
+            binds (set): Names bound by step (possibly to the same
+                objects).
+
+        Returns:
+            dict: Name -> value (MISSING for deleted name) of names changed
+            by old step.
+
+        """
+        before = self._snapshots[index]
+        after = self._snapshots[index + 1]
+        changes = dict((name, after.get(name, MISSING)) for name in binds)
+        for name in set(before).union(after):
+            value = after.get(name, MISSING)
+            if before.get(name, MISSING) is not value:
+                changes[name] = value
+        return changes
+
+    def _effects(self, nodes):
+        analysis = self._analysis.get(id(nodes))
+        if analysis is None or analysis[0] is not nodes:
+            analysis = (nodes, effects(nodes))
+            self._analysis[id(nodes)] = analysis
+        return analysis[1]
+
+    def _compile(self, start, nodes):
+        compiled = self._compiled.get(id(nodes))
+        if compiled is None or compiled[0] is not nodes or \
+                compiled[1] != start:
+            module = ast.Module(body=nodes, type_ignores=[])
+            compiled = (nodes, start, compile(module, '<livesource>', 'exec'))
+            self._compiled[id(nodes)] = compiled
+        return compiled[2]
+
+    def _prune(self, current):
+        """
+        Forgets analysis and code of removed statements.
+
+        Args:
+            current (set): Ids of nodes of current statements.
+
+        """
+        for cache in (self._analysis, self._compiled):
+            for key in [key for key in cache if key not in current]:
+                del cache[key]
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+Serialization of recorded values.
+
+Values are written incrementally as (line number, name, value) events, so
+listing or stream of any size is exported without building intermediate
+objects in memory.
+
+JSON lines format has one object per event::
+
+    {"line": 1, "name": "a", "value": 1}
+    {"line": 2, "name": "b", "type": "Point", "repr": "Point(1, 2)"}
+
+Binary format starts with MAGIC and continues with records of tag byte and
+unsigned LEB128 varints. Names are stored once in string table: NAME
+record defines next name id, event records refer to it. Probes of
+conditions (if, while, comparisons) have no name, NO_NAME record defines
+id of None::
+
+    NAME     b'N' length utf-8
+    NO_NAME  b'n'
+    event    tag line name-id payload
+
+Tag of event determines type of its value: NONE, TRUE, FALSE, INT (zigzag
+varint), FLOAT (8 bytes, little-endian), STR (length, utf-8), BYTES
+(length, bytes) or REPR (type name length, type name, repr length, repr).
+Values of other types are exported as their repr() and imported as
+Summary.
+
+"""
+import collections
+import json
+import math
+import struct
+
+from .snapshot import Summary, _truncated_repr
+
+MAGIC = b'LSV1'
+
+NAME = b'N'
+NO_NAME = b'n'
+NONE = b'0'
+TRUE = b'T'
+FALSE = b'F'
+INT = b'i'
+FLOAT = b'f'
+STR = b's'
+BYTES = b'b'
+REPR = b'r'
+
+#: types stored as native JSON values
+JSON_TYPES = (bool, int, type(u''), type(None))
+
+_double = struct.Struct('<d')
+
+
+def events(listing):
+    """
+    Yields (line number, name, value) events of listing, ordered by lines.
+
+    Args:
+        listing (Mapping): Line number -> iterable of (name, value).
+
+    """
+    for lineno in sorted(listing):
+        for name, value in listing[lineno]:
+            yield (lineno, name, value)
+
+
+def json_listing(listing):
+    """
+    Converts listing to JSON-serializable dict.
+
+    Values are replaced by their repr().
+
+    Args:
+        listing (Mapping): Line number -> iterable of (name, value).
+
+    Returns:
+        OrderedDict: Line number (str) -> list of [name, repr] lists,
+        ordered by lines.
+
+    """
+    return collections.OrderedDict(
+        (str(lineno), [[name, repr(value)] for name, value in listing[lineno]])
+        for lineno in sorted(listing))
+
+
+class JSONLinesWriter(object):
+    """
+    Writer of events in JSON lines format.
+
+    Attributes:
+        max_length (int): Number of characters of repr() of other values.
+
+    """
+    def __init__(self, stream, max_length=1000):
+        """
+
+        Args:
+            stream: Text file object.
+            max_length (int): Number of characters of repr() of values
+                which are not JSON scalars.
+
+        """
+        self.max_length = max_length
+        self._stream = stream
+        self._encode = json.JSONEncoder(ensure_ascii=False,
+                                        separators=(', ', ': ')).encode
+
+    def write(self, lineno, name, value):
+        """
+        Writes single event.
+
+        """
+        encode = self._encode
+        kind = type(value)
+        if kind in JSON_TYPES or (kind is float and not math.isinf(value) and
+                                  not math.isnan(value)):
+            line = '{{"line": {0}, "name": {1}, "value": {2}}}\n'.format(
+                lineno, encode(name), encode(value))
+        else:
+            line = '{{"line": {0}, "name": {1}, "type": {2}, "repr": {3}}}\n'\
+                .format(lineno, encode(name), encode(_type_name(value)),
+                        encode(_truncated_repr(value, self.max_length)))
+        self._stream.write(line)
+
+    def write_all(self, events):
+        """
+        Writes events.
+
+        Args:
+            events (iterable): (line number, name, value) tuples, e.g.
+                events() of listing or LiveSource.stream().
+
+        Returns:
+            int: Number of written events.
+
+        """
+        count = 0
+        write = self.write
+        for lineno, name, value in events:
+            write(lineno, name, value)
+            count += 1
+        return count
+
+
+class BinaryWriter(object):
+    """
+    Writer of events in compact binary format.
+
+    Events are encoded to buffer, which is written to stream when it
+    exceeds buffer_size and on flush().
+
+    Attributes:
+        buffer_size (int): Size of write buffer in bytes.
+        max_length (int): Number of characters of repr() of other values.
+
+    """
+    def __init__(self, stream, max_length=1000, buffer_size=2 ** 16):
+        """
+
+        Args:
+            stream: Binary file object.
+            max_length (int): Number of characters of repr() of values
+                of other types.
+            buffer_size (int): Size of write buffer in bytes.
+
+        """
+        self.max_length = max_length
+        self.buffer_size = buffer_size
+        self._stream = stream
+        self._names = {}
+        self._buffer = bytearray(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.flush()
+
+    def write(self, lineno, name, value):
+        """
+        Writes single event.
+
+        """
+        buffer = self._buffer
+        name_id = self._names.get(name)
+        if name_id is None:
+            name_id = self._names[name] = len(self._names)
+            if name is None:
+                buffer += NO_NAME
+            else:
+                buffer += NAME
+                _put_text(buffer, name)
+
+        kind = type(value)
+        if value is None:
+            buffer += NONE
+        elif kind is bool:
+            buffer += TRUE if value else FALSE
+        elif kind is int:
+            buffer += INT
+        elif kind is float:
+            buffer += FLOAT
+        elif kind is type(u''):
+            buffer += STR
+        elif kind is bytes:
+            buffer += BYTES
+        else:
+            buffer += REPR
+        _put_varint(buffer, lineno)
+        _put_varint(buffer, name_id)
+
+        if kind is int:
+            _put_varint(buffer, value << 1 if value >= 0 else
+                        (-value << 1) - 1)
+        elif kind is float:
+            buffer += _double.pack(value)
+        elif kind is type(u''):
+            _put_text(buffer, value)
+        elif kind is bytes:
+            _put_varint(buffer, len(value))
+            buffer += value
+        elif value is not None and kind is not bool:
+            _put_text(buffer, _type_name(value))
+            _put_text(buffer, _truncated_repr(value, self.max_length))
+
+        if len(buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_all(self, events):
+        """
+        Writes events and flushes buffer.
+
+        Args:
+            events (iterable): (line number, name, value) tuples.
+
+        Returns:
+            int: Number of written events.
+
+        """
+        count = 0
+        write = self.write
+        for lineno, name, value in events:
+            write(lineno, name, value)
+            count += 1
+        self.flush()
+        return count
+
+    def flush(self):
+        """
+        Writes buffered events to stream.
+
+        """
+        if self._buffer:
+            self._stream.write(bytes(self._buffer))
+            self._buffer = bytearray()
+
+
+def read_binary(stream, chunk_size=2 ** 16):
+    """
+    Reads events written by BinaryWriter.
+
+    Stream is read in chunks, so events are yielded before whole stream is
+    read.
+
+    Args:
+        stream: Binary file object.
+        chunk_size (int): Number of bytes read at once.
+
+    Yields:
+        (line number, name, value) tuples.
+
+    Raises:
+        ValueError: Stream is not in binary format or it is truncated.
+
+    """
+    data = bytearray(stream.read(len(MAGIC)))
+    if bytes(data) != MAGIC:
+        raise ValueError('not a livesource binary export')
+    names = []
+    data = bytearray()
+    position = 0
+    finished = False
+    while True:
+        try:
+            event, end = _decode(data, position, names)
+        except (IndexError, struct.error):
+            if finished:
+                raise ValueError('truncated livesource binary export')
+            chunk = stream.read(chunk_size)
+            finished = not chunk
+            data = data[position:] + bytearray(chunk)
+            position = 0
+            if finished and not data:
+                return
+            continue
+        position = end
+        if event is not None:
+            yield event
+
+
+def _decode(data, position, names):
+    """
+    Decodes record at position.
+
+    Returns:
+        tuple: Event (None for NAME and NO_NAME records) and position of
+        next record.
+
+    Raises:
+        IndexError: Record is incomplete.
+
+    """
+    tag = bytes(data[position:position + 1])
+    if not tag:
+        raise IndexError(position)
+    position += 1
+    if tag == NAME:
+        name, position = _get_text(data, position)
+        names.append(name)
+        return None, position
+    if tag == NO_NAME:
+        names.append(None)
+        return None, position
+    lineno, position = _get_varint(data, position)
+    name_id, position = _get_varint(data, position)
+    if tag == NONE:
+        value = None
+    elif tag == TRUE:
+        value = True
+    elif tag == FALSE:
+        value = False
+    elif tag == INT:
+        value, position = _get_varint(data, position)
+        value = -((value + 1) >> 1) if value & 1 else value >> 1
+    elif tag == FLOAT:
+        value, = _double.unpack(bytes(data[position:position + 8]))
+        position += 8
+    elif tag == STR:
+        value, position = _get_text(data, position)
+    elif tag == BYTES:
+        length, position = _get_varint(data, position)
+        if position + length > len(data):
+            raise IndexError(position)
+        value = bytes(data[position:position + length])
+        position += length
+    elif tag == REPR:
+        type_name, position = _get_text(data, position)
+        text, position = _get_text(data, position)
+        value = Summary(type_name, None, text)
+    else:
+        raise ValueError('unknown tag: {0!r}'.format(tag))
+    return (lineno, names[name_id], value), position
+
+
+def _type_name(value):
+    if type(value) is Summary:
+        return value.type_name
+    return type(value).__name__
+
+
+def _put_varint(buffer, number):
+    while number > 0x7f:
+        buffer.append(number & 0x7f | 0x80)
+        number >>= 7
+    buffer.append(number)
+
+
+def _get_varint(data, position):
+    number = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, position
+        shift += 7
+
+
+def _put_text(buffer, text):
+    encoded = text.encode('utf-8')
+    _put_varint(buffer, len(encoded))
+    buffer += encoded
+
+
+def _get_text(data, position):
+    length, position = _get_varint(data, position)
+    if position + length > len(data):
+        raise IndexError(position)
+    return bytes(data[position:position + length]).decode('utf-8'), \
+        position + length
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation of source code in processes forked from pre-initialized server.
+
+Fork server is a process which imports LiveSource and preloaded modules
+once, then forks new child for every evaluation. Child starts without
+interpreter start-up and imports, shares memory pages of server
+copy-on-write and exits after single evaluation, so evaluations do not
+see state of previous ones.
+
+Every evaluation connects to Unix socket of server::
+
+    client                  server                  child
+    connect, send job  ->   accept, receive job
+                            fork                ->  send pid
+    receive pid        <-----------------------------'
+                                                    evaluate
+    receive result     <-----------------------------'
+
+Client kills child when evaluation exceeds time limit or is cancelled.
+
+"""
+import collections
+import gc
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import traceback
+from multiprocessing.connection import Client, Listener
+try:
+    import resource
+except ImportError:  # not POSIX
+    resource = None
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2 without futures backport
+    ThreadPoolExecutor = None
+
+from .context import RunContext
+from .pool import EvaluationError, evaluate, profile, wait
+
+
+def serve(address, authkey, ready, memory_limit=None, preload=()):
+    """
+    Main loop of fork server.
+
+    Jobs are received by server, so shutdown request (None) does not need
+    a child. Failed import of preloaded modules is reported as error of
+    every job.
+
+    Args:
+        address (str): Path of Unix socket.
+        authkey (bytes): Authentication key of connections.
+        ready (multiprocessing.Connection): Receives None when server
+            listens.
+        memory_limit (int): Address space limit of every child in bytes.
+        preload (tuple): Names of modules imported by server.
+
+    """
+    error = None
+    try:
+        RunContext(preload).warm()
+    except Exception:
+        error = traceback.format_exc()
+    if hasattr(gc, 'freeze'):  # keep collector off pages shared with child
+        gc.collect()
+        gc.freeze()
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # children are reaped
+    listener = Listener(address, 'AF_UNIX', authkey=authkey)
+    ready.send(None)
+    ready.close()
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+                job = conn.recv()
+            except (EOFError, IOError, OSError,
+                    multiprocessing.AuthenticationError):
+                continue
+            except KeyboardInterrupt:
+                break
+            if job is None:
+                conn.close()
+                break
+            if error is not None:
+                conn.send(('error', error))
+                conn.close()
+                continue
+            if os.fork() == 0:
+                _child(conn, job, memory_limit)
+            conn.close()
+    finally:
+        listener.close()
+
+
+def _child(conn, job, memory_limit):
+    """
+    Evaluates job in forked child and exits.
+
+    """
+    status = 1
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        if memory_limit and resource is not None:
+            resource.setrlimit(resource.RLIMIT_AS,
+                               (memory_limit, memory_limit))
+        conn.send(('pid', os.getpid()))
+        try:
+            function, arguments = job
+            conn.send(('ok', function(*arguments)))
+        except (Exception, SystemExit):
+            conn.send(('error', traceback.format_exc()))
+        status = 0
+    finally:
+        os._exit(status)  # no cleanup of server state inherited by child
+
+
+class ForkServer(object):
+    """
+    Executor which evaluates every source code in new child of fork server.
+
+    Can be used instead of WorkerPool, e.g. as executor of LiveSource. Fork
+    server is started with the executor, its children are started on
+    demand.
+
+    Attributes:
+        address (str): Path of Unix socket of fork server.
+        memory_limit (int): Address space limit of child in bytes.
+        poll_interval (float): Seconds between checks of cancellation.
+        preload (tuple): Names of modules imported by fork server.
+        process (multiprocessing.Process): Fork server process.
+        processes (int): Maximal number of concurrent evaluations.
+        timeout (float): Time limit of single evaluation in seconds.
+
+    """
+    poll_interval = 0.05
+
+    def __init__(self, processes=None, timeout=None, memory_limit=None,
+                 preload=()):
+        """
+
+        Args:
+            processes (int): Maximal number of concurrent evaluations
+                (default: number of CPUs).
+            timeout (float): Time limit of single evaluation in seconds.
+            memory_limit (int): Address space limit of child in bytes.
+            preload (iterable): Names of modules imported once by fork
+                server and shared by all children, e.g. ['numpy'].
+
+        Raises:
+            NotImplementedError: Platform without fork().
+
+        """
+        if not hasattr(os, 'fork'):
+            raise NotImplementedError('fork server requires os.fork()')
+        self.processes = processes or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.preload = tuple(preload or ())
+        self._directory = tempfile.mkdtemp(prefix='livesource-')
+        self.address = os.path.join(self._directory, 'fork.sock')
+        self._authkey = os.urandom(16)
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(self.processes)
+        self._executor = None
+        self._closed = False
+
+        ready, child_ready = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(
+            target=serve, args=(self.address, self._authkey, child_ready,
+                                self.memory_limit, self.preload))
+        self.process.daemon = True
+        self.process.start()
+        child_ready.close()
+        try:
+            ready.recv()
+        except EOFError:
+            self.process.join()
+            shutil.rmtree(self._directory, ignore_errors=True)
+            raise EvaluationError('fork server died (exit code: {0})'
+                                  .format(self.process.exitcode))
+        finally:
+            ready.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def evaluate(self, code, max_deep=10, policy=None, selection=None,
+                 snapshots=None, backend='ast', cancelled=None):
+        """
+        Evaluates source code in new child of fork server.
+
+        Blocks until number of running evaluations drops under limit, so
+        many threads can share executor.
+
+        Args:
+            code (str): Source code.
+            max_deep (int): Number of cached values at one line.
+            policy: Capture policy of probes.
+            selection (dict): Arguments of LiveSource.select().
+            snapshots (Snapshots): Snapshot layer of recorded values.
+            backend (str): Recording backend, see LiveSource.
+            cancelled (threading.Event): Aborts evaluation when set.
+
+        Returns:
+            dict: Line number -> deque of (name, value) tuples.
+
+        Raises:
+            EvaluationTimeout: Time limit exceeded.
+            EvaluationCancelled: Evaluation was cancelled.
+            EvaluationError: Evaluation failed.
+
+        """
+        if self._closed:
+            raise ValueError('fork server is closed')
+        job = (evaluate, (code, max_deep, policy, selection, snapshots,
+                          backend))
+        with self._slots:
+            values = self._run(job, cancelled)
+        return dict((lineno, collections.deque(items, maxlen=max_deep))
+                    for lineno, items in values.items())
+
+    def profile(self, code, cancelled=None):
+        """
+        Profiles source code in new child of fork server.
+
+        Args:
+            code (str): Source code.
+            cancelled (threading.Event): Aborts evaluation when set.
+
+        Returns:
+            Profile: Line number -> (count, nanoseconds).
+
+        Raises:
+            EvaluationTimeout: Time limit exceeded.
+            EvaluationCancelled: Evaluation was cancelled.
+            EvaluationError: Evaluation failed.
+
+        """
+        if self._closed:
+            raise ValueError('fork server is closed')
+        with self._slots:
+            return self._run((profile, (code,)), cancelled)
+
+    def _run(self, job, cancelled):
+        """
+        Sends job to fork server and receives result from its child.
+
+        Returns:
+            Result of job.
+
+        """
+        pid = None
+        try:
+            conn = Client(self.address, 'AF_UNIX', authkey=self._authkey)
+        except (IOError, OSError):
+            raise EvaluationError('fork server is not running')
+        try:
+            conn.send(job)
+            status, payload = conn.recv()
+            if status == 'pid':
+                pid = payload
+                wait(conn, self.timeout, cancelled, self.poll_interval)
+                status, payload = conn.recv()
+                pid = None  # child exits after result
+        except (EOFError, IOError, OSError):
+            raise EvaluationError('evaluation process died')
+        finally:
+            if pid is not None:
+                self._kill(pid)
+            conn.close()
+        if status != 'ok':
+            raise EvaluationError(payload)
+        return payload
+
+    @staticmethod
+    def _kill(pid):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:  # already finished
+            pass
+
+    def submit(self, code, **options):
+        """
+        Schedules evaluation of source code.
+
+        Args:
+            code (str): Source code.
+            **options: Options of evaluate().
+
+        Returns:
+            concurrent.futures.Future: Result of evaluate().
+
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.processes)
+        return self._executor.submit(self.evaluate, code, **options)
+
+    def close(self):
+        """
+        Waits for scheduled evaluations and stops fork server.
+
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        try:
+            conn = Client(self.address, 'AF_UNIX', authkey=self._authkey)
+            conn.send(None)
+            conn.close()
+        except (IOError, OSError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        shutil.rmtree(self._directory, ignore_errors=True)
@@ -4,26 +4,123 @@ LiveSource.
 
 """
 import ast
+import bisect
+import collections
+import gc
+import sys
+import threading
+
+from .cache import CodeCache
+from .context import RunContext
+from .dataflow import Rerun
+from .pool import EvaluationCancelled
+from .profile import Profile, clock
+from .recorder import Aborted, Delta, Recorder
+from .statistics import ProbeStatistics
+from .stream import Stream
+from .trace import Tracer, bound_names
+
+#: local names of probe tables inside instrumented functions
+LOCAL_RECORD = '_livesource_r'
+LOCAL_GATE = '_livesource_g'
+
+#: statically nested blocks allowed in one function (CO_MAXBLOCKS)
+MAX_BLOCKS = 20
+
+#: statements compiled to one nested block
+_LOOPS = tuple(getattr(ast, name) for name in ('For', 'AsyncFor', 'While',
+                                               'With', 'AsyncWith')
+               if hasattr(ast, name))
+
+#: try statements (try/except/finally is compiled to up to three blocks)
+_TRIES = tuple(getattr(ast, name) for name in ('Try', 'TryStar', 'TryExcept',
+                                               'TryFinally')
+               if hasattr(ast, name))
+
+#: nodes with statement list in their body
+_CLAUSES = tuple(getattr(ast, name) for name in ('excepthandler',
+                                                 'match_case')
+                 if hasattr(ast, name))
 
 
 class LiveSource(object):
     """
 
     Attributes:
+        backend (str): 'ast' (instrumentation of source code) or 'trace'
+            (tracing of execution).
+        cache (CodeCache): Compiled code shared between instances.
         code (str): Source code.
+        context (RunContext): Namespaces of runs and preloaded modules.
+        disk_cache (DiskCache): Optional persistent cache of compiled code.
+        executor (WorkerPool): Evaluates code outside of current process.
         lst (int): LiveSource ast tree.
+        max_deep (int): Number of cached values at one line.
+        partial (bool): Re-executes only statements affected by update.
+        policy: Capture policy of probes.
+        snapshots (Snapshots): Snapshot layer of recorded values.
+        statistics (bool): Collects statistics of probes, see
+            get_statistics().
 
     """
-    def __init__(self, code, max_deep=10):
+    BACKENDS = ('ast', 'trace')
+    cache = CodeCache()
+    disk_cache = None
+
+    def __init__(self, code, max_deep=10, policy=None, executor=None,
+                 snapshots=None, backend='ast', partial=False,
+                 statistics=False, context=None):
         """
 
         Args:
             code (str): Source code.
             max_deep (int): Number of cached values at one line.
+            policy: Capture policy of probes, e.g. Every(100). Records
+                every value by default.
+            executor (WorkerPool): Evaluates code in worker processes
+                instead of current process.
+            snapshots (Snapshots): Stores size-bounded copies of values
+                instead of references.
+            backend (str): 'ast' instruments source code, 'trace' records
+                changed variables of executed lines with sys.monitoring
+                or sys.settrace() (see Tracer), without capture policy.
+            partial (bool): Executes top-level statements one by one and
+                after update re-executes only statements affected by the
+                change (see dataflow.Rerun). Used by 'ast' backend in
+                current process.
+            statistics (bool): Counts hits and measures recording time of
+                every probe. Used by 'ast' backend in current process.
+            context (RunContext): Creates fresh namespace of every run in
+                current process and preloads modules, can be shared by
+                many instances. Partial run keeps namespace of unchanged
+                statements.
+
+        Raises:
+            ValueError: Unknown backend.
 
         """
+        if backend not in self.BACKENDS:
+            raise ValueError('unknown backend: {0}'.format(backend))
+        self.backend = backend
         self.code = code
+        self.max_deep = max_deep
+        self.policy = policy
+        self.executor = executor
+        self.snapshots = snapshots
+        self.partial = partial
+        self.statistics = statistics
+        self.context = context if context is not None else RunContext()
         self.lst = LSTree(max_deep)
+        self._rerun = None  # statements of previous partial run
+        self._tree = None  # instrumented module of self.code
+        self._chunks = []  # (first line, instrumented nodes) of statements
+        self._lock = threading.RLock()  # guards code and cached tree
+        self._cancelled = threading.Event()
+        self._generation = 0  # number of updates
+        self._evaluation = None  # asynchronous evaluation in progress
+        self._listing = (0, {})  # generation and lines of get_changes()
+        self._statistics = None  # ProbeStatistics of previous run
+        self._profile = None  # Profile of run in progress
 
     def get_values(self):
         """
@@ -32,13 +129,378 @@ class LiveSource(object):
         Returns:
             Mapping type object.
 
+        Raises:
+            EvaluationCancelled: Evaluation was aborted by cancel().
+
+        """
+        self._cancelled.clear()
+        self._statistics = None
+        if self.executor is not None:
+            return self.executor.evaluate(self.code, self.max_deep,
+                                          self.policy, self._selection(),
+                                          self.snapshots, self.backend,
+                                          cancelled=self._cancelled)
+        if self.backend == 'trace':
+            return self._trace()
+        if self.partial:
+            return self._run_partial()
+
+        compiled_code, probes, batches = self._compile()
+        self._rerun = None  # buffers of previous run are not kept
+        recorder = self._start(probes, batches)
+        if self._cancelled.is_set():  # cancelled before start
+            recorder.abort()
+        try:
+            # FIXME: exceptions handling
+            self._measure(exec, compiled_code,
+                          self.context.namespace(self.lst.globals))
+        except Aborted:
+            raise EvaluationCancelled('evaluation cancelled')
+
+        return recorder.listing()
+
+    def _run_partial(self):
+        """
+        Executes statements affected by changes since previous run.
+
+        Returns:
+            Listing: Values of executed statements and kept values of
+            skipped ones.
+
         """
+        self.context.warm()
+        with self._lock:
+            self._prepare_tree()
+            if self._tree is None:
+                self._parse()
+            probes = tuple(self.lst.probes)
+            batches = dict(self.lst.batches)
+            if self._rerun is None:
+                self._rerun = Rerun(self.lst)
+            recorder = self.lst.recorder
+            plan = self._rerun.plan(list(self._chunks), recorder.listing())
+        self._start(probes, batches)
+        if self._cancelled.is_set():  # cancelled before start
+            recorder.abort()
+        try:
+            self._measure(self._rerun.execute, plan, recorder)
+        except Aborted:
+            raise EvaluationCancelled('evaluation cancelled')
+        return recorder.listing()
 
-        # FIXME: exceptions handling
-        compiled_code = compile(self._parse(), '<livesource>', 'exec')
-        exec(compiled_code, self.lst.globals, self.lst.locals)
+    def _start(self, probes, batches, sink=None):
+        """
+        Prepares recorder for new run.
+
+        Args:
+            probes (tuple): Probes of executed code.
+            batches (dict): Batched probes of executed code.
+            sink (callable): Receiver of events in streaming mode.
 
-        return self.lst.locals['__livesource_listing']
+        Returns:
+            Recorder
+
+        """
+        recorder = self.lst.recorder
+        recorder.policy = self.policy
+        recorder.snapshots = self.snapshots
+        recorder.statistics = None
+        if self.statistics:
+            recorder.statistics = ProbeStatistics(probes, batches)
+        self._statistics = recorder.statistics
+        recorder.start(probes, sink, batches)
+        return recorder
+
+    def _measure(self, run, *args):
+        """
+        Calls run of code, measured when statistics are collected.
+
+        """
+        statistics = self.lst.recorder.statistics
+        if statistics is None:
+            return run(*args)
+        return statistics.measure(run, *args)
+
+    def get_statistics(self):
+        """
+        Returns statistics of probes of previous run in current process.
+
+        Skipped statements of partial run are not counted.
+
+        Returns:
+            ProbeStatistics: Hits and recording time of every probe, None
+            when statistics are not collected.
+
+        """
+        return self._statistics
+
+    def get_changes(self, since=None):
+        """
+        Evaluates code and returns lines changed since previous result.
+
+        Every result of get_changes() has generation number. Client which
+        keeps result of other generation than `since` gets all lines.
+
+        Args:
+            since (int): Generation of listing known to client, defaults
+                to the previous result of get_changes().
+
+        Returns:
+            Delta: Changed, added and removed lines.
+
+        Raises:
+            EvaluationCancelled: Evaluation was aborted by cancel().
+
+        """
+        values = self.get_values()
+        current = dict((lineno, tuple(values[lineno])) for lineno in values)
+        with self._lock:
+            generation, previous = self._listing
+            if since is not None and since != generation:
+                generation, previous = 0, {}
+            self._listing = (self._listing[0] + 1, current)
+            return Delta.between(previous, current, self._listing[0],
+                                 generation)
+
+    def get_profile(self):
+        """
+        Runs code as line profiler.
+
+        Code is instrumented in profile mode of LSTree, which counts
+        executions and measures time of lines instead of recording values.
+        Code is executed in fresh namespace (by executor, when it is set).
+
+        Returns:
+            Profile: Line number -> (count, nanoseconds).
+
+        Raises:
+            EvaluationCancelled: Evaluation was aborted by cancel().
+
+        """
+        self._cancelled.clear()
+        if self.executor is not None:
+            return self.executor.profile(self.code, cancelled=self._cancelled)
+        key = self.cache.key(self.code, 'profile')
+        compiled_code = self.cache.get(key)
+        if compiled_code is None:
+            lst = LSTree()
+            lst.profiled = True
+            tree = lst.visit(ast.parse(self.code))
+            compiled_code = compile(tree, '<livesource>', 'exec')
+            self.cache.set(key, compiled_code)
+
+        self.context.warm()
+        profile = Profile(self.code.count('\n') + 2)
+        namespace = profile.namespace()
+        self._profile = profile
+        if self._cancelled.is_set():  # cancelled before start
+            profile.abort()
+        start = clock()
+        try:
+            exec(compiled_code, namespace)
+        except Aborted:
+            raise EvaluationCancelled('evaluation cancelled')
+        finally:
+            profile.run_time = clock() - start
+            self._profile = None
+        return profile
+
+    def _trace(self):
+        """
+        Returns values recorded by Tracer.
+
+        Returns:
+            dict: Line number -> deque of (name, value) tuples.
+
+        """
+        key = self.cache.key(self.code, 'trace')
+        cached = self.cache.get(key)
+        if cached is None:
+            compiled_code = compile(self.code, '<livesource>', 'exec')
+            cached = (compiled_code, bound_names(compiled_code))
+            self.cache.set(key, cached)
+        compiled_code, stores = cached
+
+        def watched(lineno, name):
+            return self.lst._watched('Name', lineno, name)
+
+        capture = None
+        if self.snapshots is not None:
+            capture = self.snapshots.capturer()
+
+        tracer = Tracer(self.max_deep,
+                        watched if self._selection() is not None else None,
+                        capture, self._cancelled)
+        try:
+            return tracer.run(compiled_code, self.context.namespace({}),
+                              stores)
+        except Aborted:
+            raise EvaluationCancelled('evaluation cancelled')
+
+    def get_values_async(self):
+        """
+        Asynchronous version of get_values(), see aio.get_values().
+
+        Evaluation in current process is superseded by update() only at
+        its next probe (see cancel()), so loop without probes, e.g. body
+        of ``while True: pass`` or loop excluded by select(), keeps its
+        thread busy until it ends. Use executor (WorkerPool) for code
+        which may not end.
+
+        Returns:
+            Coroutine of mapping type object.
+
+        """
+        from .aio import get_values
+        return get_values(self)
+
+    def stream(self, maxsize=1024, overflow='block'):
+        """
+        Evaluates code in background thread and streams recorded values.
+
+        Values are passed to consumer instead of being stored, so memory
+        usage does not grow with length of run. Capture policy still
+        decides which values are recorded.
+
+        Args:
+            maxsize (int): Maximal number of queued events.
+            overflow (str): Policy of full queue: 'block', 'drop' or
+                'drop_oldest', see Stream.
+
+        Returns:
+            Stream: Iterator of (line number, name, value) events.
+
+        Raises:
+            NotImplementedError: Code is evaluated by executor or traced.
+
+        """
+        if self.executor is not None:
+            raise NotImplementedError('streaming from worker processes')
+        if self.backend != 'ast':
+            raise NotImplementedError('streaming from traced code')
+        stream = Stream(maxsize, overflow)
+        compiled_code, probes, batches = self._compile()
+        self._rerun = None  # buffers of previous run are not kept
+        self._start(probes, batches, sink=stream.put)
+        self._cancelled.clear()
+
+        thread = threading.Thread(target=self._run_stream,
+                                  args=(compiled_code, stream))
+        thread.daemon = True
+        thread.start()
+        return stream
+
+    def _run_stream(self, compiled_code, stream):
+        """
+        Executes code with probes connected to stream.
+
+        Args:
+            compiled_code: Instrumented code object.
+            stream (Stream): Receiver of recorded values.
+
+        """
+        error = None
+        try:
+            namespace = self.context.namespace(self.lst.globals)
+            self._measure(exec, compiled_code, namespace)
+        except Aborted:
+            if self._cancelled.is_set():
+                error = EvaluationCancelled('evaluation cancelled')
+        except Exception as err:
+            error = err
+        stream.finish(error)
+
+    def cancel(self):
+        """
+        Aborts evaluation running in other thread.
+
+        Code executed in current process is stopped at its next probe,
+        loop without probes (e.g. excluded by select()) runs until it ends.
+        Worker process of executor is stopped whatever code does.
+
+        """
+        self._cancelled.set()
+        self.lst.recorder.abort()
+        profile = self._profile
+        if profile is not None:
+            profile.abort()
+
+    def _compile(self):
+        """
+        Returns compiled code with its probes, from cache when possible.
+
+        Returns:
+            (code object, probes, batches) tuple.
+
+        """
+        with self._lock:
+            return self._compile_unlocked()
+
+    def _prepare_tree(self):
+        """
+        Drops cached tree when capture policy was switched on or off.
+
+        """
+        gated = self.policy is not None
+        if self.lst.gated != gated:
+            self.lst.gated = gated
+            self._tree = None
+
+    def _compile_unlocked(self):
+        self._prepare_tree()
+        key = self.cache.key(self.code, self.max_deep, self.lst.gated,
+                             self.lst.lines,
+                             self.lst.names and sorted(self.lst.names),
+                             self.lst.kinds and sorted(self.lst.kinds))
+        cached = self.cache.get(key)
+        if cached is None and self.disk_cache is not None:
+            cached = self.disk_cache.get(key)
+            if cached is not None:
+                self.cache.set(key, cached)
+        if cached is None:
+            tree = self._tree if self._tree is not None else self._parse()
+            cached = (compile(tree, '<livesource>', 'exec'),
+                      tuple(self.lst.probes), dict(self.lst.batches))
+            self.cache.set(key, cached)
+            if self.disk_cache is not None:
+                self.disk_cache.set(key, cached)
+        return cached
+
+    def select(self, lines=None, names=None, kinds=None):
+        """
+        Restrict instrumentation, e.g. to lines visible in editor.
+
+        Every argument set to None means no restriction.
+
+        Args:
+            lines (list): Instrumented (first, last) line ranges.
+            names (list): Instrumented variable names. Attributes are
+                matched by full name (a.x.y) or by base name (a).
+            kinds (list): Instrumented ast node classes: 'Attribute',
+                'Compare', 'If', 'Name', 'Print', 'While', 'arg' (function
+                arguments), 'comprehension' (loop variables of
+                comprehensions).
+
+        """
+        with self._lock:
+            self.lst.lines = None if lines is None else tuple(
+                (first, last) for first, last in sorted(lines))
+            self.lst.names = None if names is None else frozenset(names)
+            self.lst.kinds = None if kinds is None else frozenset(kinds)
+            self._tree = None
+
+    def _selection(self):
+        """
+        Returns:
+            dict: Arguments of select() or None.
+
+        """
+        selection = dict(lines=self.lst.lines,
+                         names=self.lst.names,
+                         kinds=self.lst.kinds)
+        if all(value is None for value in selection.values()):
+            return None
+        return selection
 
     def set_variable(self, lineno, var, val):
         """
@@ -56,11 +518,26 @@ class LiveSource(object):
         """
         Update source code.
 
+        Only top-level statements touched by the change are parsed and
+        instrumented again, the rest is reused from the cached tree.
+
+        Asynchronous evaluation of previous code is cancelled.
+
         Args:
             code (str): New source code.
 
         """
-        self.code = code
+        with self._lock:
+            if self._tree is not None:
+                try:
+                    self._splice(code)
+                except Exception:
+                    # full parse in get_values() will report the error
+                    self._tree = None
+            self.code = code
+            self._generation += 1
+        if self._evaluation is not None and not self._evaluation.done():
+            self.cancel()
 
     def _parse(self):
         """
@@ -71,78 +548,283 @@ class LiveSource(object):
 
         """
         tree = ast.parse(self.code)
+        statements = list(tree.body)
         self.lst.stack = []  # clear stack (needed?)
+        self.lst.probes = []
+        self.lst.batches = {}
+        self.lst.released = 0
         parsed_tree = self.lst.visit(tree)
-        ast.fix_missing_locations(parsed_tree)
+
+        self._chunks = self._split(statements, parsed_tree.body)
+        self._tree = parsed_tree
         return parsed_tree
 
+    def _splice(self, code):
+        """
+        Replace changed statements of cached tree.
+
+        Args:
+            code (str): New source code.
+
+        Raises:
+            SyntaxError: Changed statements cannot be parsed alone.
+
+        """
+        old_lines = self.code.split('\n')
+        new_lines = code.split('\n')
+        limit = min(len(old_lines), len(new_lines))
+
+        head = 0  # unchanged lines at the beginning
+        while head < limit and old_lines[head] == new_lines[head]:
+            head += 1
+        if head == len(old_lines) == len(new_lines):
+            return
+        if self.lst.lines is not None and len(old_lines) != len(new_lines):
+            # selected lines would not move together with code
+            self._tree = None
+            return
+        tail = 0  # unchanged lines at the end
+        while (tail < limit - head and
+               old_lines[-1 - tail] == new_lines[-1 - tail]):
+            tail += 1
+        offset = len(new_lines) - len(old_lines)
+
+        # chunk spans from its first line to the first line of next chunk
+        starts = [start for start, _ in self._chunks]
+        first = max(bisect.bisect_right(starts, head + 1) - 1, 0)
+        last = max(bisect.bisect_right(starts, len(old_lines) - tail) - 1,
+                   first)
+        begin = starts[first] if first else 1
+        if last + 1 < len(starts):
+            end = starts[last + 1] - 1 + offset
+        else:
+            end = len(new_lines)
+
+        tree = ast.parse('\n'.join(new_lines[begin - 1:end]))
+        ast.increment_lineno(tree, begin - 1)
+        statements = list(tree.body)
+        self.lst.stack = []
+        parsed_tree = self.lst.visit(tree)
+
+        for _, nodes in self._chunks[first:last + 1]:
+            self.lst.release(nodes)
+        following = self._chunks[last + 1:]
+        if offset:
+            for _, nodes in following:
+                self.lst.shift(nodes, offset)
+            following = [(start + offset, nodes)
+                         for start, nodes in following]
+        self._chunks = (self._chunks[:first] +
+                        self._split(statements, parsed_tree.body) +
+                        following)
+        self._tree = ast.Module(body=[node
+                                      for _, nodes in self._chunks
+                                      for node in nodes],
+                                type_ignores=[])
+        if self.lst.released * 2 > len(self.lst.probes):
+            # probe ids of previous partial run are not valid anymore
+            self.lst.compact(self._tree.body)
+            self._rerun = None
+
+    @staticmethod
+    def _split(statements, body):
+        """
+        Group instrumented nodes by top-level statements.
+
+        Statements which share first line are grouped together.
+
+        Args:
+            statements (list): Top-level statements before instrumentation.
+            body (list): Instrumented module body.
+
+        Returns:
+            List of (first line, nodes) tuples.
+
+        """
+        lines = {}
+        for stmt in statements:
+            decorators = getattr(stmt, 'decorator_list', [])
+            lines[id(stmt)] = min([stmt.lineno] +
+                                  [dec.lineno for dec in decorators])
+        starts = sorted(set(lines.values()))
+
+        chunks = [(start, []) for start in starts]
+        index = 0
+        for node in body:
+            line = lines.get(id(node))
+            if line is not None:  # listeners follow their statement
+                index = bisect.bisect_left(starts, line)
+            chunks[index][1].append(node)
+        return chunks
+
+
+class _CollectorPause(object):
+    """
+    Pauses cyclic garbage collector. Its full collections traverse whole
+    growing tree, so instrumentation time would grow faster than size of
+    module. Instrumentation does not create reference cycles.
+
+    Collector is process-wide, so pauses are counted: threads instrumenting
+    at once share one pause, collector is resumed by the last of them and
+    only if it was enabled when the first one started.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._count = 0
+        self._enabled = False
+
+    def __enter__(self):
+        with self._lock:
+            if not self._count:
+                self._enabled = gc.isenabled()
+                gc.disable()
+            self._count += 1
+
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self._count -= 1
+            if not self._count and self._enabled:
+                gc.enable()
+
+
+_collector_paused = _CollectorPause()
+
 
 class LSTree(ast.NodeVisitor):
     """
 
     Attributes:
-        globals (dict): Globals for LSTree.
-        locals (dict): Locals for LSTree.
-        stack (list): Stack used by tree visitors.
+        batches (dict): First probe id of batch -> ids of all probes
+            recorded by one call (see block_visit()).
+        framed (bool): Emit probes of function body, which record values
+            with id of function call.
+        globals (dict): Probe tables, copied to fresh namespace of every
+            run (see RunContext). Namespace of partial run.
+        gated (bool): Emit probes enabled by _livesource_gate.
+        kinds (frozenset): Instrumented node classes (e.g. 'Name'), None
+            for all.
+        lines (tuple): Instrumented (first, last) line ranges, None for all.
+        names (frozenset): Instrumented variable names, None for all.
+        probes (list): (line number, name, framed) of every emitted probe.
+        profiled (bool): Profile mode, statements are wrapped in timers
+            instead of recording values (see profile.Profile).
+        recorder (Recorder): Storage of recorded values.
+        released (int): Number of released probes (None in probes).
+        stack (list): Listeners of visited statements, emitted by
+            block_visit() after them.
 
     """
     def __init__(self, max_deep=10):
         """
-        __livesource_listing = collections.defaultdict(
-            lambda: collections.deque(maxlen=max_deep))
+        _livesource_record = Recorder(max_deep).record
 
         Args:
             max_deep (int): Number of cached values at one line.
 
         """
-        # NOTE: __livesource_listing is definied inside locals to speedup
-        #       name searching
-        self.globals = {}
-        self.locals = {
-            '__livesource_listing': __import__('collections').defaultdict(
-                lambda: __import__('collections').deque(maxlen=max_deep))}
+        # NOTE: code is executed in single namespace, so functions can see
+        #       module-level names as well as probe tables
+        self.recorder = Recorder(max_deep)
+        self.globals = {'_livesource_calls': self.recorder.calls,
+                        '_livesource_gate': self.recorder.gate,
+                        '_livesource_record': self.recorder.record}
+        self.batches = {}
+        self.framed = False
+        self.gated = False
+        self.kinds = None
+        self.lines = None
+        self.names = None
+        self.probes = []
+        self.profiled = False
+        self.released = 0
         self.stack = []
 
     #
     #  Tree visitors
     #
 
-    def field_visit(self, field):
+    def block_visit(self, statements):
         """
-        Visit nodes in field.
+        Visit block of statements.
 
-        Args:
-            Field (obj or list): ast node field.
-
-        """
-        if not isinstance(field, list):
-            field = [field]
-        self.generic_visit(ast.Expression(body=field))
+        Tree is instrumented in single pass: visitors of statement push
+        its listeners to stack, which are emitted right after the statement
+        (before return statement), so block is built in order. Listeners
+        of one line are batched into single recording call.
 
-    def block_visit(self, fields):
-        """
-        Visit nodes in fields.
+        Args:
+            statements (list): Statements of block.
 
         Returns:
-            Sequence of fields sorted by line number.
+            list: Instrumented statements.
 
         """
-        old_stack = self.stack
-        self.stack = []
-        self.field_visit(fields)
-        if old_stack:
-            old_stack.append(self.stack)
-            self.stack = old_stack
+        stack = self.stack
+        block = []
+        append = block.append
+        for statement in statements:
+            first = len(stack)
+            self.visit(statement)
+            if len(stack) == first:
+                append(statement)
+                continue
+            listeners = self._batched(stack[first:])
+            del stack[first:]
+            if isinstance(statement, ast.Return):
+                block.extend(listeners)
+                append(statement)
+            else:
+                append(statement)
+                block.extend(listeners)
+        return block
+
+    def _batched(self, listeners):
+        """
+        Coalesces consecutive listeners of the same line into one
+        recording call, which stores tuple of their values at once.
 
-        fields.extend(self.stack)
+        Names of batched probes are kept in probe table, `batches` maps
+        the first probe id of batch to ids of all its probes.
 
-        try:
-            sorted_args = sorted(fields,
-                                 key=lambda obj: (obj.lineno, obj.col_offset))
-        except AttributeError:  # no obj attributes
-            sorted_args = []
+        Args:
+            listeners (list): Listeners of one statement.
+
+        Returns:
+            list: Listeners.
 
-        return sorted_args
+        """
+        if len(listeners) < 2:
+            return listeners
+        probes = self.probes
+        runs = []  # [lineno, listeners, probe ids, values]
+        for listener in listeners:
+            call = listener.value
+            if isinstance(call, ast.BoolOp):  # gated
+                call = call.values[1]
+            probe_id = self._probe_id(call.func)
+            lineno, _, framed = probes[probe_id]
+            value = call.args[0]
+            if framed:
+                value = value.elts[1]
+            if runs and runs[-1][0] == lineno:
+                runs[-1][1].append(listener)
+                runs[-1][2].append(probe_id)
+                runs[-1][3].append(value)
+            else:
+                runs.append([lineno, [listener], [probe_id], [value]])
+
+        batched = []
+        for lineno, group, probe_ids, values in runs:
+            if len(group) == 1:
+                batched.append(group[0])
+                continue
+            self.batches[probe_ids[0]] = tuple(probe_ids)
+            batched.append(ast.copy_location(
+                ast.Expr(value=self._recording(probe_ids[0], values,
+                                               lineno)),
+                group[0]))
+        return batched
 
     #
     #  Modules
@@ -150,13 +832,15 @@ class LSTree(ast.NodeVisitor):
 
     def visit_Expression(self, node):
         """
-        Used when code is compiled by eval().
+        Used when code is compiled by eval(), expression has no place for
+        listeners, only loop variables of comprehensions are recorded.
 
         Args:
             node (ast.AST): ast node.
 
         """
-        return ast.Expression(body=self.block_visit(node.body))
+        self._comprehensions_visit(node.body)
+        return ast.Expression(body=node.body)
 
     def visit_Interactive(self, node):
         """
@@ -166,7 +850,10 @@ class LSTree(ast.NodeVisitor):
             node (ast.AST): ast node.
 
         """
-        return ast.Interactive(body=self.block_visit(node.body))
+        with _collector_paused:
+            if self.profiled:
+                return ast.Interactive(body=self._timed_block(node.body))
+            return ast.Interactive(body=self.block_visit(node.body))
 
     def visit_Module(self, node):
         """
@@ -176,12 +863,30 @@ class LSTree(ast.NodeVisitor):
             node (ast.AST): ast node.
 
         """
-        return ast.Module(body=self.block_visit(node.body))
+        with _collector_paused:
+            if self.profiled:
+                return ast.Module(body=self._timed_block(node.body),
+                                  type_ignores=[])
+            return ast.Module(body=self.block_visit(node.body),
+                              type_ignores=[])
 
     #
     #  Statements
     #
 
+    def visit_AnnAssign(self, node):
+        """
+        Annotated assignment statement.
+
+        Args:
+            node (ast.AST): ast node.
+
+        """
+        if node.value is not None:  # annotation only does not bind name
+            self.visit(node.target)
+            self._comprehensions_visit(node.value)
+        return node
+
     def visit_Assign(self, node):
         """
         Assignment statement.
@@ -190,7 +895,9 @@ class LSTree(ast.NodeVisitor):
             node (ast.AST): ast node.
 
         """
-        self.field_visit(node.targets)
+        for target in node.targets:
+            self.visit(target)
+        self._comprehensions_visit(node.value)
         return node
 
     def visit_AugAssign(self, node):
@@ -201,9 +908,109 @@ class LSTree(ast.NodeVisitor):
             node (ast.AST): ast node.
 
         """
-        self.field_visit(node.target)
+        self.visit(node.target)
+        self._comprehensions_visit(node.value)
         return node
 
+    def visit_ClassDef(self, node):
+        """
+        Class definition.
+
+        Args:
+            node (ast.AST): ast node.
+
+        """
+        node.body = self.block_visit(node.body)
+        return node
+
+    def visit_Delete(self, node):
+        """
+        Delete statement, deleted names have no values.
+
+        Args:
+            node (ast.AST): ast node.
+
+        """
+        return node
+
+    def visit_For(self, node):
+        """
+        For loop.
+
+        Loop variables are recorded at the beginning of every iteration.
+
+        Args:
+            node (ast.AST): ast node.
+
+        """
+        listeners = self._target_visit(node.target)
+        node.body = listeners + self.block_visit(node.body)
+        if node.orelse:
+            node.orelse = self.block_visit(node.orelse)
+        return node
+
+    visit_AsyncFor = visit_For
+
+    def visit_FunctionDef(self, node):
+        """
+        Function definition.
+
+        Every call gets new id from _livesource_calls, which is stored in
+        local variable of function and recorded together with values.
+        Arguments are recorded at the beginning of call.
+
+        Probe tables are bound to local variables at the beginning of call
+        (`_livesource_r = _livesource_record`), so probes of function body
+        load them as fast locals (or closure cells) instead of globals.
+        Tables are changed in place, so aborted run stops at next probe.
+
+        Args:
+            node (ast.AST): ast node.
+
+        """
+        framed, self.framed = self.framed, True
+        try:
+            first_probe = len(self.probes)
+            docstring = ast.get_docstring(node, clean=False) is not None
+            prologue = []
+            for name in self._arg_names(node.args):
+                if self._watched('arg', node.lineno, name):
+                    value = ast.Name(id=name, ctx=ast.Load(),
+                                     **self._location(node.lineno))
+                    prologue.append(self._add_listener(node.lineno, name,
+                                                       value))
+            prologue = self._batched(prologue)
+            body = self.block_visit(node.body)
+        finally:
+            self.framed = framed
+
+        if len(self.probes) > first_probe:
+            # _livesource_call = _livesource_calls()
+            location = self._location(node.lineno)
+            call_id = ast.Assign(
+                targets=[ast.Name(id='_livesource_call', ctx=ast.Store(),
+                                  **location)],
+                value=ast.Call(func=ast.Name(id='_livesource_calls',
+                                             ctx=ast.Load(),
+                                             **location),
+                               args=[],
+                               keywords=[],
+                               starargs=None,
+                               kwargs=None,
+                               **location),
+                **location)
+            tables = [self._alias(LOCAL_RECORD, '_livesource_record',
+                                  location)]
+            if self.gated:
+                tables.append(self._alias(LOCAL_GATE, '_livesource_gate',
+                                          location))
+            head = body[:1] if docstring else []
+            body = head + [call_id] + tables + prologue + body[len(head):]
+        node.body = body
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
     def visit_If(self, node):
         """
         Conditional statement.
@@ -213,15 +1020,30 @@ class LSTree(ast.NodeVisitor):
 
         """
         node.body = self.block_visit(node.body)
+        if node.orelse:
+            node.orelse = self.block_visit(node.orelse)
 
         lineno = node.lineno
-        name = ast.Name(id='None', ctx=ast.Load())  # no name
+        name = None
         value = node.test  # boolean
 
-        body = [self._add_listener(lineno, name, value)]
-        body.extend(node.body)
-        node.body = body
+        if self._watched('If', lineno, name):
+            body = [self._add_listener(lineno, name, value)]
+            body.extend(node.body)
+            node.body = body
+
+        return node
+
+    def visit_Match(self, node):
+        """
+        Match statement.
 
+        Args:
+            node (ast.AST): ast node.
+
+        """
+        for case in node.cases:
+            case.body = self.block_visit(case.body)
         return node
 
     def visit_Print(self, node):
@@ -236,7 +1058,7 @@ class LSTree(ast.NodeVisitor):
 
         """
         lineno = node.lineno
-        name = ast.Name(id='None', ctx=ast.Load())  # no name
+        name = None
         value = ast.Call(func=ast.Attribute(value=ast.Str(s=' '),
                                             attr='join',
                                             ctx=ast.Load()),
@@ -246,7 +1068,8 @@ class LSTree(ast.NodeVisitor):
                          starargs=None,
                          kwargs=None)
 
-        self.stack.append(self._add_listener(lineno, name, value))
+        if self._watched('Print', lineno, name):
+            self.stack.append(self._add_listener(lineno, name, value))
 
         return node
 
@@ -254,13 +1077,48 @@ class LSTree(ast.NodeVisitor):
         """
         Return statement.
 
+        Values are recorded before function returns.
+
         Args:
             node (ast.AST): ast node.
 
         """
-        self.field_visit(node.value)
+        first = len(self.stack)
+        if node.value is not None:
+            self.visit(node.value)
+        for listener in self.stack[first:]:
+            listener.lineno = node.lineno
         return node
 
+    def visit_Try(self, node):
+        """
+        Try statement.
+
+        Name of caught exception is recorded at the beginning of handler.
+
+        Args:
+            node (ast.AST): ast node.
+
+        """
+        node.body = self.block_visit(node.body)
+        for handler in getattr(node, 'handlers', []):
+            listeners = []
+            if isinstance(handler.name, ast.AST):  # Python 2
+                listeners = self._target_visit(handler.name)
+            elif (handler.name is not None and
+                  self._watched('Name', handler.lineno, handler.name)):
+                value = ast.Name(id=handler.name, ctx=ast.Load(),
+                                 **self._location(handler.lineno))
+                listeners = [self._add_listener(handler.lineno,
+                                                handler.name, value)]
+            handler.body = listeners + self.block_visit(handler.body)
+        for field in ('orelse', 'finalbody'):
+            if getattr(node, field, None):
+                setattr(node, field, self.block_visit(getattr(node, field)))
+        return node
+
+    visit_TryExcept = visit_TryFinally = visit_TryStar = visit_Try
+
     def visit_While(self, node):
         """
         While loop.
@@ -269,18 +1127,40 @@ class LSTree(ast.NodeVisitor):
             node (ast.AST): ast node.
 
         """
-        self.block_visit(node.body)
+        node.body = self.block_visit(node.body)
+        if node.orelse:
+            node.orelse = self.block_visit(node.orelse)
 
         lineno = node.lineno
-        name = ast.Name(id='None', ctx=ast.Load())
+        name = None
         value = node.test
 
-        body = [self._add_listener(lineno, name, value)]
-        body.extend(node.body)
-        node.body = body
+        if self._watched('While', lineno, name):
+            body = [self._add_listener(lineno, name, value)]
+            body.extend(node.body)
+            node.body = body
+
+        return node
 
+    def visit_With(self, node):
+        """
+        With statement.
+
+        Targets of context managers are recorded at the beginning of body.
+
+        Args:
+            node (ast.AST): ast node.
+
+        """
+        listeners = []
+        for item in getattr(node, 'items', [node]):  # single item in Py2
+            if item.optional_vars is not None:
+                listeners.extend(self._target_visit(item.optional_vars))
+        node.body = listeners + self.block_visit(node.body)
         return node
 
+    visit_AsyncWith = visit_With
+
     #
     # Expressions
     #
@@ -298,20 +1178,52 @@ class LSTree(ast.NodeVisitor):
         while isinstance(attr_obj.value, ast.Attribute):  # nested attributes
             attr_obj = attr_obj.value
             name = '{0}.{1}'.format(attr_obj.attr, name)
-        else:
-            name = ast.Str(s='{0}.{1}'.format(attr_obj.value.id, name))
+        if not isinstance(attr_obj.value, ast.Name):
+            # attribute of other expression, e.g. f().x, has no name
+            self.generic_visit(attr_obj)
+            return node
+        name = '{0}.{1}'.format(attr_obj.value.id, name)
 
         lineno = node.lineno
         value = ast.Attribute(value=node.value,
                               attr=node.attr,
                               ctx=ast.Load(),
                               lineno=lineno,
-                              col_offset=node.col_offset)
+                              col_offset=node.col_offset,
+                              end_lineno=getattr(node, 'end_lineno', None),
+                              end_col_offset=getattr(node, 'end_col_offset',
+                                                     None))
 
-        self.stack.append(self._add_listener(lineno, name, value))
+        if self._watched('Attribute', lineno, name):
+            self.stack.append(self._add_listener(lineno, name, value))
 
         return node
 
+    def visit_ListComp(self, node):
+        """
+        Comprehension (also set, dict comprehension and generator
+        expression).
+
+        Args:
+            node (ast.AST): ast node.
+
+        """
+        self._comprehensions_visit(node)
+        return node
+
+    visit_DictComp = visit_GeneratorExp = visit_SetComp = visit_ListComp
+
+    def visit_Lambda(self, node):
+        """
+        Lambda expression, its arguments are not visible outside.
+
+        Args:
+            node (ast.AST): ast node.
+
+        """
+        self._comprehensions_visit(node.body)
+        return node
+
     def visit_Compare(self, node):
         """
         Compare expression.
@@ -321,10 +1233,11 @@ class LSTree(ast.NodeVisitor):
 
         """
         lineno = node.lineno
-        name = ast.Name(id='None', ctx=ast.Load())
+        name = None
         value = node
 
-        self.stack.append(self._add_listener(lineno, name, value))
+        if self._watched('Compare', lineno, name):
+            self.stack.append(self._add_listener(lineno, name, value))
 
         return node
 
@@ -337,48 +1250,624 @@ class LSTree(ast.NodeVisitor):
 
         """
         lineno = node.lineno
-        name = ast.Str(s=node.id)
+        name = node.id
         value = ast.Name(id=node.id,
                          ctx=ast.Load(),
                          lineno=lineno,
-                         col_offset=node.col_offset)
+                         col_offset=node.col_offset,
+                         end_lineno=getattr(node, 'end_lineno', None),
+                         end_col_offset=getattr(node, 'end_col_offset', None))
 
-        self.stack.append(self._add_listener(lineno, name, value))
+        if self._watched('Name', lineno, name):
+            self.stack.append(self._add_listener(lineno, name, value))
 
         return node
 
+    #
+    # Profile mode
+    #
+
+    def _timed_block(self, statements, depth=0, parent=None, blocks=0):
+        """
+        Wraps statements in timers of their lines.
+
+        Every timer stores its start in own variable (_livesource_t<depth>),
+        so timers of nested blocks do not overwrite it. Statements at line
+        of compound statement (e.g. `if x: y = 1`) are measured by its
+        timer. Timer (try/finally) is a nested block, statement which would
+        exceed MAX_BLOCKS with its own nested blocks is measured by timers
+        of outer lines only.
+
+        Args:
+            statements (list): Block of statements.
+            depth (int): Nesting level of block inside of function or
+                module.
+            parent (int): Line of compound statement containing block.
+            blocks (int): Nested blocks containing block.
+
+        Returns:
+            list: Instrumented statements.
+
+        """
+        block = []
+        group = []  # consecutive statements of one line
+        for index, statement in enumerate(statements):
+            timed = (statement.lineno != parent and
+                     self._timed(statement, index) and
+                     blocks + 1 + self._nesting(statement) <= MAX_BLOCKS)
+            self._timed_children(statement, depth, blocks + timed)
+            if not timed:
+                block.extend(self._timer(group, depth))
+                block.append(statement)
+                group = []
+            elif group and group[0].lineno != statement.lineno:
+                block.extend(self._timer(group, depth))
+                group = [statement]
+            else:
+                group.append(statement)
+        block.extend(self._timer(group, depth))
+        return block
+
+    def _timed_children(self, statement, depth, blocks=0):
+        """
+        Wraps statements of nested blocks in timers.
+
+        Args:
+            statement (ast.AST): Statement.
+            depth (int): Nesting level of statement, None inside of class
+                body (its namespace would keep variables of timers).
+            blocks (int): Nested blocks containing statement.
+
+        """
+        if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            statement.body = self._timed_block(statement.body)
+            return
+        if isinstance(statement, ast.ClassDef):
+            depth = None
+        blocks += self._cost(statement)
+        for node, field in self._blocks(statement):
+            block = getattr(node, field)
+            if depth is None:
+                for child in block:
+                    self._timed_children(child, None)
+            else:
+                setattr(node, field, self._timed_block(block, depth + 1,
+                                                       statement.lineno,
+                                                       blocks))
+
     @staticmethod
-    def _add_listener(lineno, var_name, val):
+    def _blocks(statement):
         """
-        Assigns watched variable with __livesource_listing.
+        Yields (node, field) of statement lists nested in statement,
+        including bodies of exception handlers and match cases.
+
+        """
+        for field, value in ast.iter_fields(statement):
+            if not isinstance(value, list) or not value:
+                continue
+            if isinstance(value[0], ast.stmt):
+                yield statement, field
+            elif isinstance(value[0], _CLAUSES):
+                for node in value:
+                    yield node, 'body'
+
+    @staticmethod
+    def _cost(statement):
+        """
+        Returns:
+            int: Nested blocks around statements nested in statement.
+
+        """
+        if isinstance(statement, _LOOPS):
+            return 1
+        if isinstance(statement, _TRIES):
+            return (2 if getattr(statement, 'handlers', None) else 0) + \
+                (1 if getattr(statement, 'finalbody', None) else 0)
+        return 0
+
+    def _nesting(self, statement):
+        """
+        Returns:
+            int: Nested blocks of statement in its function, without
+            timers.
+
+        """
+        if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef,
+                                  ast.ClassDef)):
+            return 0
+        nested = [self._nesting(child)
+                  for node, field in self._blocks(statement)
+                  for child in getattr(node, field)]
+        if not nested:
+            return 0
+        return self._cost(statement) + max(nested)
+
+    @staticmethod
+    def _timed(statement, index):
+        """
+        Returns:
+            bool: Statement can be wrapped in timer. Declarations, future
+            imports and docstrings must stay in place.
+
+        """
+        if isinstance(statement, (ast.Global, ast.Nonlocal)):
+            return False
+        if isinstance(statement, ast.ImportFrom):
+            return statement.module != '__future__'
+        if index == 0 and isinstance(statement, ast.Expr):
+            value = statement.value
+            return not isinstance(getattr(value, 'value', getattr(
+                value, 's', None)), str)
+        return True
+
+    def _timer(self, group, depth):
+        """
+        Wraps statements of one line in timer.
+
+        Args:
+            group (list): Statements, may be empty.
+            depth (int): Nesting level of statements.
+
+        Returns:
+            list: Instrumented statements.
+
+        """
+        if not group:
+            return []
+        lineno = group[0].lineno
+        start = '_livesource_t{0}'.format(depth)
+        location = self._location(lineno)
+
+        def now():
+            # _livesource_clock()
+            return ast.Call(func=ast.Name(id='_livesource_clock',
+                                          ctx=ast.Load(),
+                                          **location),
+                            args=[],
+                            keywords=[],
+                            starargs=None,
+                            kwargs=None,
+                            **location)
+
+        def counter(name):
+            # name[lineno]
+            return ast.Subscript(value=ast.Name(id=name, ctx=ast.Load(),
+                                                **location),
+                                 slice=self._index(lineno, location),
+                                 ctx=ast.Store(),
+                                 **location)
+
+        # start = _livesource_clock()
+        started = ast.Assign(
+            targets=[ast.Name(id=start, ctx=ast.Store(), **location)],
+            value=now(),
+            **location)
+        # _livesource_times[lineno] += _livesource_clock() - start
+        timed = ast.AugAssign(
+            target=counter('_livesource_times'),
+            op=ast.Add(),
+            value=ast.BinOp(left=now(),
+                            op=ast.Sub(),
+                            right=ast.Name(id=start, ctx=ast.Load(),
+                                           **location),
+                            **location),
+            **location)
+        # _livesource_counts[lineno] += 1
+        counted = ast.AugAssign(target=counter('_livesource_counts'),
+                                op=ast.Add(),
+                                value=self._number(1, location),
+                                **location)
+        location['end_lineno'] = getattr(group[-1], 'end_lineno', lineno)
+        return [started, ast.Try(body=group,
+                                 handlers=[],
+                                 orelse=[],
+                                 finalbody=[timed, counted],
+                                 **location)]
+
+    def _comprehensions_visit(self, node):
+        """
+        Records loop variables of comprehensions in expression.
+
+        Values are recorded by extra condition of every generator, which
+        is always true: `if _livesource_record[probe_id](x) or True`.
+
+        Args:
+            node (ast.AST): Expression.
+
+        """
+        if node is None:
+            return
+        for expr in self._expressions(node):
+            for generator in getattr(expr, 'generators', ()):
+                for target in ast.walk(generator.target):
+                    if not isinstance(target, ast.Name):
+                        continue
+                    lineno = target.lineno
+                    if not self._watched('comprehension', lineno, target.id):
+                        continue
+                    location = self._location(lineno)
+                    value = ast.Name(id=target.id, ctx=ast.Load(),
+                                     **location)
+                    generator.ifs.append(ast.BoolOp(
+                        op=ast.Or(),
+                        values=[self._probe(lineno, target.id, value),
+                                self._true(location)],
+                        **location))
+
+    @staticmethod
+    def _expressions(node):
+        """
+        Yields nodes of expression in order of ast.walk(), without
+        contexts of names, so only subexpressions are visited.
+
+        Args:
+            node (ast.AST): Expression.
+
+        """
+        AST = ast.AST
+        context = ast.expr_context
+        queue = collections.deque([node])
+        pop, append = queue.popleft, queue.append
+        while queue:
+            node = pop()
+            yield node
+            for field in node._fields:
+                value = getattr(node, field, None)
+                if type(value) is list:
+                    for item in value:
+                        if isinstance(item, AST):
+                            append(item)
+                elif isinstance(value, AST) and not isinstance(value,
+                                                               context):
+                    append(value)
+
+    def _target_visit(self, target):
+        """
+        Visit assignment target outside of statement.
+
+        Args:
+            target (ast.AST): Target of for loop, with statement etc.
+
+        Returns:
+            List of listeners.
+
+        """
+        stack = self.stack
+        first = len(stack)
+        self.visit(target)
+        listeners = self._batched(stack[first:])
+        del stack[first:]
+        return listeners
+
+    @staticmethod
+    def _arg_names(args):
+        """
+        Returns:
+            List of argument names of function.
+
+        """
+        names = []
+        for arg in (getattr(args, 'posonlyargs', []) + args.args +
+                    getattr(args, 'kwonlyargs', [])):
+            names.append(getattr(arg, 'arg', None) or getattr(arg, 'id', None))
+        for arg in (args.vararg, args.kwarg):
+            if arg is not None:
+                names.append(getattr(arg, 'arg', arg))
+        return [name for name in names if isinstance(name, str)]
+
+    @staticmethod
+    def _location(lineno):
+        """
+        Returns:
+            dict: Location attributes of new node at the beginning of line.
+
+        """
+        return {'lineno': lineno, 'col_offset': 0,
+                'end_lineno': lineno, 'end_col_offset': 0}
+
+    @staticmethod
+    def _alias(local, name, location):
+        """
+        Args:
+            local (str): Name of local variable.
+            name (str): Name of global variable.
+            location (dict): Location of node.
+
+        Returns:
+            ast node of assignment of global to local variable.
+
+        """
+        return ast.Assign(targets=[ast.Name(id=local, ctx=ast.Store(),
+                                            **location)],
+                          value=ast.Name(id=name, ctx=ast.Load(), **location),
+                          **location)
+
+    @staticmethod
+    def _true(location):
+        """
+        Args:
+            location (dict): Location of node.
+
+        Returns:
+            ast node of True constant.
+
+        """
+        if hasattr(ast, 'Constant'):
+            return ast.Constant(value=True, **location)
+        return ast.Name(id='True', ctx=ast.Load(), **location)
+
+    @staticmethod
+    def _number(n, location):
+        """
+        Args:
+            n (int): Value of constant.
+            location (dict): Location of node.
+
+        Returns:
+            ast node of number constant.
+
+        """
+        if hasattr(ast, 'Constant'):
+            return ast.Constant(value=n, **location)
+        return ast.Num(n=n, **location)
+
+    @classmethod
+    def _index(cls, n, location):
+        """
+        Args:
+            n (int): Value of constant.
+            location (dict): Location of node.
+
+        Returns:
+            ast node of subscript index with number constant.
+
+        """
+        number = cls._number(n, location)
+        if sys.version_info < (3, 9):
+            return ast.Index(value=number)
+        return number
+
+    def _watched(self, kind, lineno, name):
+        """
+        Checks if probe is selected for instrumentation.
+
+        Args:
+            kind (str): Name of instrumented ast node class.
+            lineno (int): Line number of watched value.
+            name (str): Watched variable name or None.
+
+        Returns:
+            bool
+
+        """
+        if self.kinds is not None and kind not in self.kinds:
+            return False
+        if self.names is not None and (name is None or (
+                name not in self.names and
+                name.split('.', 1)[0] not in self.names)):
+            return False
+        if self.lines is not None and not any(first <= lineno <= last
+                                              for first, last in self.lines):
+            return False
+        return True
+
+    def shift(self, nodes, offset):
+        """
+        Move instrumented nodes to other lines.
+
+        Args:
+            nodes (list): Instrumented ast nodes.
+            offset (int): Number of lines.
+
+        """
+        for node in self._walk(nodes):
+            if 'lineno' in node._attributes and hasattr(node, 'lineno'):
+                node.lineno += offset
+                if getattr(node, 'end_lineno', None) is not None:
+                    node.end_lineno += offset
+            for probe_id in self._members(self._probe_id(node)):
+                lineno, name, framed = self.probes[probe_id]
+                self.probes[probe_id] = (lineno + offset, name, framed)
+
+    def probe_ids(self, nodes):
+        """
+        Finds probes of instrumented nodes.
+
+        Args:
+            nodes (list): Instrumented ast nodes.
+
+        Returns:
+            list: Probe ids.
+
+        """
+        return [probe_id for node in self._walk(nodes)
+                for probe_id in self._members(self._probe_id(node))]
+
+    def release(self, nodes):
+        """
+        Forget probes of removed nodes.
+
+        Args:
+            nodes (list): Instrumented ast nodes.
+
+        """
+        for node in self._walk(nodes):
+            probe_id = self._probe_id(node)
+            for member in self._members(probe_id):
+                if self.probes[member] is not None:
+                    self.probes[member] = None
+                    self.released += 1
+            self.batches.pop(probe_id, None)
+
+    def compact(self, nodes):
+        """
+        Renumbers probes to remove released ones from probe table.
+
+        Probe ids change, so values recorded before compaction do not
+        belong to the same probes.
+
+        Args:
+            nodes (list): All instrumented ast nodes of code.
+
+        """
+        ids = {}  # old probe id -> new probe id
+        probes = []
+        for probe_id, probe in enumerate(self.probes):
+            if probe is not None:
+                ids[probe_id] = len(probes)
+                probes.append(probe)
+        for node in self._walk(nodes):
+            if (isinstance(node, ast.Subscript) and
+                    isinstance(node.value, ast.Name) and
+                    node.value.id in ('_livesource_record', LOCAL_RECORD,
+                                      '_livesource_gate', LOCAL_GATE)):
+                index = node.slice
+                if isinstance(index, ast.Index):  # Python < 3.9
+                    index = index.value
+                if hasattr(ast, 'Constant') and isinstance(index,
+                                                           ast.Constant):
+                    index.value = ids[index.value]
+                else:
+                    index.n = ids[index.n]
+        self.batches = dict(
+            (ids[probe_id], tuple(ids[member] for member in members))
+            for probe_id, members in self.batches.items())
+        self.probes = probes
+        self.released = 0
+
+    @staticmethod
+    def _walk(nodes):
+        """
+        Yields every node once (listeners share nodes with instrumented code).
+
+        Args:
+            nodes (list): ast nodes.
+
+        """
+        seen = set()
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            if id(node) not in seen:
+                seen.add(id(node))
+                yield node
+                stack.extend(ast.iter_child_nodes(node))
+
+    def _members(self, probe_id):
+        """
+        Returns:
+            tuple: Ids of probes recorded by call of probe id (single probe
+            or batch), empty for None.
+
+        """
+        if probe_id is None:
+            return ()
+        return self.batches.get(probe_id, (probe_id,))
+
+    @staticmethod
+    def _probe_id(node):
+        """
+        Returns:
+            Probe id (the first probe of batch) used by node or None.
+
+        """
+        if (isinstance(node, ast.Subscript) and
+                isinstance(node.value, ast.Name) and
+                node.value.id in ('_livesource_record', LOCAL_RECORD)):
+            index = node.slice
+            if isinstance(index, ast.Index):  # Python < 3.9
+                index = index.value
+            return getattr(index, 'value', getattr(index, 'n', None))
+        return None
+
+    def _add_listener(self, lineno, var_name, val):
+        """
+        Assigns watched variable with _livesource_record.
 
         Args:
             lineno (int): Line number of watched variable in source code.
-            var_name (str): Watched variable name.
+            var_name (str): Watched variable name or None.
             val (ast.expr): Value of watched variable.
 
         Returns:
             ast node.
 
         """
-        # FIXME: change data structure to fix
-        #        multiple inline variable assignment
-
-        # __livesource_listing[lineno].append(var_name, val, )
-        return ast.Expr(
-            value=ast.Call(
-                func=ast.Attribute(
-                    value=ast.Subscript(
-                        value=ast.Name(id='__livesource_listing',
-                                       ctx=ast.Load()),
-                        slice=ast.Index(value=ast.Num(n=lineno)),
-                        ctx=ast.Load()),
-                    attr='append',
-                    ctx=ast.Load()),
-                args=[ast.Tuple(elts=[var_name, val, ],
-                                ctx=ast.Load()), ],
+        return ast.Expr(value=self._probe(lineno, var_name, val),
+                        **self._location(lineno + 1))
+
+    def _probe(self, lineno, var_name, val):
+        """
+        Records watched variable with _livesource_record.
+
+        Inside functions value is recorded as (call id, value) tuple.
+
+        Args:
+            lineno (int): Line number of watched variable in source code.
+            var_name (str): Watched variable name or None.
+            val (ast.expr): Value of watched variable.
+
+        Returns:
+            ast expression.
+
+        """
+        probe_id = len(self.probes)
+        self.probes.append((lineno, var_name, self.framed))
+        return self._recording(probe_id, [val], lineno)
+
+    def _recording(self, probe_id, values, lineno):
+        """
+        Builds call of recording callable of probe or batch.
+
+        Single value is passed as it is, values of batch as one tuple,
+        inside functions prefixed by call id and with local probe tables.
+
+        Args:
+            probe_id (int): Probe id (the first probe of batch).
+            values (list): Watched values (ast.expr).
+            lineno (int): Line number of watched values.
+
+        Returns:
+            ast expression.
+
+        """
+        location = self._location(lineno)
+        record, gate = '_livesource_record', '_livesource_gate'
+        if self.framed:
+            record, gate = LOCAL_RECORD, LOCAL_GATE
+            values = [ast.Name(id='_livesource_call', ctx=ast.Load(),
+                               **location)] + values
+        if len(values) == 1:
+            val = values[0]
+        else:
+            # (_livesource_call, val, ...)
+            val = ast.Tuple(elts=values, ctx=ast.Load(), **location)
+
+        # _livesource_record[probe_id](val)
+        value = ast.Call(
+            func=ast.Subscript(
+                value=ast.Name(id=record, ctx=ast.Load(), **location),
+                slice=self._index(probe_id, location),
+                ctx=ast.Load(),
+                **location),
+            args=[val],
+            keywords=[],
+            starargs=None,
+            kwargs=None,
+            **location)
+        if self.gated:
+            # _livesource_gate[probe_id]() and ...
+            gate = ast.Call(
+                func=ast.Subscript(
+                    value=ast.Name(id=gate, ctx=ast.Load(), **location),
+                    slice=self._index(probe_id, location),
+                    ctx=ast.Load(),
+                    **location),
+                args=[],
                 keywords=[],
                 starargs=None,
-                kwargs=None),
-            lineno=lineno + 1,
-            col_offset=-1)
+                kwargs=None,
+                **location)
+            value = ast.BoolOp(op=ast.And(), values=[gate, value],
+                               **location)
+        return value
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation of source code in pool of worker processes.
+
+"""
+import collections
+import multiprocessing
+import pickle
+import threading
+import time
+import traceback
+try:
+    import resource
+except ImportError:  # not POSIX
+    resource = None
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2 without futures backport
+    ThreadPoolExecutor = None
+
+from .context import RunContext
+
+
+class EvaluationError(Exception):
+    """
+    Evaluation of source code failed.
+
+    """
+
+
+class EvaluationCancelled(EvaluationError):
+    """
+    Evaluation of source code was cancelled.
+
+    """
+
+
+class EvaluationTimeout(EvaluationError):
+    """
+    Evaluation of source code exceeded time limit.
+
+    """
+
+
+#: values sent to parent process without checks
+PLAIN_TYPES = (bool, int, float, complex, str, bytes, type(None))
+
+
+def portable(listing):
+    """
+    Converts listing to picklable dict.
+
+    Values which cannot be pickled are replaced by their repr().
+
+    Args:
+        listing (Mapping): Recorded values.
+
+    Returns:
+        dict: Line number -> list of (name, value) tuples.
+
+    """
+    result = {}
+    for lineno, values in listing.items():
+        items = []
+        for name, value in values:
+            if not isinstance(value, PLAIN_TYPES):
+                try:
+                    pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                except Exception:
+                    value = repr(value)
+            items.append((name, value))
+        result[lineno] = items
+    return result
+
+
+def evaluate(code, max_deep=10, policy=None, selection=None, snapshots=None,
+             backend='ast'):
+    """
+    Evaluates source code in current process.
+
+    Args:
+        code (str): Source code.
+        max_deep (int): Number of cached values at one line.
+        policy: Capture policy of probes.
+        selection (dict): Arguments of LiveSource.select().
+        snapshots (Snapshots): Snapshot layer of recorded values.
+        backend (str): Recording backend, see LiveSource.
+
+    Returns:
+        dict: Picklable listing.
+
+    """
+    from .livesource import LiveSource
+    source = LiveSource(code, max_deep, policy, snapshots=snapshots,
+                        backend=backend)
+    if selection:
+        source.select(**selection)
+    return portable(source.get_values())
+
+
+def profile(code):
+    """
+    Profiles source code in current process.
+
+    Args:
+        code (str): Source code.
+
+    Returns:
+        Profile: Line number -> (count, nanoseconds).
+
+    """
+    from .livesource import LiveSource
+    return LiveSource(code).get_profile()
+
+
+def wait(conn, timeout=None, cancelled=None, poll_interval=0.05):
+    """
+    Waits for message from evaluating process.
+
+    Args:
+        conn (multiprocessing.Connection): Connection with process.
+        timeout (float): Time limit in seconds.
+        cancelled (threading.Event): Aborts waiting when set.
+        poll_interval (float): Seconds between checks of cancellation.
+
+    Raises:
+        EvaluationTimeout: Time limit exceeded.
+        EvaluationCancelled: Evaluation was cancelled.
+
+    """
+    if cancelled is None:
+        if not conn.poll(timeout):
+            raise EvaluationTimeout(
+                'evaluation exceeded {0} s'.format(timeout))
+        return
+
+    deadline = None if timeout is None else time.time() + timeout
+    while not conn.poll(poll_interval):
+        if cancelled.is_set():
+            raise EvaluationCancelled('evaluation cancelled')
+        if deadline is not None and time.time() > deadline:
+            raise EvaluationTimeout(
+                'evaluation exceeded {0} s'.format(timeout))
+
+
+def serve(conn, memory_limit=None, preload=()):
+    """
+    Main loop of worker process.
+
+    Preloaded modules are imported before the first job, failed import is
+    reported as error of every job.
+
+    Args:
+        conn (multiprocessing.Connection): Connection with parent.
+        memory_limit (int): Address space limit in bytes.
+        preload (tuple): Names of modules imported by worker at start.
+
+    """
+    if memory_limit and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    error = None
+    try:
+        RunContext(preload).warm()
+    except Exception:
+        error = traceback.format_exc()
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if job is None:
+            break
+        if error is not None:
+            conn.send(('error', error))
+            continue
+        try:
+            function, arguments = job
+            conn.send(('ok', function(*arguments)))
+        except (Exception, SystemExit):
+            conn.send(('error', traceback.format_exc()))
+
+
+class Worker(object):
+    """
+    Reusable worker process.
+
+    Attributes:
+        poll_interval (float): Seconds between checks of cancellation.
+        process (multiprocessing.Process): Worker process.
+        stopped (bool): Worker process was stopped (or it died).
+
+    """
+    poll_interval = 0.05
+
+    def __init__(self, memory_limit=None, preload=()):
+        """
+
+        Args:
+            memory_limit (int): Address space limit in bytes.
+            preload (tuple): Names of modules imported by worker at start.
+
+        """
+        self._conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=serve,
+                                               args=(child_conn,
+                                                     memory_limit,
+                                                     preload))
+        self.process.daemon = True
+        self.process.start()
+        self.stopped = False
+        child_conn.close()
+
+    def evaluate(self, job, timeout=None, cancelled=None):
+        """
+        Evaluates job in worker process.
+
+        Args:
+            job (tuple): Function (evaluate() or profile()) and its
+                arguments.
+            timeout (float): Time limit in seconds.
+            cancelled (threading.Event): Aborts evaluation when set.
+
+        Returns:
+            dict: Picklable listing.
+
+        Raises:
+            EvaluationTimeout: Time limit exceeded.
+            EvaluationCancelled: Evaluation was cancelled.
+            EvaluationError: Evaluation failed or worker died.
+
+        """
+        try:
+            self._conn.send(job)
+            self._wait(timeout, cancelled)
+            status, payload = self._conn.recv()
+        except (EOFError, IOError, OSError):
+            # dead process is alive until it is reaped
+            self.stop()
+            raise EvaluationError('worker process died (exit code: {0})'
+                                  .format(self.process.exitcode))
+        if status != 'ok':
+            raise EvaluationError(payload)
+        return payload
+
+    def _wait(self, timeout, cancelled):
+        """
+        Waits for result of evaluation.
+
+        """
+        wait(self._conn, timeout, cancelled, self.poll_interval)
+
+    def stop(self):
+        """
+        Stops worker process.
+
+        """
+        self.stopped = True
+        try:
+            self._conn.send(None)
+        except (IOError, OSError):
+            pass
+        self._conn.close()
+        self.process.join(0.1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+
+class WorkerPool(object):
+    """
+    Pool of reusable worker processes.
+
+    Workers are started on demand. Worker which exceeds time limit or dies
+    is replaced by new one.
+
+    Attributes:
+        processes (int): Maximal number of worker processes.
+        timeout (float): Time limit of single evaluation in seconds.
+        memory_limit (int): Address space limit of worker in bytes.
+        preload (tuple): Names of modules imported by every worker at
+            start, so evaluations do not pay for their import.
+
+    """
+    def __init__(self, processes=None, timeout=None, memory_limit=None,
+                 preload=()):
+        """
+
+        Args:
+            processes (int): Maximal number of worker processes (default:
+                number of CPUs).
+            timeout (float): Time limit of single evaluation in seconds.
+            memory_limit (int): Address space limit of worker in bytes
+                (POSIX only).
+            preload (iterable): Names of modules imported by every worker
+                at start, e.g. ['numpy'].
+
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.preload = tuple(preload or ())
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(self.processes)
+        self._executor = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def evaluate(self, code, max_deep=10, policy=None, selection=None,
+                 snapshots=None, backend='ast', cancelled=None):
+        """
+        Evaluates source code in worker process.
+
+        Blocks until worker is available, so many threads can share pool.
+
+        Args:
+            code (str): Source code.
+            max_deep (int): Number of cached values at one line.
+            policy: Capture policy of probes.
+            selection (dict): Arguments of LiveSource.select().
+            snapshots (Snapshots): Snapshot layer of recorded values.
+            backend (str): Recording backend, see LiveSource.
+            cancelled (threading.Event): Aborts evaluation when set.
+
+        Returns:
+            dict: Line number -> deque of (name, value) tuples.
+
+        Raises:
+            EvaluationTimeout: Time limit exceeded.
+            EvaluationCancelled: Evaluation was cancelled.
+            EvaluationError: Evaluation failed.
+
+        """
+        values = self._run((evaluate, (code, max_deep, policy, selection,
+                                       snapshots, backend)), cancelled)
+        return dict((lineno, collections.deque(items, maxlen=max_deep))
+                    for lineno, items in values.items())
+
+    def profile(self, code, cancelled=None):
+        """
+        Profiles source code in worker process.
+
+        Args:
+            code (str): Source code.
+            cancelled (threading.Event): Aborts evaluation when set.
+
+        Returns:
+            Profile: Line number -> (count, nanoseconds).
+
+        Raises:
+            EvaluationTimeout: Time limit exceeded.
+            EvaluationCancelled: Evaluation was cancelled.
+            EvaluationError: Evaluation failed.
+
+        """
+        return self._run((profile, (code,)), cancelled)
+
+    def _run(self, job, cancelled):
+        """
+        Runs job in idle (or new) worker.
+
+        Returns:
+            Result of job.
+
+        """
+        worker = self._acquire()
+        try:
+            return worker.evaluate(job, self.timeout, cancelled)
+        except (EvaluationTimeout, EvaluationCancelled):
+            worker.stop()
+            worker = None
+            raise
+        except EvaluationError:
+            if worker.stopped:
+                worker = None
+            raise
+        finally:
+            self._release(worker)
+
+    def submit(self, code, **options):
+        """
+        Schedules evaluation of source code.
+
+        Args:
+            code (str): Source code.
+            **options: Options of evaluate().
+
+        Returns:
+            concurrent.futures.Future: Result of evaluate().
+
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.processes)
+        return self._executor.submit(self.evaluate, code, **options)
+
+    def close(self):
+        """
+        Stops all workers.
+
+        """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for worker in idle:
+            worker.stop()
+
+    def _acquire(self):
+        if self._closed:
+            raise ValueError('pool is closed')
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return Worker(self.memory_limit, self.preload)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, worker):
+        if worker is not None:
+            with self._lock:
+                if self._closed:
+                    worker.stop()
+                else:
+                    self._idle.append(worker)
+        self._slots.release()
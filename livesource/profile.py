@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Execution counts and timing of lines.
+
+In profile mode LSTree wraps every statement in timer instead of recording
+values::
+
+    _livesource_t0 = _livesource_clock()
+    try:
+        statement
+    finally:
+        _livesource_times[lineno] += _livesource_clock() - _livesource_t0
+        _livesource_counts[lineno] += 1
+
+Counts and nanoseconds are aggregated in preallocated lists indexed by line
+number instead of records of every executed statement (lists are faster
+than array.array, which boxes item on every access).
+
+"""
+import time
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+from .recorder import Aborted
+
+
+def _nanoseconds():
+    return int(getattr(time, 'perf_counter', time.time)() * 1e9)
+
+
+#: monotonic clock in nanoseconds
+clock = getattr(time, 'perf_counter_ns', _nanoseconds)
+
+
+class Profile(Mapping):
+    """
+    Execution counts and time of lines of one run.
+
+    Maps line numbers of executed lines to (count, nanoseconds) tuples.
+    Time of line includes time of functions called by it, time of compound
+    statement (loop, if, with, ...) includes its body. Statements of class
+    bodies are not measured separately.
+
+    Attributes:
+        counts (list): Executions of statements at line, indexed by line
+            number.
+        run_time (int): Nanoseconds of whole run.
+        times (list): Nanoseconds spent at line, indexed by line number.
+
+    """
+    def __init__(self, size):
+        """
+
+        Args:
+            size (int): Number of lines of code + 1.
+
+        """
+        self.counts = [0] * size
+        self.times = [0] * size
+        self.run_time = 0
+        self._namespace = None
+
+    def namespace(self):
+        """
+        Returns:
+            dict: Namespace of profiled code with counters and clock.
+
+        """
+        self._namespace = {'_livesource_clock': clock,
+                           '_livesource_counts': self.counts,
+                           '_livesource_times': self.times}
+        return self._namespace
+
+    def abort(self):
+        """
+        Makes timers of profiled code raise Aborted.
+
+        """
+        def aborted():
+            raise Aborted()
+        if self._namespace is not None:
+            self._namespace['_livesource_clock'] = aborted
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_namespace'] = None  # namespace of finished run
+        return state
+
+    def hottest(self, number=10):
+        """
+        Returns:
+            list: (line number, count, nanoseconds) tuples of lines with
+            the longest time.
+
+        """
+        lines = [(lineno,) + self[lineno] for lineno in self]
+        lines.sort(key=lambda line: -line[2])
+        return lines[:number]
+
+    def __getitem__(self, lineno):
+        if not 0 <= lineno < len(self.counts) or not self.counts[lineno]:
+            raise KeyError(lineno)
+        return (self.counts[lineno], self.times[lineno])
+
+    def __iter__(self):
+        counts = self.counts
+        return (lineno for lineno in range(len(counts)) if counts[lineno])
+
+    def __len__(self):
+        return sum(1 for count in self.counts if count)
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(type(self).__name__, dict(self.items()))
@@ -0,0 +1,595 @@
+# -*- coding: utf-8 -*-
+"""
+Storage of values recorded by instrumented code.
+
+"""
+import collections
+import functools
+import itertools
+import time
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+from .snapshot import sizes
+
+
+class Aborted(BaseException):
+    """
+    Raised by probes of aborted run.
+
+    It does not inherit from Exception, so it is not caught by handlers in
+    instrumented code.
+
+    """
+
+
+class Recorder(object):
+    """
+    Ring buffers of recorded values.
+
+    Every probe emitted by LSTree has an id, which indexes `record` list.
+    Probes are called with watched value only, so values are stored without
+    any intermediate objects in deque (ring buffer) of probe line. Lines
+    watched by many probes store (probe id, value) tuples instead.
+
+    With capture policy, probes are gated: value is evaluated and recorded
+    only when `gate` callable of probe returns true.
+
+    In streaming mode values are not stored at all, every probe passes
+    (line number, name, value) event to sink instead.
+
+    With snapshot layer, values are converted to size-bounded snapshots
+    before they are stored or streamed.
+
+    With statistics, gates and recording callables are wrapped in timers
+    which count hits of probes (see ProbeStatistics).
+
+    Probes inside functions (framed probes) record (call id, value) tuples,
+    where call id comes from `calls` at the beginning of every call.
+
+    Batch of probes of one line is a single probe which records tuple of
+    values of all its probes at once (prefixed by call id in functions),
+    names are looked up in probe table only when values are read.
+
+    Attributes:
+        batches (dict): First probe id of batch -> ids of all its probes.
+        calls (callable): Returns id of new function call.
+        gate (list): Gate callables indexed by probe id.
+        max_deep (int): Number of cached values at one line.
+        policy: Capture policy (Every, Backoff, TimeBudget) or None to
+            record every value.
+        probes (tuple): (line number, name, framed) of every probe id, None
+            for removed probes.
+        record (list): Recording callables indexed by probe id.
+        snapshots (Snapshots): Snapshot layer or None to store references
+            to values.
+        statistics (ProbeStatistics): Statistics of current run or None.
+
+    """
+    def __init__(self, max_deep=10, policy=None, snapshots=None):
+        """
+
+        Args:
+            max_deep (int): Number of cached values at one line.
+            policy: Capture policy.
+            snapshots (Snapshots): Snapshot layer.
+
+        """
+        self.max_deep = max_deep
+        self.policy = policy
+        self.snapshots = snapshots
+        self.statistics = None
+        self.probes = ()
+        self.batches = {}
+        self.calls = functools.partial(next, itertools.count())
+        self.gate = []
+        self.record = []
+        self._buffers = {}
+        self._single = {}  # probe ids of lines watched by single probe
+
+    def start(self, probes, sink=None, batches=None):
+        """
+        Prepares empty buffers for new run.
+
+        Args:
+            probes (tuple): (line number, name, framed) of every probe id.
+            sink (callable): Receiver of (line number, name, value) events
+                in streaming mode, e.g. Stream.put.
+            batches (dict): First probe id of batch -> ids of all its
+                probes.
+
+        """
+        batches = batches or {}
+        batched = set(probe_id for members in batches.values()
+                      for probe_id in members[1:])
+        counts = collections.defaultdict(int)  # recording calls of line
+        for probe_id, probe in enumerate(probes):
+            if probe is not None and probe_id not in batched:
+                counts[probe[0]] += 1
+
+        self.probes = probes
+        self.batches = batches
+        self._buffers = dict((lineno, collections.deque(maxlen=self.max_deep))
+                             for lineno in counts)
+        self._single = {}
+        capture = None
+        if self.snapshots is not None:
+            capture = self.snapshots.capturer()
+            retained = dict((lineno, sizes(self.max_deep))
+                            for lineno in counts)
+        record = [None] * len(probes)
+        for probe_id, probe in enumerate(probes):
+            if probe is None or probe_id in batched:
+                continue
+            lineno, name, framed = probe
+            members = batches.get(probe_id)
+            append = self._buffers[lineno].append
+            if sink is not None:
+                names = [name] if members is None else \
+                    [probes[member][1] for member in members]
+                store = self._emitter(sink, lineno, names, framed)
+            elif counts[lineno] == 1:
+                self._single[lineno] = probe_id
+                store = append
+            else:
+                store = self._tagged(append, probe_id)
+            if capture is not None:
+                store = self._captured(store, capture, framed,
+                                       members is not None,
+                                       retained[lineno])
+            record[probe_id] = store
+
+        statistics = self.statistics
+        if statistics is not None:
+            statistics.gated = self.policy is not None
+            counts = (statistics.recorded,) if self.policy is not None \
+                else (statistics.hits, statistics.recorded)
+            for probe_id, store in enumerate(record):
+                if store is not None:
+                    record[probe_id] = statistics.timed(store, probe_id,
+                                                        *counts)
+        self.record[:] = record  # instrumented code holds the same list
+
+        if self.policy is not None:
+            self.gate[:] = [None] * len(record)
+            for probe_id, store in enumerate(record):
+                if store is not None:
+                    self.gate[probe_id] = self.policy.gate(self.gate,
+                                                           probe_id)
+            if statistics is not None:
+                self._time_gates(statistics)
+
+    def _time_gates(self, statistics):
+        """
+        Wraps gates in timers. Gates of some policies replace themselves
+        (TimeBudget), so replacement is wrapped again.
+
+        """
+        gates = self.gate
+
+        def wrap(probe_id, gate):
+            def checked():
+                result = gate()
+                if gates[probe_id] is not timed:  # gate replaced itself
+                    gates[probe_id] = wrap(probe_id, gates[probe_id])
+                return result
+            timed = statistics.timed(checked, probe_id, statistics.hits)
+            return timed
+
+        for probe_id, gate in enumerate(gates):
+            if gate is not None:
+                gates[probe_id] = wrap(probe_id, gate)
+
+    def abort(self):
+        """
+        Makes every probe of current run raise Aborted.
+
+        """
+        def aborted(*args):
+            raise Aborted()
+        self.gate[:] = [aborted] * len(self.gate)
+        self.record[:] = [aborted] * len(self.record)
+
+    def listing(self):
+        """
+        Returns:
+            Listing: Recorded values.
+
+        """
+        return Listing(self)
+
+    def restore(self, entries):
+        """
+        Stores values recorded by previous run, as if probes recorded them
+        again.
+
+        Args:
+            entries (iterable): (probe id, call id, value) tuples, see
+                Listing.entries().
+
+        """
+        probes = self.probes
+        batches = self.batches
+        single = self._single
+        buffers = self._buffers
+        entries = iter(entries)  # values of batch follow its first probe
+        for probe_id, call_id, value in entries:
+            lineno, name, framed = probes[probe_id]
+            members = batches.get(probe_id)
+            if members is not None:
+                value = (value,) + tuple(
+                    entry[2]
+                    for entry in itertools.islice(entries, len(members) - 1))
+                if framed:
+                    value = (call_id,) + value
+            elif framed:
+                value = (call_id, value)
+            if lineno not in single:
+                value = (probe_id, value)
+            buffers[lineno].append(value)
+
+    @staticmethod
+    def _captured(store, capture, framed, batched, retained):
+        """
+        Returns:
+            Callable which stores snapshot of value (values of batch).
+            Memory budget counts snapshots kept in buffer of line only,
+            size of evicted item is released (see snapshot.sizes()).
+
+        """
+        used = capture.used
+        append = retained.append
+        if batched and framed:
+            def record(item):
+                used[0] -= retained[0]  # evicted by stored item
+                before = used[0]
+                store((item[0],) + tuple(map(capture, item[1:])))
+                append(used[0] - before)
+        elif batched:
+            def record(values):
+                used[0] -= retained[0]  # evicted by stored item
+                before = used[0]
+                store(tuple(map(capture, values)))
+                append(used[0] - before)
+        elif framed:
+            def record(item):
+                used[0] -= retained[0]  # evicted by stored item
+                before = used[0]
+                store((item[0], capture(item[1])))
+                append(used[0] - before)
+        else:
+            def record(value):
+                used[0] -= retained[0]  # evicted by stored item
+                before = used[0]
+                store(capture(value))
+                append(used[0] - before)
+        return record
+
+    @staticmethod
+    def _emitter(sink, lineno, names, framed):
+        """
+        Returns:
+            Callable which passes value (values of batch) as events to
+            sink.
+
+        """
+        if len(names) > 1:
+            def record(values):
+                if framed:
+                    values = values[1:]
+                for name, value in zip(names, values):
+                    sink((lineno, name, value))
+            return record
+        name = names[0]
+        if framed:
+            def record(item):
+                sink((lineno, name, item[1]))
+        else:
+            def record(value):
+                sink((lineno, name, value))
+        return record
+
+    @staticmethod
+    def _tagged(append, probe_id):
+        """
+        Returns:
+            Callable which stores value with probe id.
+
+        """
+        def record(value):
+            append((probe_id, value))
+        return record
+
+
+class Every(object):
+    """
+    Capture policy which records every n-th hit of probe, starting with
+    the first one (hits 1, n + 1, 2 * n + 1, ...), so probes hit fewer than
+    n times are recorded too.
+
+    Attributes:
+        n (int): Sampling interval.
+
+    """
+    def __init__(self, n):
+        """
+
+        Args:
+            n (int): Sampling interval.
+
+        """
+        self.n = n
+
+    def gate(self, gates, probe_id):
+        """
+        Returns:
+            Callable which tells if current hit is recorded.
+
+        """
+        hits = itertools.cycle((True,) + (False,) * (self.n - 1))
+        return functools.partial(next, hits)
+
+
+class Backoff(object):
+    """
+    Capture policy which records first hits of probe, then exponentially
+    less often (hits 2 * first, 4 * first, 8 * first, ...).
+
+    Attributes:
+        first (int): Number of recorded hits before backoff.
+
+    """
+    def __init__(self, first):
+        """
+
+        Args:
+            first (int): Number of recorded hits before backoff.
+
+        """
+        self.first = first
+
+    def gate(self, gates, probe_id):
+        """
+        Returns:
+            Callable which tells if current hit is recorded.
+
+        """
+        def segments(first):
+            yield itertools.repeat(True, first)
+            gap = first
+            while True:
+                yield itertools.repeat(False, gap - 1)
+                yield (True,)
+                gap *= 2
+
+        hits = itertools.chain.from_iterable(segments(self.first))
+        return functools.partial(next, hits)
+
+
+class TimeBudget(object):
+    """
+    Capture policy which records values of probe only for limited time
+    from its first hit.
+
+    Attributes:
+        seconds (float): Recording time of every probe.
+
+    """
+    clock = staticmethod(getattr(time, 'monotonic', time.time))
+
+    def __init__(self, seconds):
+        """
+
+        Args:
+            seconds (float): Recording time of every probe.
+
+        """
+        self.seconds = seconds
+
+    def gate(self, gates, probe_id):
+        """
+        Returns:
+            Callable which tells if current hit is recorded.
+
+        """
+        clock = self.clock
+        deadline = []
+
+        def within():
+            if not deadline:
+                deadline.append(clock() + self.seconds)
+            elif clock() > deadline[0]:
+                gates[probe_id] = bool  # bool() is False
+                return False
+            return True
+        return within
+
+
+class Listing(Mapping):
+    """
+    Read-only view of values recorded in one run.
+
+    Maps line numbers to deques of (name, value) tuples. Values recorded
+    inside functions can be grouped by calls with calls().
+
+    Deques contain max_deep last values of line, calls() and entries()
+    contain all values of max_deep last recordings (batch records values
+    of all its probes at once).
+
+    """
+    def __init__(self, recorder):
+        """
+
+        Args:
+            recorder (Recorder): Recorder of values.
+
+        """
+        # buffers are replaced (not cleared) by next run
+        self._buffers = recorder._buffers
+        self._single = recorder._single
+        self._probes = recorder.probes
+        self._batches = recorder.batches
+        self._max_deep = recorder.max_deep
+
+    def __getitem__(self, lineno):
+        values = self._buffers[lineno]
+        if not values:
+            raise KeyError(lineno)
+        items = ((self._probes[probe_id][1], value)
+                 for probe_id, call_id, value in self._entries(lineno))
+        return collections.deque(items, maxlen=self._max_deep)
+
+    def calls(self, lineno):
+        """
+        Groups values of line by function calls.
+
+        Args:
+            lineno (int): Line number.
+
+        Returns:
+            OrderedDict: Call id -> list of (name, value) tuples, ordered
+            by first recorded value. Values recorded outside of functions
+            have call id None.
+
+        Raises:
+            KeyError: No values at line.
+
+        """
+        values = self._buffers[lineno]
+        if not values:
+            raise KeyError(lineno)
+        calls = collections.OrderedDict()
+        for probe_id, call_id, value in self._entries(lineno):
+            calls.setdefault(call_id, []).append(
+                (self._probes[probe_id][1], value))
+        return calls
+
+    def entries(self):
+        """
+        Yields (probe id, call id, value) tuples of all lines, in order of
+        recording at every line. Call id is None outside of functions.
+
+        """
+        for lineno in self:
+            for entry in self._entries(lineno):
+                yield entry
+
+    def _entries(self, lineno):
+        """
+        Yields (probe id, call id, value) tuples of line.
+
+        """
+        values = self._buffers[lineno]
+        probes = self._probes
+        batches = self._batches
+        if lineno in self._single:
+            probe_id = self._single[lineno]
+            values = ((probe_id, value) for value in values)
+        for probe_id, value in values:
+            call_id = None
+            members = batches.get(probe_id)
+            if probes[probe_id][2]:
+                call_id = value[0]
+                value = value[1] if members is None else value[1:]
+            if members is None:
+                yield probe_id, call_id, value
+            else:
+                for member, item in zip(members, value):
+                    yield member, call_id, item
+
+    def __iter__(self):
+        return iter(sorted(lineno for lineno, values in self._buffers.items()
+                           if values))
+
+    def __len__(self):
+        return sum(1 for values in self._buffers.values() if values)
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(type(self).__name__, dict(self.items()))
+
+
+class Delta(object):
+    """
+    Lines of listing changed since previous listing.
+
+    Attributes:
+        base (int): Generation of listing which delta is applied to, 0 for
+            empty listing (delta contains all lines).
+        changed (dict): Line number -> list of (name, value) tuples of
+            changed and added lines.
+        generation (int): Generation of listing after delta is applied.
+        removed (list): Line numbers without values.
+
+    """
+    __slots__ = ('generation', 'base', 'changed', 'removed')
+
+    def __init__(self, generation, base, changed, removed):
+        """
+
+        Args:
+            generation (int): Generation of new listing.
+            base (int): Generation of previous listing.
+            changed (dict): Changed lines.
+            removed (list): Removed lines.
+
+        """
+        self.generation = generation
+        self.base = base
+        self.changed = changed
+        self.removed = removed
+
+    def __repr__(self):
+        return '{0}(generation={1}, base={2}, changed={3!r}, removed={4!r})'\
+            .format(type(self).__name__, self.generation, self.base,
+                    self.changed, self.removed)
+
+    @classmethod
+    def between(cls, previous, current, generation, base):
+        """
+        Compares lines of two listings.
+
+        Values are equal when they have the same type and compare equal, so
+        e.g. change from 1 to True is not missed. Values which cannot be
+        compared are considered changed.
+
+        Args:
+            previous (dict): Line number -> tuple of (name, value) tuples.
+            current (dict): Line number -> tuple of (name, value) tuples.
+            generation (int): Generation of current listing.
+            base (int): Generation of previous listing.
+
+        Returns:
+            Delta
+
+        """
+        changed = {}
+        for lineno, items in current.items():
+            old_items = previous.get(lineno)
+            if old_items is None or not _same(old_items, items):
+                changed[lineno] = list(items)
+        removed = sorted(lineno for lineno in previous
+                         if lineno not in current)
+        return cls(generation, base, changed, removed)
+
+
+def _same(old_items, items):
+    """
+    Returns:
+        bool: Lists of (name, value) tuples are equal.
+
+    """
+    if len(old_items) != len(items):
+        return False
+    for (old_name, old_value), (name, value) in zip(old_items, items):
+        if old_name != name or type(old_value) is not type(value):
+            return False
+        if old_value is value:
+            continue
+        try:
+            if not old_value == value:
+                return False
+        except Exception:
+            return False
+    return True
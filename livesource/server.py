@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+Long-running evaluation server.
+
+Server keeps LiveSource instance of every open document, so repeated
+requests reuse incremental instrumentation, compiled code and worker
+processes. Requests and responses are JSON-RPC 2.0 messages, one per line,
+read from stdio or Unix socket.
+
+Methods:
+
+* update(uri, code) - opens or changes document,
+* get_values(uri, full=false, since=null) - evaluates document and
+  returns lines changed since previous get_values() of the document (or
+  since generation given by client): ``changed`` maps line numbers to
+  lists of [name, repr], ``removed`` lists lines without values and
+  ``generation``/``base`` number the new and the previous values,
+* close(uri) - forgets document,
+* shutdown() - stops server.
+
+"""
+import inspect
+import json
+import os
+import stat
+import sys
+import threading
+try:
+    import socketserver
+except ImportError:  # Python 2
+    import SocketServer as socketserver
+
+from .context import RunContext
+from .export import json_listing
+from .livesource import LiveSource
+from .pool import EvaluationError
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+#: evaluation of document failed
+EVALUATION_ERROR = -32000
+#: document is not open
+UNKNOWN_DOCUMENT = -32001
+
+
+class RequestError(Exception):
+    """
+    Request cannot be handled.
+
+    Attributes:
+        code (int): JSON-RPC error code.
+
+    """
+    def __init__(self, code, message):
+        """
+
+        Args:
+            code (int): JSON-RPC error code.
+            message (str): Description of error.
+
+        """
+        super(RequestError, self).__init__(message)
+        self.code = code
+
+
+class Document(object):
+    """
+    Open document.
+
+    Attributes:
+        lock (threading.Lock): Serializes evaluations of document.
+        source (LiveSource): Source code of document.
+
+    """
+    def __init__(self, source):
+        self.source = source
+        self.lock = threading.Lock()
+
+
+class Server(object):
+    """
+    Handler of requests.
+
+    Attributes:
+        context (RunContext): Namespaces of documents evaluated in server
+            process and modules preloaded for them.
+        documents (dict): URI -> Document.
+        executor (WorkerPool): Evaluates documents in worker processes,
+            None to evaluate in server process.
+        max_deep (int): Number of cached values at one line.
+        running (bool): False after shutdown request.
+
+    """
+    def __init__(self, executor=None, max_deep=10, context=None):
+        """
+
+        Args:
+            executor (WorkerPool): Evaluates documents in worker processes.
+            max_deep (int): Number of cached values at one line.
+            context (RunContext): Shared by documents evaluated in server
+                process.
+
+        """
+        self.executor = executor
+        self.max_deep = max_deep
+        self.context = context if context is not None else RunContext()
+        self.documents = {}
+        self.running = True
+        self._lock = threading.Lock()  # guards documents
+        self._methods = {'update': self.update,
+                         'get_values': self.get_values,
+                         'close': self.close,
+                         'shutdown': self.shutdown}
+
+    def handle(self, line):
+        """
+        Handles single message.
+
+        Args:
+            line (str): JSON-RPC request.
+
+        Returns:
+            str: JSON-RPC response, None for notification.
+
+        """
+        request_id = None
+        notification = False
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise RequestError(PARSE_ERROR, 'parse error')
+            if not isinstance(request, dict) or \
+                    not isinstance(request.get('method'), str):
+                raise RequestError(INVALID_REQUEST, 'invalid request')
+            request_id = request.get('id')
+            notification = 'id' not in request
+            method = self._methods.get(request['method'])
+            if method is None:
+                raise RequestError(METHOD_NOT_FOUND, 'method not found: {0}'
+                                   .format(request['method']))
+            params = request.get('params', {})
+            if not isinstance(params, dict):
+                raise RequestError(INVALID_PARAMS, 'params must be object')
+            try:
+                inspect.getcallargs(method, **params)
+            except TypeError as err:
+                raise RequestError(INVALID_PARAMS, str(err))
+            try:
+                result = method(**params)
+            except RequestError:
+                raise
+            except Exception as err:
+                raise RequestError(INTERNAL_ERROR, '{0}: {1}'.format(
+                    type(err).__name__, err))
+            response = {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+        except RequestError as err:
+            response = {'jsonrpc': '2.0', 'id': request_id,
+                        'error': {'code': err.code, 'message': str(err)}}
+        if notification:
+            return None  # even failed notification gets no response
+        return json.dumps(response)
+
+    def update(self, uri, code):
+        """
+        Opens or changes document.
+
+        Args:
+            uri (str): Document.
+            code (str): Source code of document.
+
+        Returns:
+            dict: Number of lines of document.
+
+        Raises:
+            RequestError: Invalid params.
+
+        """
+        _check(uri, 'uri', str)
+        _check(code, 'code', str)
+        with self._lock:
+            document = self.documents.get(uri)
+            if document is None:
+                self.documents[uri] = Document(LiveSource(
+                    code, self.max_deep, executor=self.executor,
+                    context=self.context))
+        if document is not None:
+            document.source.update(code)
+        return {'lines': len(code.splitlines())}
+
+    def get_values(self, uri, full=False, since=None):
+        """
+        Evaluates document.
+
+        Args:
+            uri (str): Document.
+            full (bool): Returns all lines, not only changed ones.
+            since (int): Generation of values known to client, defaults to
+                generation of previous response.
+
+        Returns:
+            dict: ``generation`` of values, ``base`` generation which
+            delta applies to (0 for all lines), ``changed`` line number ->
+            list of [name, repr] and ``removed`` line numbers.
+
+        Raises:
+            RequestError: Invalid params, unknown document or evaluation
+                failed.
+
+        """
+        _check(full, 'full', bool)
+        if since is not None:
+            _check(since, 'since', int)
+        document = self._document(uri)
+        with document.lock:
+            try:
+                delta = document.source.get_changes(0 if full else since)
+            except EvaluationError as err:
+                raise RequestError(EVALUATION_ERROR,
+                                   str(err).strip().split('\n')[-1])
+            except (Exception, SystemExit) as err:
+                raise RequestError(EVALUATION_ERROR, '{0}: {1}'.format(
+                    type(err).__name__, err))
+        return {'generation': delta.generation,
+                'base': delta.base,
+                'changed': json_listing(delta.changed),
+                'removed': delta.removed}
+
+    def close(self, uri):
+        """
+        Forgets document.
+
+        """
+        _check(uri, 'uri', str)
+        with self._lock:
+            if self.documents.pop(uri, None) is None:
+                raise RequestError(UNKNOWN_DOCUMENT,
+                                   'unknown document: {0}'.format(uri))
+        return None
+
+    def shutdown(self):
+        """
+        Stops server after response.
+
+        """
+        self.running = False
+        return None
+
+    def serve(self, lines, write):
+        """
+        Handles messages until shutdown request or end of input.
+
+        Args:
+            lines (iterable): Messages.
+            write (callable): Writes response line.
+
+        """
+        for line in lines:
+            if not line.strip():
+                continue
+            response = self.handle(line)
+            if response is not None:
+                write(response + '\n')
+            if not self.running:
+                break
+
+    def _document(self, uri):
+        _check(uri, 'uri', str)
+        with self._lock:
+            document = self.documents.get(uri)
+        if document is None:
+            raise RequestError(UNKNOWN_DOCUMENT,
+                               'unknown document: {0}'.format(uri))
+        return document
+
+
+def _check(value, name, kind):
+    """
+    Validates param of request.
+
+    Raises:
+        RequestError: Value is not instance of kind.
+
+    """
+    if not isinstance(value, kind):
+        raise RequestError(INVALID_PARAMS, '{0} must be {1}'.format(
+            name, kind.__name__))
+
+
+def serve_stdio(server):
+    """
+    Serves requests from stdin.
+
+    Output of evaluated code is redirected to stderr, so it does not mix
+    with responses.
+
+    Args:
+        server (Server): Handler of requests.
+
+    """
+    sys.stdout.flush()
+    output = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def write(response):
+        output.write(response)
+        output.flush()
+
+    try:
+        server.serve(iter(sys.stdin.readline, ''), write)
+    finally:
+        output.close()
+
+
+def serve_socket(server, path):
+    """
+    Serves requests from clients of Unix socket.
+
+    Every client is served in own thread, documents are shared.
+
+    Args:
+        server (Server): Handler of requests.
+        path (str): Path of socket, stale socket is replaced.
+
+    Raises:
+        ValueError: Path exists and it is not socket.
+
+    """
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            def write(response):
+                self.wfile.write(response.encode('utf-8'))
+                self.wfile.flush()
+
+            lines = (line.decode('utf-8')
+                     for line in iter(self.rfile.readline, b''))
+            server.serve(lines, write)
+            if not server.running:
+                threading.Thread(target=listener.shutdown).start()
+
+    class Listener(socketserver.ThreadingMixIn,
+                   socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    try:
+        mode = os.lstat(path).st_mode
+    except OSError:
+        pass  # no stale socket
+    else:
+        if not stat.S_ISSOCK(mode):
+            raise ValueError('not a socket: {0}'.format(path))
+        os.unlink(path)
+    listener = Listener(path, Handler)
+    try:
+        listener.serve_forever()
+    finally:
+        listener.server_close()
+        os.unlink(path)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Size-bounded snapshots of recorded values.
+
+"""
+import collections
+import itertools
+import sys
+
+#: immutable values stored as they are
+SCALAR_TYPES = frozenset([bool, int, float, complex, type(None)] +
+                         ([long] if sys.version_info < (3,) else []))  # noqa
+
+#: sequences of characters, truncated to max_length
+STRING_TYPES = frozenset([str, bytes, bytearray, type(u'')])
+
+#: containers copied (small) or summarized (large)
+CONTAINER_TYPES = frozenset([list, tuple, set, frozenset, dict,
+                             collections.deque])
+
+
+class Summary(object):
+    """
+    Snapshot of value too large to be stored.
+
+    Its repr() is computed lazily, when value is displayed.
+
+    Attributes:
+        type_name (str): Name of value type.
+        length (int): Number of items (characters) of value, None for
+            other objects.
+        head: Tuple of first items, string of first characters or repr()
+            of other object. Empty when memory budget is exhausted.
+
+    """
+    __slots__ = ('type_name', 'length', 'head', '_repr')
+
+    def __init__(self, type_name, length, head):
+        """
+
+        Args:
+            type_name (str): Name of value type.
+            length (int): Number of items of value.
+            head: First items of value.
+
+        """
+        self.type_name = type_name
+        self.length = length
+        self.head = head
+        self._repr = None
+
+    def __getstate__(self):
+        return (self.type_name, self.length, self.head)
+
+    def __setstate__(self, state):
+        self.type_name, self.length, self.head = state
+        self._repr = None
+
+    def __repr__(self):
+        if self._repr is None:
+            self._repr = self._format()
+        return self._repr
+
+    def _format(self):
+        """
+        Returns:
+            str: Human-readable description of value.
+
+        """
+        if self.length is None:  # other object
+            return self.head or '<{0} object>'.format(self.type_name)
+        if not self.head:
+            return '<{0} of length {1}>'.format(self.type_name, self.length)
+        if type(self.head) in STRING_TYPES:
+            items = '{0!r}...'.format(self.head)
+        elif self.type_name == 'dict':
+            items = '{{{0}, ...}}'.format(', '.join(
+                '{0!r}: {1!r}'.format(key, item) for key, item in self.head))
+        else:
+            items = '[{0}, ...]'.format(', '.join(
+                repr(item) for item in self.head))
+        return '<{0} of length {1}: {2}>'.format(self.type_name, self.length,
+                                                 items)
+
+
+class Snapshots(object):
+    """
+    Snapshot layer of recorded values.
+
+    Scalars and short strings are stored as they are. Small containers are
+    copied, so later mutations do not change recorded values. Large and
+    deeply nested containers are stored as Summary of their type, length
+    and first items. Other objects are stored by reference or, to show
+    their state at the time of recording, as truncated repr().
+
+    Values kept in listing of one run share memory budget: values evicted
+    from buffers of lines (see max_deep of LiveSource) are not counted.
+    When budget is exhausted, only types and lengths of new values are kept.
+
+    Attributes:
+        budget (int): Memory budget of listing of one run in bytes
+            (approximate).
+        max_depth (int): Nesting level of copied containers.
+        max_items (int): Number of copied container items.
+        max_length (int): Number of copied characters.
+        objects (str): 'reference' or 'repr'.
+
+    """
+    def __init__(self, max_items=10, max_length=100, max_depth=2,
+                 budget=2 ** 24, objects='reference'):
+        """
+
+        Args:
+            max_items (int): Number of copied container items.
+            max_length (int): Number of copied characters.
+            max_depth (int): Nesting level of copied containers.
+            budget (int): Memory budget of listing of one run in bytes.
+            objects (str): Storage of other objects: 'reference' keeps
+                object alive, 'repr' computes its repr() immediately.
+
+        Raises:
+            ValueError: Unknown storage of objects.
+
+        """
+        if objects not in ('reference', 'repr'):
+            raise ValueError('unknown storage of objects: {0}'.format(
+                objects))
+        self.max_items = max_items
+        self.max_length = max_length
+        self.max_depth = max_depth
+        self.budget = budget
+        self.objects = objects
+
+    def capturer(self):
+        """
+        Returns:
+            Callable which converts value to snapshot, with own memory
+            budget. Its attribute `used` is list with number of bytes of
+            kept snapshots, owner of snapshots subtracts size of evicted
+            ones (see sizes()).
+
+        """
+        max_items = self.max_items
+        max_length = self.max_length
+        max_depth = self.max_depth
+        budget = self.budget
+        by_repr = self.objects == 'repr'
+        getsizeof = sys.getsizeof
+        islice = itertools.islice
+        used = [0]
+
+        def capture(value, depth=0):
+            kind = type(value)
+            if kind in SCALAR_TYPES:
+                return value
+
+            exhausted = used[0] >= budget
+            if kind in STRING_TYPES:
+                if exhausted or len(value) > max_length:
+                    snapshot = Summary(kind.__name__, len(value),
+                                       value[:0 if exhausted else max_length])
+                elif kind is bytearray:
+                    snapshot = kind(value)
+                else:
+                    snapshot = value
+            elif kind in CONTAINER_TYPES:
+                if exhausted or depth >= max_depth:
+                    snapshot = Summary(kind.__name__, len(value), ())
+                elif kind is dict:
+                    items = ((key, capture(item, depth + 1))
+                             for key, item in islice(value.items(),
+                                                     max_items))
+                    if len(value) > max_items:
+                        snapshot = Summary('dict', len(value), tuple(items))
+                    else:
+                        snapshot = dict(items)
+                else:
+                    items = (capture(item, depth + 1)
+                             for item in islice(value, max_items))
+                    if len(value) > max_items:
+                        snapshot = Summary(kind.__name__, len(value),
+                                           tuple(items))
+                    else:
+                        snapshot = kind(items)
+            elif exhausted or by_repr:
+                text = '' if exhausted else _truncated_repr(value, max_length)
+                snapshot = Summary(kind.__name__, None, text)
+            else:
+                snapshot = value
+
+            used[0] += getsizeof(snapshot)
+            if type(snapshot) is Summary:
+                used[0] += getsizeof(snapshot.head)
+            return snapshot
+        capture.used = used
+        return capture
+
+
+def sizes(max_deep):
+    """
+    Returns:
+        deque: Bytes of snapshots of max_deep last items stored in buffer
+        (e.g. values of one line), zeros before the first items. Before
+        new item is stored, owner of buffer subtracts the first size (of
+        evicted item) from `used` of capturer, then it appends size of new
+        item.
+
+    """
+    return collections.deque([0] * max_deep, maxlen=max_deep)
+
+
+def _truncated_repr(value, max_length):
+    """
+    Returns:
+        str: repr() of value, at most max_length characters long.
+
+    """
+    try:
+        text = repr(value)
+    except Exception:
+        return ''
+    if len(text) > max_length:
+        text = text[:max_length] + '...'
+    return text
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Statistics of probes.
+
+Probes of run with statistics are wrapped in timers: every probe counts
+its hits and recorded values and measures time spent in recording (gate of
+capture policy, snapshot and storage of value). Time of probe call itself
+(lookup of recording callable and call of timer) cannot be measured from
+inside of probe, so it is estimated from calibrated cost of single call.
+
+Batch of probes is a single call: every its probe counts hits, time and
+call cost are divided among them.
+
+"""
+import collections
+import time
+
+#: monotonic clock with the best resolution
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class ProbeStatistics(object):
+    """
+    Hits and recording time of every probe of one run.
+
+    Lists are indexed by probe id.
+
+    Attributes:
+        batches (dict): First probe id of batch -> ids of all its probes.
+        call_cost (float): Estimated seconds of single probe call spent
+            outside of measured recording.
+        gated (bool): Probes are gated by capture policy, so recorded
+            hits call probe twice (gate and recording callable).
+        hits (list): Number of times execution reached probe.
+        probes (tuple): (line number, name, framed) of every probe id.
+        recorded (list): Number of recorded values (hits passed by gate of
+            capture policy).
+        run_time (float): Seconds of whole run.
+        seconds (list): Seconds spent in recording.
+
+    """
+    _call_cost = None  # calibrated once per process
+
+    def __init__(self, probes, batches=None):
+        """
+
+        Args:
+            probes (tuple): (line number, name, framed) of every probe id.
+            batches (dict): First probe id of batch -> ids of all its
+                probes.
+
+        """
+        self.probes = probes
+        self.batches = batches or {}
+        self._shares = [1.0] * len(probes)  # part of call cost of probe
+        for members in self.batches.values():
+            for probe_id in members:
+                self._shares[probe_id] = 1.0 / len(members)
+        self.hits = [0] * len(probes)
+        self.recorded = [0] * len(probes)
+        self.seconds = [0.0] * len(probes)
+        self.run_time = 0.0
+        self.gated = False
+        self.call_cost = self.calibrate()
+
+    @classmethod
+    def calibrate(cls, number=10000):
+        """
+        Measures cost of probe call which is not measured by timer.
+
+        Args:
+            number (int): Number of measured calls.
+
+        Returns:
+            float: Seconds per call.
+
+        """
+        if cls._call_cost is None:
+            statistics = cls.__new__(cls)
+            statistics.batches = {}
+            statistics.hits = [0]
+            statistics.seconds = [0.0]
+            record = [statistics.timed(lambda value: None, 0,
+                                       statistics.hits, statistics.hits)]
+            start = clock()
+            for _ in range(number):
+                record[0](None)
+            elapsed = clock() - start
+            empty = clock()
+            for _ in range(number):
+                pass
+            elapsed -= clock() - empty
+            cls._call_cost = max(elapsed - statistics.seconds[0], 0.0) / \
+                number
+        return cls._call_cost
+
+    def timed(self, function, probe_id, *counts):
+        """
+        Wraps recording callable of probe in timer.
+
+        Args:
+            function (callable): Gate or recording callable.
+            probe_id (int): Probe id (the first probe of batch).
+            *counts (list): Counters incremented by every call, `hits`
+                and/or `recorded`.
+
+        Returns:
+            callable
+
+        """
+        seconds = self.seconds
+        members = self.batches.get(probe_id, (probe_id,))
+        share = 1.0 / len(members)
+
+        def timed(*args):
+            start = clock()
+            try:
+                return function(*args)
+            finally:
+                elapsed = (clock() - start) * share
+                for member in members:
+                    seconds[member] += elapsed
+                    for count in counts:
+                        count[member] += 1
+        return timed
+
+    def measure(self, function, *args):
+        """
+        Calls function (run of code) and stores its time as run_time.
+
+        """
+        start = clock()
+        try:
+            return function(*args)
+        finally:
+            self.run_time += clock() - start
+
+    @property
+    def recording_time(self):
+        """
+        float: Seconds spent in recording by all probes.
+
+        """
+        return sum(self.seconds)
+
+    @property
+    def overhead(self):
+        """
+        float: Estimated seconds of run spent in probes, including their
+        calls.
+
+        Timers are part of the estimate, so it is an upper bound of
+        overhead of run without statistics.
+
+        """
+        return self.recording_time + sum(
+            self._calls(probe_id)
+            for probe_id, probe in enumerate(self.probes) if probe is not None)
+
+    @property
+    def user_time(self):
+        """
+        float: Estimated seconds of run spent in user code.
+
+        """
+        return max(self.run_time - self.overhead, 0.0)
+
+    def sites(self):
+        """
+        Returns statistics of every probe, most expensive first.
+
+        Returns:
+            list: Dicts with ``probe``, ``line``, ``name``, ``hits``,
+            ``recorded``, ``seconds`` (recording time) and ``overhead``
+            (recording time with estimated cost of calls).
+
+        """
+        sites = []
+        for probe_id, probe in enumerate(self.probes):
+            if probe is None or not self.hits[probe_id]:
+                continue
+            site = collections.OrderedDict()
+            site['probe'] = probe_id
+            site['line'] = probe[0]
+            site['name'] = probe[1]
+            site['hits'] = self.hits[probe_id]
+            site['recorded'] = self.recorded[probe_id]
+            site['seconds'] = self.seconds[probe_id]
+            site['overhead'] = self.seconds[probe_id] + self._calls(probe_id)
+            sites.append(site)
+        sites.sort(key=lambda site: -site['overhead'])
+        return sites
+
+    def _calls(self, probe_id):
+        """
+        Returns:
+            float: Estimated seconds of calls of probe.
+
+        """
+        calls = self.hits[probe_id]
+        if self.gated:
+            calls += self.recorded[probe_id]
+        return calls * self.call_cost * self._shares[probe_id]
+
+    def lines(self):
+        """
+        Sums statistics of probes by lines.
+
+        Returns:
+            dict: Line number -> (hits, recorded, overhead seconds).
+
+        """
+        lines = {}
+        for site in self.sites():
+            hits, recorded, overhead = lines.get(site['line'], (0, 0, 0.0))
+            lines[site['line']] = (hits + site['hits'],
+                                   recorded + site['recorded'],
+                                   overhead + site['overhead'])
+        return lines
+
+    def summary(self):
+        """
+        Returns:
+            OrderedDict: ``run_time``, ``user_time``, ``recording_time``,
+            ``overhead`` (seconds), ``overhead_ratio`` (part of run spent
+            in probes), ``hits`` and ``recorded`` of all probes.
+
+        """
+        summary = collections.OrderedDict()
+        summary['run_time'] = self.run_time
+        summary['user_time'] = self.user_time
+        summary['recording_time'] = self.recording_time
+        summary['overhead'] = self.overhead
+        summary['overhead_ratio'] = (min(self.overhead / self.run_time, 1.0)
+                                     if self.run_time else 0.0)
+        summary['hits'] = sum(self.hits)
+        summary['recorded'] = sum(self.recorded)
+        return summary
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, ', '.join(
+            '{0}={1!r}'.format(key, value)
+            for key, value in self.summary().items()))
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming of values recorded by instrumented code.
+
+"""
+import collections
+import threading
+
+from .recorder import Aborted
+
+
+class Stream(object):
+    """
+    Bounded queue of (line number, name, value) events.
+
+    Instrumented code puts events from its thread, consumer iterates over
+    them while the code is running. When the queue is full, overflow policy
+    decides what happens with new event:
+
+    * 'block' - instrumented code waits for consumer (backpressure),
+    * 'drop' - new event is dropped,
+    * 'drop_oldest' - the oldest queued event is dropped.
+
+    Closing the stream aborts instrumented code at its next probe.
+
+    Attributes:
+        dropped (int): Number of dropped events.
+        maxsize (int): Maximal number of queued events.
+        overflow (str): Overflow policy.
+
+    """
+    OVERFLOW_POLICIES = ('block', 'drop', 'drop_oldest')
+
+    def __init__(self, maxsize=1024, overflow='block'):
+        """
+
+        Args:
+            maxsize (int): Maximal number of queued events.
+            overflow (str): One of 'block', 'drop', 'drop_oldest'.
+
+        Raises:
+            ValueError: Unknown overflow policy.
+
+        """
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError('unknown overflow policy: {0}'.format(overflow))
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self._events = collections.deque()
+        self._ready = threading.Condition(threading.Lock())
+        self._closed = False
+        self._finished = False
+        self._error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """
+        Returns:
+            (line number, name, value) tuple.
+
+        Raises:
+            StopIteration: Instrumented code finished.
+            Exception: Error raised by instrumented code.
+
+        """
+        with self._ready:
+            while not self._events:
+                if self._finished or self._closed:
+                    if self._error is not None:
+                        error, self._error = self._error, None
+                        raise error
+                    raise StopIteration
+                self._ready.wait()
+            event = self._events.popleft()
+            self._ready.notify_all()
+            return event
+
+    next = __next__  # Python 2
+
+    def put(self, event):
+        """
+        Queues event, called by instrumented code.
+
+        Args:
+            event (tuple): (line number, name, value) tuple.
+
+        Raises:
+            Aborted: Stream was closed by consumer.
+
+        """
+        with self._ready:
+            while len(self._events) >= self.maxsize:
+                if self._closed:
+                    break
+                if self.overflow == 'drop':
+                    self.dropped += 1
+                    return
+                if self.overflow == 'drop_oldest':
+                    self._events.popleft()
+                    self.dropped += 1
+                    break
+                self._ready.wait()
+            if self._closed:
+                raise Aborted()
+            self._events.append(event)
+            self._ready.notify_all()
+
+    def finish(self, error=None):
+        """
+        Marks end of events, called when instrumented code stops.
+
+        Args:
+            error (Exception): Error raised by instrumented code.
+
+        """
+        with self._ready:
+            self._finished = True
+            self._error = error
+            self._ready.notify_all()
+
+    def close(self):
+        """
+        Stops consuming events and drops queued ones.
+
+        """
+        with self._ready:
+            self._closed = True
+            self._events.clear()
+            self._ready.notify_all()
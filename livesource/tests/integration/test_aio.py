@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Asynchronous evaluation tests.
+
+"""
+import collections
+from textwrap import dedent as d
+import sys
+import threading
+import time
+import unittest
+
+from livesource import EvaluationCancelled, LiveSource, WorkerPool
+
+LOOP = d("""\
+            i = 0
+            while True:
+                i += 1
+         """)
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'requires async/await')
+class GetValuesAsyncTestCase(unittest.TestCase):
+    def setUp(self):
+        import asyncio
+        self.asyncio = asyncio
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(
+            self.asyncio.wait_for(coroutine, 10))
+
+    def test_get_values(self):
+        source = LiveSource('a = 1\n')
+
+        values = self.run_async(source.get_values_async())
+
+        self.assertEqual(values[1], collections.deque([('a', 1)]))
+
+    def test_update_restarts_evaluation(self):
+        source = LiveSource(LOOP)
+
+        async def edit():
+            evaluation = self.asyncio.ensure_future(
+                source.get_values_async())
+            await self.asyncio.sleep(0.1)
+            source.update('a = 2\n')
+            return await evaluation
+
+        values = self.run_async(edit())
+
+        self.assertEqual(dict(values), {1: collections.deque([('a', 2)])})
+
+    def test_updates_are_coalesced(self):
+        source = LiveSource(LOOP)
+        evaluated = []
+        get_values = source.get_values
+
+        def spy():
+            evaluated.append(source.code)
+            return get_values()
+        source.get_values = spy
+
+        async def edit():
+            evaluation = self.asyncio.ensure_future(
+                source.get_values_async())
+            await self.asyncio.sleep(0.1)
+            for value in range(3):
+                source.update('a = {0}\n'.format(value))
+            return await evaluation
+
+        values = self.run_async(edit())
+
+        self.assertEqual(values[1], collections.deque([('a', 2)]))
+        self.assertEqual(evaluated, [LOOP, 'a = 2\n'])
+
+    def test_shared_evaluation(self):
+        source = LiveSource('a = 1\n')
+
+        async def both():
+            return await self.asyncio.gather(source.get_values_async(),
+                                             source.get_values_async())
+
+        first, second = self.run_async(both())
+
+        self.assertIs(first, second)
+
+    def test_cancel(self):
+        source = LiveSource(LOOP)
+
+        async def cancel():
+            evaluation = self.asyncio.ensure_future(
+                source.get_values_async())
+            await self.asyncio.sleep(0.1)
+            source.cancel()
+            return await evaluation
+
+        self.assertRaises(EvaluationCancelled, self.run_async, cancel())
+
+    def test_cancel_in_pool(self):
+        with WorkerPool(processes=1, timeout=10) as pool:
+            source = LiveSource(LOOP, executor=pool)
+
+            async def edit():
+                evaluation = self.asyncio.ensure_future(
+                    source.get_values_async())
+                await self.asyncio.sleep(0.5)
+                source.update('a = 2\n')
+                return await evaluation
+
+            values = self.run_async(edit())
+
+        self.assertEqual(dict(values), {1: collections.deque([('a', 2)])})
+
+
+class CancelTestCase(unittest.TestCase):
+    def test_cancel_from_other_thread(self):
+        source = LiveSource(LOOP)
+        timer = threading.Timer(0.1, source.cancel)
+        timer.start()
+
+        self.assertRaises(EvaluationCancelled, source.get_values)
+        timer.join()
+
+        self.assertEqual(len(LiveSource('a = 1').get_values()), 1)
+
+    def test_loop_without_probes(self):
+        # cancellation waits for the first probe after the loop
+        source = LiveSource(d("""\
+            import time
+            end = time.time() + 0.3
+            while time.time() < end:
+                pass
+            after = 1
+            """))
+        source.select(kinds=['Name'])
+        source.get_values()  # instrument before timing
+        timer = threading.Timer(0.05, source.cancel)
+        start = time.time()
+        timer.start()
+
+        self.assertRaises(EvaluationCancelled, source.get_values)
+        timer.join()
+
+        self.assertGreaterEqual(time.time() - start, 0.3)
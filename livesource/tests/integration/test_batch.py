@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Batch evaluation tests.
+
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from livesource.batch import evaluate_files, find_sources, portable_result
+
+
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, 'sub'))
+        self.files = {'a.py': 'a = 1\n',
+                      'b.py': 'b = 1 / 0\n',
+                      os.path.join('sub', 'c.py'): 'c = [1, 2]\n',
+                      'notes.txt': 'text\n'}
+        for name, code in self.files.items():
+            with open(self.path(name), 'w') as source_file:
+                source_file.write(code)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_find_sources(self):
+        expected = [self.path('a.py'), self.path('b.py'),
+                    self.path(os.path.join('sub', 'c.py'))]
+
+        self.assertEqual(find_sources([self.directory]), expected)
+        self.assertEqual(find_sources([self.path('*.py')]), expected[:2])
+        self.assertEqual(find_sources([self.path('b.py'), self.directory]),
+                         [expected[1], expected[0], expected[2]])
+        self.assertEqual(find_sources(['missing.py']), ['missing.py'])
+
+    def test_evaluate_files(self):
+        paths = find_sources([self.directory]) + [self.path('missing.py')]
+
+        results = dict((result['path'], result)
+                       for result in evaluate_files(paths, processes=2,
+                                                    timeout=5))
+
+        self.assertEqual(sorted(results), sorted(paths))
+        self.assertEqual(list(results[self.path('a.py')]['values'][1]),
+                         [('a', 1)])
+        self.assertIsNone(results[self.path('a.py')]['error'])
+        self.assertIn('ZeroDivisionError',
+                      results[self.path('b.py')]['error'])
+        self.assertIsNotNone(results[self.path('missing.py')]['error'])
+        for result in results.values():
+            self.assertGreaterEqual(result['time'], 0)
+
+    def test_evaluate_files_fork(self):
+        paths = [self.path('a.py'), self.path('b.py')]
+
+        results = dict((result['path'], result)
+                       for result in evaluate_files(paths, processes=2,
+                                                    timeout=5, fork=True))
+
+        self.assertEqual(list(results[self.path('a.py')]['values'][1]),
+                         [('a', 1)])
+        self.assertIn('ZeroDivisionError',
+                      results[self.path('b.py')]['error'])
+
+    def test_portable_result(self):
+        result, = evaluate_files([self.path(os.path.join('sub', 'c.py'))],
+                                 processes=1, timeout=5)
+
+        line = json.loads(json.dumps(portable_result(result)))
+
+        self.assertEqual(line['values'], {'1': [['c', '[1, 2]']]})
+        self.assertIsNone(line['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,9 +5,11 @@ LiveSource tests.
 """
 import collections
 from textwrap import dedent as d
+import threading
 import unittest
 
-from livesource import LiveSource
+from livesource import (EvaluationCancelled, Every, LiveSource, RunContext,
+                        Snapshots)
 
 
 class CodeTestCase(unittest.TestCase):
@@ -19,3 +21,489 @@ class CodeTestCase(unittest.TestCase):
         values = LiveSource(code).get_values()
 
         self.assertEqual(values[1], result([('a', 1)]))
+
+    def test_policy(self):
+        code = d("""\
+                    i = 0
+                    while i < 10:
+                        i += 1
+                 """)
+        result = lambda x: collections.deque(x, maxlen=10)
+        values = LiveSource(code, policy=Every(5)).get_values()
+
+        self.assertEqual(values[1], result([('i', 0)]))
+        self.assertEqual(values[3], result([('i', 1), ('i', 6)]))
+
+
+class StreamTestCase(unittest.TestCase):
+    def test_events(self):
+        code = d("""\
+                    i = 0
+                    while i < 3:
+                        i += 1
+                 """)
+
+        events = list(LiveSource(code).stream())
+
+        self.assertEqual(events, [(1, 'i', 0),
+                                  (2, None, True), (3, 'i', 1),
+                                  (2, None, True), (3, 'i', 2),
+                                  (2, None, True), (3, 'i', 3)])
+
+    def test_backpressure(self):
+        code = d("""\
+                    i = 0
+                    while i < 1000:
+                        i += 1
+                 """)
+
+        stream = LiveSource(code, policy=Every(10)).stream(maxsize=2)
+        values = [value for lineno, name, value in stream if name == 'i']
+
+        self.assertEqual(values, [0] + list(range(1, 1001, 10)))
+        self.assertEqual(stream.dropped, 0)
+
+    def test_close_aborts_code(self):
+        code = d("""\
+                    i = 0
+                    while True:
+                        i += 1
+                 """)
+        source = LiveSource(code)
+
+        with source.stream(maxsize=1) as stream:
+            first = next(stream)
+
+        self.assertEqual(first, (1, 'i', 0))
+        self.assertEqual(len(LiveSource('a = 1').get_values()), 1)
+
+    def test_error(self):
+        stream = LiveSource('a = 1\nb = a / 0\n').stream()
+
+        self.assertEqual(next(stream), (1, 'a', 1))
+        self.assertRaises(ZeroDivisionError, next, stream)
+
+
+class SnapshotsTestCase(unittest.TestCase):
+    def test_mutated_value(self):
+        code = d("""\
+                    a = [1]
+                    a.append(2)
+                    a = a
+                 """)
+
+        values = LiveSource(code, snapshots=Snapshots()).get_values()
+
+        self.assertEqual(values[1][0][1], [1])
+        self.assertEqual(values[3][0][1], [1, 2])
+
+    def test_function(self):
+        code = d("""\
+                    def f(a):
+                        a.append(1)
+                        return a
+                    b = f([])
+                 """)
+
+        values = LiveSource(code, snapshots=Snapshots()).get_values()
+
+        self.assertEqual(values[1][0][1], [])
+        self.assertEqual(values[4][0][1], [1])
+
+    def test_large_value(self):
+        code = d("""\
+                    a = list(range(1000))
+                 """)
+
+        values = LiveSource(code, snapshots=Snapshots()).get_values()
+
+        self.assertEqual(repr(values[1][0][1]),
+                         '<list of length 1000: '
+                         '[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, ...]>')
+
+    def test_budget_of_kept_values(self):
+        code = d("""\
+                    for i in range(2000):
+                        x = [i, i]
+                 """)
+        snapshots = Snapshots(budget=50000)
+
+        for backend in LiveSource.BACKENDS:
+            values = LiveSource(code, max_deep=3, snapshots=snapshots,
+                                backend=backend).get_values()
+
+            self.assertEqual(list(values[2]), [('x', [1997, 1997]),
+                                               ('x', [1998, 1998]),
+                                               ('x', [1999, 1999])])
+
+
+class FunctionTestCase(unittest.TestCase):
+    def test_recursion(self):
+        code = d("""\
+                    def factorial(n):
+                        if n < 2:
+                            return 1
+                        result = n * factorial(n - 1)
+                        return result
+                    a = factorial(3)
+                 """)
+
+        values = LiveSource(code).get_values()
+        calls = list(values.calls(4).values())
+
+        self.assertEqual(values[1], collections.deque([('n', 3), ('n', 2),
+                                                       ('n', 1)]))
+        self.assertEqual(calls, [[('result', 2)], [('result', 6)]])
+        self.assertEqual(values[6], collections.deque([('a', 6)]))
+
+    def test_module_names(self):
+        code = d("""\
+                    b = 2
+                    def f(a):
+                        return [a * b for _ in range(1)]
+                    c = f(3)
+                 """)
+
+        values = LiveSource(code).get_values()
+
+        self.assertEqual(values[4], collections.deque([('c', [6])]))
+
+    def test_method(self):
+        code = d("""\
+                    class A(object):
+                        def __init__(self, x):
+                            self.x = x
+                    a = A(1)
+                    b = A(2)
+                 """)
+
+        values = LiveSource(code).get_values()
+
+        self.assertEqual([[value for name, value in items]
+                          for items in values.calls(3).values()], [[1], [2]])
+
+    def test_loops(self):
+        code = d("""\
+                    total = 0
+                    for i in range(3):
+                        total += i
+                    squares = {j: j * j for j in range(2)}
+                 """)
+
+        values = LiveSource(code).get_values()
+
+        self.assertEqual(values[2], collections.deque([('i', 0), ('i', 1),
+                                                       ('i', 2)]))
+        self.assertEqual(values[4], collections.deque([('j', 0), ('j', 1),
+                                                       ('squares',
+                                                        {0: 0, 1: 1})]))
+
+    def test_nested_scopes(self):
+        code = d("""\
+                    def f(n):
+                        class A(object):
+                            m = n
+                        return [A.m + i for i in range(n)]
+                    a = f(2)
+                 """)
+
+        values = LiveSource(code, policy=Every(1)).get_values()
+
+        self.assertEqual(values[3], collections.deque([('m', 2)]))
+        self.assertEqual(values[4], collections.deque([('i', 0), ('i', 1)]))
+
+    def test_cancel(self):
+        source = LiveSource('def f():\n    while True:\n        x = 1\nf()\n')
+        thread = threading.Timer(0.05, source.cancel)
+        thread.start()
+
+        self.assertRaises(EvaluationCancelled, source.get_values)
+        thread.join()
+
+
+class RunContextTestCase(unittest.TestCase):
+    def test_fresh_namespace(self):
+        source = LiveSource('a = 1\n')
+        source.get_values()
+
+        source.update('b = a\n')
+
+        self.assertRaises(NameError, source.get_values)
+
+    def test_shared_context(self):
+        context = RunContext(['decimal'])
+        first = LiveSource('a = 1\n', context=context)
+        second = LiveSource('b = a\n', context=context)
+        first.get_values()
+
+        self.assertRaises(NameError, second.get_values)
+        self.assertEqual(list(context.modules), ['decimal'])
+
+    def test_stream(self):
+        source = LiveSource('a = 1\n')
+        list(source.stream())
+
+        source.update('b = a\n')
+
+        self.assertRaises(NameError, list, source.stream())
+
+
+class TraceBackendTestCase(unittest.TestCase):
+    code = d("""\
+                def f(a):
+                    b = a + 1
+                    return b
+                total = 0
+                for i in range(3):
+                    total = total + f(i)
+             """)
+
+    def test_same_values(self):
+        traced = LiveSource(self.code, backend='trace').get_values()
+        instrumented = LiveSource(self.code).get_values()
+
+        for lineno in (2, 5, 6):
+            self.assertEqual(traced[lineno], instrumented[lineno])
+
+    def test_select(self):
+        source = LiveSource(self.code, backend='trace')
+        source.select(lines=[(5, 6)], names=['total'])
+
+        values = source.get_values()
+
+        self.assertEqual(list(values), [6])
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, LiveSource, 'a = 1', backend='bytecode')
+
+
+class ChangesTestCase(unittest.TestCase):
+    def test_changes(self):
+        source = LiveSource('a = 1\nb = [a]\nc = 3\n')
+        first = source.get_changes()
+        source.update('a = 1\nb = [a, 2]\n')
+
+        delta = source.get_changes()
+
+        self.assertEqual((first.generation, first.base), (1, 0))
+        self.assertEqual(sorted(first.changed), [1, 2, 3])
+        self.assertEqual((delta.generation, delta.base), (2, 1))
+        self.assertEqual(delta.changed, {2: [('b', [1, 2])]})
+        self.assertEqual(delta.removed, [3])
+
+    def test_type_change(self):
+        source = LiveSource('a = 1\n')
+        source.get_changes()
+        source.update('a = True\n')
+
+        self.assertEqual(source.get_changes().changed, {1: [('a', True)]})
+
+    def test_since(self):
+        source = LiveSource('a = 1\n')
+        source.get_changes()
+
+        self.assertEqual(source.get_changes(since=1).changed, {})
+        self.assertEqual(source.get_changes(since=1).changed,
+                         {1: [('a', 1)]})
+        self.assertEqual(source.get_changes(since=0).base, 0)
+
+
+class PartialTestCase(unittest.TestCase):
+    def test_unaffected_statements(self):
+        source = LiveSource('data = object()\nitems = [1, 2]\n'
+                            'total = sum(items)\n', partial=True)
+        data = source.get_values()[1][0][1]
+        source.update('data = object()\nitems = [1, 2]\ntotal = max(items)\n')
+
+        values = source.get_values()
+
+        self.assertIs(values[1][0][1], data)
+        self.assertEqual(list(values[3]), [('total', 2)])
+
+    def test_dependent_statements(self):
+        source = LiveSource('items = [1, 2]\ndata = object()\n'
+                            'total = sum(items)\n', partial=True)
+        data = source.get_values()[2][0][1]
+        source.update('items = [3]\ndata = object()\ntotal = sum(items)\n')
+
+        values = source.get_values()
+
+        self.assertIs(values[2][0][1], data)
+        self.assertEqual(list(values[3]), [('total', 3)])
+
+    def test_mutation(self):
+        source = LiveSource('data = [1]\ndata.append(2)\nn = len(data)\n',
+                            partial=True)
+        source.get_values()
+        source.update('data = [1]\ndata.append(2)\nn = len(data) * 2\n')
+
+        values = source.get_values()
+
+        self.assertEqual(list(values[3]), [('n', 4)])
+
+    def test_removed_name(self):
+        source = LiveSource('x = 1\ny = x\n', partial=True)
+        source.get_values()
+        source.partial = False
+        source.update('y = x\n')
+
+        self.assertNotIn('x', source.lst.globals)
+        self.assertRaises(NameError, source.get_values)
+
+    def test_released_probes(self):
+        lines = ['a{0} = {0}'.format(index) for index in range(10)]
+        source = LiveSource('\n'.join(lines) + '\n', partial=True)
+        source.get_values()
+        for edit in range(100):
+            lines[edit % 10] = 'a{0} = {1}'.format(edit % 10, edit)
+            source.update('\n'.join(lines) + '\n')
+
+        values = source.get_values()
+
+        self.assertLessEqual(len(source.lst.probes), 20)
+        self.assertEqual(list(values[10]), [('a9', 99)])
+
+    def test_class_body(self):
+        code = d("""\
+                    d = 1
+                    class K:
+                        v = d
+                    r = K.v
+                 """)
+        source = LiveSource(code, partial=True)
+        source.get_values()
+        source.update(code.replace('d = 1', 'd = 2'))
+
+        values = source.get_values()
+
+        self.assertEqual(list(values[4]), [('r', 2)])
+
+        source.update(code.replace('d = 1\n', ''))
+
+        self.assertRaises(NameError, source.get_values)
+
+    def test_function_values(self):
+        code = d("""\
+                    def f(x):
+                        y = x + 1
+                        return y
+                    a = f(1)
+                    b = f(2)
+                 """)
+        source = LiveSource(code, partial=True)
+        source.get_values()
+        source.update(code.replace('f(2)', 'f(3)'))
+
+        values = source.get_values()
+
+        self.assertEqual([value for name, value in values[2]], [2, 4])
+        self.assertEqual(list(values[5]), [('b', 4)])
+
+    def test_error(self):
+        source = LiveSource('a = 1\nb = a / 0\nc = 3\n', partial=True)
+        self.assertRaises(ZeroDivisionError, source.get_values)
+        source.update('a = 1\nb = a / 1\nc = 3\n')
+
+        values = source.get_values()
+
+        self.assertEqual(dict((lineno, list(values[lineno]))
+                              for lineno in values),
+                         {1: [('a', 1)], 2: [('b', 1.0)], 3: [('c', 3)]})
+
+
+class StatisticsTestCase(unittest.TestCase):
+    code = d("""\
+                def f(x):
+                    return x * 2
+                total = 0
+                for i in range(10):
+                    total += f(i)
+             """)
+
+    def hits(self, statistics):
+        return dict((site['line'], (site['hits'], site['recorded']))
+                    for site in statistics.sites())
+
+    def test_hits(self):
+        source = LiveSource(self.code, statistics=True)
+
+        values = source.get_values()
+        statistics = source.get_statistics()
+
+        self.assertEqual(list(values[3]), [('total', 0)])
+        self.assertEqual(self.hits(statistics),
+                         {1: (10, 10), 2: (10, 10), 3: (1, 1), 4: (10, 10),
+                          5: (10, 10)})
+        self.assertGreater(statistics.run_time, 0.0)
+        self.assertLessEqual(statistics.user_time, statistics.run_time)
+
+    def test_policy(self):
+        source = LiveSource(self.code, policy=Every(5), statistics=True)
+
+        source.get_values()
+
+        self.assertEqual(self.hits(source.get_statistics())[4], (10, 2))
+
+    def test_disabled(self):
+        source = LiveSource(self.code)
+
+        source.get_values()
+
+        self.assertIsNone(source.get_statistics())
+
+
+class ProfileTestCase(unittest.TestCase):
+    def test_counts(self):
+        code = d("""\
+                    def f(x):
+                        return x * 2
+                    total = 0
+                    for i in range(10):
+                        if i % 2: total += f(i)
+                 """)
+        source = LiveSource(code)
+
+        profile = source.get_profile()
+
+        self.assertEqual(dict((lineno, count)
+                              for lineno, (count, _) in profile.items()),
+                         {1: 1, 2: 5, 3: 1, 4: 1, 5: 10})
+        self.assertGreaterEqual(profile[4][1], profile[5][1])
+        self.assertGreaterEqual(profile.run_time, profile[4][1])
+
+    def test_exception(self):
+        source = LiveSource('a = 1\nb = a / 0\n')
+
+        self.assertRaises(ZeroDivisionError, source.get_profile)
+
+    def test_expressions_with_body(self):
+        code = d("""\
+                    @lambda f: f
+                    class A(int if True else object):
+                        pass
+                 """)
+
+        profile = LiveSource(code).get_profile()
+
+        self.assertEqual(profile[2][0], 1)
+
+    def test_nested_blocks(self):
+        lines = []
+        for level in range(17):
+            lines.append('    ' * level + 'for i{0} in [1]:'.format(level))
+        lines.append('    ' * 17 + 'try:')
+        lines.append('    ' * 18 + 'x = 1')
+        lines.append('    ' * 17 + 'except ValueError:')
+        lines.append('    ' * 18 + 'pass')
+
+        profile = LiveSource('\n'.join(lines) + '\n').get_profile()
+
+        self.assertEqual(profile[1][0], 1)
+
+    def test_cancel(self):
+        source = LiveSource('while True:\n    pass\n')
+        thread = threading.Timer(0.05, source.cancel)
+        thread.start()
+
+        self.assertRaises(EvaluationCancelled, source.get_profile)
+        thread.join()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+ForkServer tests.
+
+"""
+import collections
+import os
+from textwrap import dedent as d
+import threading
+import unittest
+
+from livesource import (EvaluationCancelled, EvaluationError,
+                        EvaluationTimeout, ForkServer, LiveSource)
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork()')
+class ForkServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = ForkServer(processes=2, timeout=5)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_evaluate(self):
+        code = d("""\
+                    a = 1
+                    b = (x for x in [])
+                 """)
+
+        values = self.server.evaluate(code)
+
+        self.assertEqual(values[1], collections.deque([('a', 1)]))
+        self.assertTrue(values[2][0][1].startswith('<generator object'))
+
+    def test_isolation(self):
+        code = d("""\
+                    import os
+                    os.environ['LIVESOURCE_TEST'] = '1'
+                    pid = os.getpid()
+                 """)
+
+        first = self.server.evaluate(code)
+        values = self.server.evaluate("import os\n"
+                                      "var = os.environ.get('LIVESOURCE_TEST')"
+                                      "\n")
+
+        self.assertEqual(values[2], collections.deque([('var', None)]))
+        self.assertNotEqual(first[3][0][1], os.getpid())
+
+    def test_error(self):
+        self.assertRaises(EvaluationError, self.server.evaluate, 'a = 1 / 0')
+
+        self.assertEqual(len(self.server.evaluate('a = 1')), 1)
+
+    def test_died(self):
+        code = d("""\
+                    import os
+                    os._exit(3)
+                 """)
+
+        self.assertRaises(EvaluationError, self.server.evaluate, code)
+
+        self.assertEqual(len(self.server.evaluate('a = 1')), 1)
+
+    def test_timeout(self):
+        self.server.timeout = 0.5
+        code = d("""\
+                    while True:
+                        pass
+                 """)
+
+        self.assertRaises(EvaluationTimeout, self.server.evaluate, code)
+
+        self.assertEqual(len(self.server.evaluate('a = 1')), 1)
+
+    def test_cancel(self):
+        cancelled = threading.Event()
+        timer = threading.Timer(0.2, cancelled.set)
+        timer.start()
+        code = d("""\
+                    while True:
+                        pass
+                 """)
+
+        self.assertRaises(EvaluationCancelled, self.server.evaluate, code,
+                          cancelled=cancelled)
+        timer.join()
+
+        self.assertEqual(len(self.server.evaluate('a = 1')), 1)
+
+    def test_memory_limit(self):
+        server = ForkServer(processes=1, timeout=5, memory_limit=2 ** 32)
+        self.addCleanup(server.close)
+        code = d("""\
+                    import resource
+                    limit = resource.getrlimit(resource.RLIMIT_AS)[0]
+                 """)
+
+        values = server.evaluate(code)
+
+        self.assertEqual(values[2], collections.deque([('limit', 2 ** 32)]))
+
+    def test_preload(self):
+        server = ForkServer(processes=1, timeout=5, preload=['decimal'])
+        self.addCleanup(server.close)
+        code = d("""\
+                    import sys
+                    loaded = 'decimal' in sys.modules
+                 """)
+
+        values = server.evaluate(code)
+
+        self.assertEqual(values[2], collections.deque([('loaded', True)]))
+
+    def test_preload_error(self):
+        server = ForkServer(processes=1, timeout=5,
+                            preload=['livesource_missing_module'])
+        self.addCleanup(server.close)
+
+        self.assertRaises(EvaluationError, server.evaluate, 'a = 1')
+        self.assertRaises(EvaluationError, server.evaluate, 'a = 1')
+
+    def test_submit(self):
+        futures = [self.server.submit('a = {0}'.format(index))
+                   for index in range(4)]
+
+        results = [future.result()[1][0][1] for future in futures]
+
+        self.assertEqual(results, [0, 1, 2, 3])
+
+    def test_profile(self):
+        source = LiveSource('a = 1\nfor i in range(3):\n    a += i\n',
+                            executor=self.server)
+
+        profile = source.get_profile()
+
+        self.assertEqual(dict((lineno, count)
+                              for lineno, (count, _) in profile.items()),
+                         {1: 1, 2: 1, 3: 3})
+
+    def test_live_source(self):
+        source = LiveSource('a = 1\nb = 2\n', executor=self.server)
+        source.select(names=['b'])
+
+        values = source.get_values()
+
+        self.assertEqual(list(values), [2])
+
+    def test_close(self):
+        self.server.close()
+
+        self.assertFalse(self.server.process.is_alive())
+        self.assertFalse(os.path.exists(self.server.address))
+        self.assertRaises(ValueError, self.server.evaluate, 'a = 1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ Parser tests.
 
 """
 import ast
+import sys
 from textwrap import dedent as d
 import unittest
 
@@ -17,7 +18,7 @@ class AssignTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     a = 1
-                    __livesource_listing[1].append(('a', a, ))
+                    _livesource_record[0](a)
                    """)
 
         parsed_tree = ast.dump(LiveSource(code)._parse())
@@ -33,11 +34,11 @@ class AssignTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     a = 1
-                    __livesource_listing[1].append(('a', a, ))
+                    _livesource_record[0](a)
                     b = 2
-                    __livesource_listing[2].append(('b', b, ))
+                    _livesource_record[1](b)
                     c = 3
-                    __livesource_listing[3].append(('c', c, ))
+                    _livesource_record[2](c)
                    """)
 
         parsed_tree = ast.dump(LiveSource(code)._parse())
@@ -51,15 +52,18 @@ class AssignTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     a, b, c = 1, 2, 3
-                    __livesource_listing[1].append(('a', a, ))
-                    __livesource_listing[1].append(('b', b, ))
-                    __livesource_listing[1].append(('c', c, ))
+                    _livesource_record[0]((a, b, c))
                    """)
 
-        parsed_tree = ast.dump(LiveSource(code)._parse())
+        source = LiveSource(code)
+        parsed_tree = ast.dump(source._parse())
         expected_tree = ast.dump(ast.parse(result))
 
         self.assertEqual(parsed_tree, expected_tree)
+        self.assertEqual(source.lst.probes, [(1, 'a', False),
+                                             (1, 'b', False),
+                                             (1, 'c', False)])
+        self.assertEqual(source.lst.batches, {0: (0, 1, 2)})
 
     def test_attribute(self):
         code = d("""\
@@ -68,9 +72,9 @@ class AssignTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     a.x = (2,)
-                    __livesource_listing[1].append(('a.x', a.x, ))
+                    _livesource_record[0](a.x)
                     a.x.y = [1, 2]
-                    __livesource_listing[2].append(('a.x.y', a.x.y, ))
+                    _livesource_record[1](a.x.y)
                    """)
 
         parsed_tree = ast.dump(LiveSource(code)._parse())
@@ -84,8 +88,7 @@ class AssignTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     a = b = 1
-                    __livesource_listing[1].append(('a', a, ))
-                    __livesource_listing[1].append(('b', b, ))
+                    _livesource_record[0]((a, b))
                    """)
 
         parsed_tree = ast.dump(LiveSource(code)._parse())
@@ -99,8 +102,7 @@ class AssignTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     a, b = b, a
-                    __livesource_listing[1].append(('a', a, ))
-                    __livesource_listing[1].append(('b', b, ))
+                    _livesource_record[0]((a, b))
                    """)
 
         parsed_tree = ast.dump(LiveSource(code)._parse())
@@ -116,7 +118,7 @@ class AugAssignTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     a += 1
-                    __livesource_listing[1].append(('a', a, ))
+                    _livesource_record[0](a)
                    """)
 
         parsed_tree = ast.dump(LiveSource(code)._parse())
@@ -132,11 +134,11 @@ class AugAssignTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     a += 1
-                    __livesource_listing[1].append(('a', a, ))
+                    _livesource_record[0](a)
                     b -= 2
-                    __livesource_listing[2].append(('b', b, ))
+                    _livesource_record[1](b)
                     c *= 3
-                    __livesource_listing[3].append(('c', c, ))
+                    _livesource_record[2](c)
                    """)
 
         parsed_tree = ast.dump(LiveSource(code)._parse())
@@ -151,9 +153,9 @@ class AugAssignTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     a.x *= 2
-                    __livesource_listing[1].append(('a.x', a.x, ))
+                    _livesource_record[0](a.x)
                     a.x.y /= 2
-                    __livesource_listing[2].append(('a.x.y', a.x.y, ))
+                    _livesource_record[1](a.x.y)
                    """)
 
         parsed_tree = ast.dump(LiveSource(code)._parse())
@@ -170,16 +172,19 @@ class IfTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     if x:
-                        __livesource_listing[1].append((None, x,))
+                        _livesource_record[0](x)
                         pass
                  """)
 
-        parsed_tree = ast.dump(LiveSource(code)._parse())
+        source = LiveSource(code)
+        parsed_tree = ast.dump(source._parse())
         expected_tree = ast.dump(ast.parse(result))
 
         self.assertEqual(parsed_tree, expected_tree)
+        self.assertEqual(source.lst.probes, [(1, None, False)])
 
 
+@unittest.skipIf(sys.version_info[0] == 3, 'Not supported in Python 3')
 class PrintTestCase(unittest.TestCase):
     def test_trivial(self):
         code = d("""\
@@ -188,9 +193,9 @@ class PrintTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     print "aaa"
-                    __livesource_listing[1].append((None, " ".join(("aaa",)),))
+                    _livesource_record[0](" ".join(("aaa",)))
                     print "bbb"
-                    __livesource_listing[2].append((None, " ".join(("bbb",)),))
+                    _livesource_record[1](" ".join(("bbb",)))
 
                  """)
 
@@ -205,7 +210,7 @@ class PrintTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     print "a", "b", "c"
-                    __livesource_listing[1].append((None, " ".join(("a", "b", "c")),))
+                    _livesource_record[0](" ".join(("a", "b", "c")))
 
                  """)
 
@@ -220,7 +225,7 @@ class PrintTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     print "a" + "b"
-                    __livesource_listing[1].append((None, " ".join(("a" + "b",)),))
+                    _livesource_record[0](" ".join(("a" + "b",)))
 
                  """)
 
@@ -235,7 +240,7 @@ class PrintTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     print "a{}".format("b")
-                    __livesource_listing[1].append((None, " ".join(("a{}".format("b"),)),))
+                    _livesource_record[0](" ".join(("a{}".format("b"),)))
 
                  """)
 
@@ -253,12 +258,370 @@ class WhileTestCase(unittest.TestCase):
                  """)
         result = d("""\
                     while x:
-                        __livesource_listing[1].append((None, x,))
+                        _livesource_record[0](x)
+                        pass
+
+                 """)
+
+        parsed_tree = ast.dump(LiveSource(code)._parse())
+        expected_tree = ast.dump(ast.parse(result))
+
+        self.assertEqual(parsed_tree, expected_tree)
+
+
+class ForTestCase(unittest.TestCase):
+    def test_trivial(self):
+        code = d("""\
+                    for x in y:
+                        pass
+                 """)
+        result = d("""\
+                    for x in y:
+                        _livesource_record[0](x)
+                        pass
+                 """)
+
+        parsed_tree = ast.dump(LiveSource(code)._parse())
+        expected_tree = ast.dump(ast.parse(result))
+
+        self.assertEqual(parsed_tree, expected_tree)
+
+    def test_else(self):
+        code = d("""\
+                    for x in y:
+                        pass
+                    else:
+                        a = 1
+                 """)
+        result = d("""\
+                    for x in y:
+                        _livesource_record[0](x)
+                        pass
+                    else:
+                        a = 1
+                        _livesource_record[1](a)
+                 """)
+
+        parsed_tree = ast.dump(LiveSource(code)._parse())
+        expected_tree = ast.dump(ast.parse(result))
+
+        self.assertEqual(parsed_tree, expected_tree)
+
+
+class FunctionTestCase(unittest.TestCase):
+    def test_trivial(self):
+        code = d("""\
+                    def f(x):
+                        \"\"\"Docstring.\"\"\"
+                        y = x
+                        return y
+                 """)
+        result = d("""\
+                    def f(x):
+                        \"\"\"Docstring.\"\"\"
+                        _livesource_call = _livesource_calls()
+                        _livesource_r = _livesource_record
+                        _livesource_r[0]((_livesource_call, x))
+                        y = x
+                        _livesource_r[1]((_livesource_call, y))
+                        _livesource_r[2]((_livesource_call, y))
+                        return y
+                 """)
+
+        source = LiveSource(code)
+        parsed_tree = ast.dump(source._parse())
+        expected_tree = ast.dump(ast.parse(result))
+
+        self.assertEqual(parsed_tree, expected_tree)
+        self.assertEqual(source.lst.probes, [(1, 'x', True),
+                                             (3, 'y', True),
+                                             (4, 'y', True)])
+
+    def test_batched(self):
+        code = d("""\
+                    def f(x, y):
+                        a, b = x, y
+                 """)
+        result = d("""\
+                    def f(x, y):
+                        _livesource_call = _livesource_calls()
+                        _livesource_r = _livesource_record
+                        _livesource_r[0]((_livesource_call, x, y))
+                        a, b = x, y
+                        _livesource_r[2]((_livesource_call, a, b))
+                 """)
+
+        source = LiveSource(code)
+        parsed_tree = ast.dump(source._parse())
+        expected_tree = ast.dump(ast.parse(result))
+
+        self.assertEqual(parsed_tree, expected_tree)
+        self.assertEqual(source.lst.batches, {0: (0, 1), 2: (2, 3)})
+
+    def test_gated(self):
+        code = d("""\
+                    def f(x):
+                        pass
+                 """)
+        result = d("""\
+                    def f(x):
+                        _livesource_call = _livesource_calls()
+                        _livesource_r = _livesource_record
+                        _livesource_g = _livesource_gate
+                        _livesource_g[0]() and _livesource_r[0]((
+                            _livesource_call, x))
+                        pass
+                 """)
+
+        source = LiveSource(code)
+        source.lst.gated = True
+        parsed_tree = ast.dump(source._parse())
+        expected_tree = ast.dump(ast.parse(result))
+
+        self.assertEqual(parsed_tree, expected_tree)
+
+    def test_not_watched(self):
+        code = d("""\
+                    def f(*args, **kwargs):
+                        pass
+                 """)
+
+        source = LiveSource(code)
+        source.select(kinds=['Name'])
+        parsed_tree = ast.dump(source._parse())
+        expected_tree = ast.dump(ast.parse(code))
+
+        self.assertEqual(parsed_tree, expected_tree)
+
+    def test_method(self):
+        code = d("""\
+                    class A(object):
+                        b = 1
+                        def c(self):
+                            pass
+                 """)
+        result = d("""\
+                    class A(object):
+                        b = 1
+                        _livesource_record[0](b)
+                        def c(self):
+                            _livesource_call = _livesource_calls()
+                            _livesource_r = _livesource_record
+                            _livesource_r[1]((_livesource_call, self))
+                            pass
+                 """)
+
+        parsed_tree = ast.dump(LiveSource(code)._parse())
+        expected_tree = ast.dump(ast.parse(result))
+
+        self.assertEqual(parsed_tree, expected_tree)
+
+
+class WithTestCase(unittest.TestCase):
+    def test_trivial(self):
+        code = d("""\
+                    with x as y:
+                        pass
+                 """)
+        result = d("""\
+                    with x as y:
+                        _livesource_record[0](y)
+                        pass
+                 """)
+
+        parsed_tree = ast.dump(LiveSource(code)._parse())
+        expected_tree = ast.dump(ast.parse(result))
+
+        self.assertEqual(parsed_tree, expected_tree)
+
+
+@unittest.skipIf(sys.version_info[0] == 2, 'Not supported in Python 2')
+class TryTestCase(unittest.TestCase):
+    def test_trivial(self):
+        code = d("""\
+                    try:
+                        a = 1
+                    except Exception as e:
                         pass
+                    finally:
+                        b = 2
+                 """)
+        result = d("""\
+                    try:
+                        a = 1
+                        _livesource_record[0](a)
+                    except Exception as e:
+                        _livesource_record[1](e)
+                        pass
+                    finally:
+                        b = 2
+                        _livesource_record[2](b)
+                 """)
+
+        parsed_tree = ast.dump(LiveSource(code)._parse())
+        expected_tree = ast.dump(ast.parse(result))
 
+        self.assertEqual(parsed_tree, expected_tree)
+
+
+@unittest.skipIf(sys.version_info < (3, 10), 'Not supported before 3.10')
+class MatchTestCase(unittest.TestCase):
+    def test_trivial(self):
+        code = d("""\
+                    match x:
+                        case 1:
+                            a = 1
+                 """)
+        result = d("""\
+                    match x:
+                        case 1:
+                            a = 1
+                            _livesource_record[0](a)
+                 """)
+
+        parsed_tree = ast.dump(LiveSource(code)._parse())
+        expected_tree = ast.dump(ast.parse(result))
+
+        self.assertEqual(parsed_tree, expected_tree)
+
+
+class ComprehensionTestCase(unittest.TestCase):
+    def test_trivial(self):
+        code = d("""\
+                    a = [x for x in y if x]
+                 """)
+        result = d("""\
+                    a = [x for x in y if x if _livesource_record[1](x) or True]
+                    _livesource_record[0](a)
                  """)
 
         parsed_tree = ast.dump(LiveSource(code)._parse())
         expected_tree = ast.dump(ast.parse(result))
 
         self.assertEqual(parsed_tree, expected_tree)
+
+    def test_expression(self):
+        code = d("""\
+                    f(x for x in y)
+                 """)
+
+        source = LiveSource(code)
+        source.select(kinds=['comprehension'])
+        parsed_tree = ast.dump(source._parse())
+        expected_tree = ast.dump(ast.parse(
+            'f(x for x in y if _livesource_record[0](x) or True)'))
+
+        self.assertEqual(parsed_tree, expected_tree)
+
+
+class UpdateTestCase(unittest.TestCase):
+    code = d("""\
+                a = 1
+                if a:
+                    b = 2
+
+                c = 3
+                while c:
+                    c -= 1
+             """)
+
+    def assertUpdated(self, code):
+        source = LiveSource(self.code)
+        source._parse()
+        source.update(code)
+        expected = LiveSource(code)
+        expected._parse()
+
+        probes = sorted(probe for probe in source.lst.probes if probe)
+        expected_probes = sorted(expected.lst.probes)
+
+        self.assertEqual(probes, expected_probes)
+        self.assertEqual(dict(source.get_values()),
+                         dict(expected.get_values()))
+
+    def test_change(self):
+        self.assertUpdated(self.code.replace('b = 2', 'b = 4'))
+
+    def test_insert(self):
+        self.assertUpdated(self.code.replace('c = 3', 'x = 0\nc = 3'))
+
+    def test_insert_indented(self):
+        self.assertUpdated(self.code.replace('\n\n', '\n    x = 0\n'))
+
+    def test_remove(self):
+        self.assertUpdated(self.code.replace('if a:\n    b = 2\n', ''))
+
+    def test_append(self):
+        self.assertUpdated(self.code + 'd = c\n')
+
+    def test_line_numbers(self):
+        code = 'x = 0\n' + self.code
+        source = LiveSource(self.code)
+        source._parse()
+        source.update(code)
+
+        values = source.get_values()
+
+        self.assertEqual(list(values[1]), [('x', 0)])
+        self.assertEqual(list(values[8]), [('c', 2), ('c', 1), ('c', 0)])
+
+    def test_invalid(self):
+        source = LiveSource(self.code)
+        source._parse()
+        source.update(self.code.replace('c = 3', 'c = (3'))
+
+        self.assertIsNone(source._tree)
+        self.assertRaises(SyntaxError, source.get_values)
+
+
+class SelectTestCase(unittest.TestCase):
+    code = d("""\
+                a = 1
+                b.x = 2
+                if a:
+                    c = 3
+             """)
+
+    def assertSelected(self, result, **selection):
+        source = LiveSource(self.code)
+        source.select(**selection)
+
+        parsed_tree = ast.dump(source._parse())
+        expected_tree = ast.dump(ast.parse(result))
+
+        self.assertEqual(parsed_tree, expected_tree)
+
+    def test_lines(self):
+        result = d("""\
+                    a = 1
+                    b.x = 2
+                    _livesource_record[0](b.x)
+                    if a:
+                        _livesource_record[1](a)
+                        c = 3
+                   """)
+
+        self.assertSelected(result, lines=[(2, 3)])
+
+    def test_names(self):
+        result = d("""\
+                    a = 1
+                    b.x = 2
+                    _livesource_record[0](b.x)
+                    if a:
+                        c = 3
+                        _livesource_record[1](c)
+                   """)
+
+        self.assertSelected(result, names=['b', 'c'])
+
+    def test_kinds(self):
+        result = d("""\
+                    a = 1
+                    b.x = 2
+                    if a:
+                        _livesource_record[0](a)
+                        c = 3
+                   """)
+
+        self.assertSelected(result, kinds=['If'])
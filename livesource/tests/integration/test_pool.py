@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+WorkerPool tests.
+
+"""
+import collections
+from textwrap import dedent as d
+import threading
+import unittest
+
+from livesource import (EvaluationCancelled, EvaluationError,
+                        EvaluationTimeout, LiveSource, Snapshots, WorkerPool)
+
+
+class WorkerPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(processes=2, timeout=5)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_evaluate(self):
+        code = d("""\
+                    a = 1
+                    b = (x for x in [])
+                 """)
+
+        values = self.pool.evaluate(code)
+
+        self.assertEqual(values[1], collections.deque([('a', 1)]))
+        self.assertTrue(values[2][0][1].startswith('<generator object'))
+
+    def test_error(self):
+        self.assertRaises(EvaluationError, self.pool.evaluate, 'a = 1 / 0')
+
+        self.assertEqual(len(self.pool.evaluate('a = 1')), 1)
+
+    def test_timeout(self):
+        self.pool.timeout = 0.5
+        code = d("""\
+                    while True:
+                        pass
+                 """)
+
+        self.assertRaises(EvaluationTimeout, self.pool.evaluate, code)
+
+        self.assertEqual(len(self.pool.evaluate('a = 1')), 1)
+
+    def test_cancel(self):
+        cancelled = threading.Event()
+        timer = threading.Timer(0.2, cancelled.set)
+        timer.start()
+        code = d("""\
+                    while True:
+                        pass
+                 """)
+
+        self.assertRaises(EvaluationCancelled, self.pool.evaluate, code,
+                          cancelled=cancelled)
+        timer.join()
+
+        self.assertEqual(len(self.pool.evaluate('a = 1')), 1)
+
+    def test_died(self):
+        code = d("""\
+                    import os
+                    os._exit(3)
+                 """)
+
+        with self.assertRaises(EvaluationError) as context:
+            self.pool.evaluate(code)
+
+        self.assertIn('exit code: 3', str(context.exception))
+        self.assertEqual(len(self.pool.evaluate('a = 1')), 1)
+
+    def test_memory_limit(self):
+        self.pool.memory_limit = 2 ** 32
+        code = d("""\
+                    import resource
+                    limit = resource.getrlimit(resource.RLIMIT_AS)[0]
+                 """)
+
+        values = self.pool.evaluate(code)
+
+        self.assertEqual(values[2], collections.deque([('limit', 2 ** 32)]))
+
+    def test_preload(self):
+        pool = WorkerPool(processes=1, timeout=5, preload=['decimal'])
+        self.addCleanup(pool.close)
+        code = d("""\
+                    import sys
+                    loaded = 'decimal' in sys.modules
+                 """)
+
+        values = pool.evaluate(code)
+
+        self.assertEqual(values[2], collections.deque([('loaded', True)]))
+
+    def test_preload_error(self):
+        pool = WorkerPool(processes=1, timeout=5,
+                          preload=['livesource_missing_module'])
+        self.addCleanup(pool.close)
+
+        self.assertRaises(EvaluationError, pool.evaluate, 'a = 1')
+        self.assertRaises(EvaluationError, pool.evaluate, 'a = 1')
+
+    def test_submit(self):
+        futures = [self.pool.submit('a = {0}'.format(index))
+                   for index in range(4)]
+
+        results = [future.result()[1][0][1] for future in futures]
+
+        self.assertEqual(results, [0, 1, 2, 3])
+
+    def test_profile(self):
+        source = LiveSource('a = 1\nfor i in range(3):\n    a += i\n',
+                            executor=self.pool)
+
+        profile = source.get_profile()
+
+        self.assertEqual(dict((lineno, count)
+                              for lineno, (count, _) in profile.items()),
+                         {1: 1, 2: 1, 3: 3})
+
+    def test_live_source(self):
+        source = LiveSource('a = 1\nb = 2\n', executor=self.pool)
+        source.select(names=['b'])
+
+        values = source.get_values()
+
+        self.assertEqual(list(values), [2])
+
+    def test_snapshots(self):
+        source = LiveSource('a = list(range(100))\n', executor=self.pool,
+                            snapshots=Snapshots(max_items=2))
+
+        values = source.get_values()
+
+        self.assertEqual(repr(values[1][0][1]),
+                         '<list of length 100: [0, 1, ...]>')
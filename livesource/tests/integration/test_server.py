@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Server tests.
+
+"""
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from livesource import WorkerPool
+from livesource.server import Server, serve_socket
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'requires Unix sockets')
+class SocketTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'livesource.sock')
+        self.pool = WorkerPool(processes=1, timeout=5)
+        self.thread = threading.Thread(target=serve_socket,
+                                       args=(Server(self.pool), self.path))
+        self.thread.daemon = True
+        self.thread.start()
+        for _ in range(100):
+            if os.path.exists(self.path):
+                break
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.directory)
+
+    def test_session(self):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(self.path)
+        stream = client.makefile('rwb')
+        requests = [('update', {'uri': 'doc', 'code': 'a = 1\n'}),
+                    ('get_values', {'uri': 'doc'}),
+                    ('update', {'uri': 'doc', 'code': 'a = 2\n'}),
+                    ('get_values', {'uri': 'doc'}),
+                    ('shutdown', {})]
+        responses = []
+        for request_id, (method, params) in enumerate(requests):
+            stream.write(json.dumps({'jsonrpc': '2.0', 'id': request_id,
+                                     'method': method,
+                                     'params': params}).encode('utf-8'))
+            stream.write(b'\n')
+            stream.flush()
+            responses.append(json.loads(stream.readline().decode('utf-8')))
+        client.close()
+        self.thread.join(5)
+
+        self.assertEqual(responses[1]['result']['changed'],
+                         {'1': [['a', '1']]})
+        self.assertEqual(responses[3]['result']['changed'],
+                         {'1': [['a', '2']]})
+        self.assertFalse(self.thread.is_alive())
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_not_socket(self):
+        path = os.path.join(self.directory, 'notes.txt')
+        with open(path, 'w') as notes:
+            notes.write('keep me')
+
+        self.assertRaises(ValueError, serve_socket, Server(), path)
+        with open(path) as notes:
+            self.assertEqual(notes.read(), 'keep me')
+
+    def test_stale_socket(self):
+        path = os.path.join(self.directory, 'stale.sock')
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        thread = threading.Thread(target=serve_socket, args=(Server(), path))
+        thread.daemon = True
+        thread.start()
+
+        for _ in range(100):
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                client.connect(path)
+                break
+            except socket.error:
+                client.close()
+                time.sleep(0.01)
+        client.sendall(json.dumps({'jsonrpc': '2.0', 'id': 1,
+                                   'method': 'shutdown'}).encode('utf-8') +
+                       b'\n')
+        client.makefile('rb').readline()
+        client.close()
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+BinaryWriter tests.
+
+"""
+import io
+import unittest
+
+from livesource.export import MAGIC, BinaryWriter, read_binary
+from livesource.snapshot import Summary
+
+
+class BinaryWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.BytesIO()
+        self.writer = BinaryWriter(self.stream)
+
+    def read(self, chunk_size=2 ** 16):
+        self.stream.seek(0)
+        return list(read_binary(self.stream, chunk_size))
+
+    def test_round_trip(self):
+        events = [(1, 'a', None), (1, 'b', True), (2, 'a', False),
+                  (3, 'c', 0), (3, 'c', -1), (3, 'c', 2 ** 70),
+                  (4, 'd', 1.5), (5, u'ż', u'zaż'), (6, 'e', b'\x00\xff')]
+
+        self.assertEqual(self.writer.write_all(events), len(events))
+
+        self.assertEqual(self.read(), events)
+        self.assertEqual(self.read(chunk_size=1), events)
+
+    def test_no_name(self):
+        events = [(1, None, True), (2, 'a', 1), (3, None, False)]
+
+        self.writer.write_all(events)
+
+        self.assertEqual(self.read(), events)
+        self.assertEqual(self.read(chunk_size=1), events)
+
+    def test_other_values(self):
+        self.writer.write_all([(1, 'a', [1, 2]), (2, 'b', object())])
+
+        (_, _, first), (_, _, second) = self.read()
+
+        self.assertIsInstance(first, Summary)
+        self.assertEqual(first.type_name, 'list')
+        self.assertEqual(repr(first), '[1, 2]')
+        self.assertEqual(second.type_name, 'object')
+
+    def test_string_table(self):
+        self.writer.write_all((1, 'long_variable_name', i) for i in range(100))
+
+        self.assertEqual(self.stream.getvalue().count(b'long_variable_name'),
+                         1)
+
+    def test_buffer(self):
+        self.writer.buffer_size = 10
+
+        self.writer.write(1, 'a', 'x' * 20)
+
+        self.assertTrue(self.stream.getvalue().startswith(MAGIC))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, list, read_binary(io.BytesIO(b'data')))
+
+        self.writer.write_all([(1, 'a', 'text')])
+        data = self.stream.getvalue()[:-1]
+
+        self.assertRaises(ValueError, list, read_binary(io.BytesIO(data)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+CodeCache tests.
+
+"""
+import unittest
+
+from livesource import CodeCache
+
+
+class CodeCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = CodeCache(maxsize=2)
+
+    def test_key(self):
+        result = self.cache.key('a = 1', 10)
+
+        self.assertEqual(result, self.cache.key('a = 1', 10))
+        self.assertNotEqual(result, self.cache.key('a = 1', 5))
+        self.assertNotEqual(result, self.cache.key('a = 2', 10))
+
+    def test_get(self):
+        self.cache.set('key', 'code')
+
+        result = self.cache.get('key')
+
+        self.assertEqual(result, 'code')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 0))
+
+    def test_get_missing(self):
+        result = self.cache.get('key')
+
+        self.assertIsNone(result)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+    def test_set_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+
+        self.cache.set('c', 3)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+
+    def test_clear(self):
+        self.cache.set('a', 1)
+        self.cache.get('a')
+
+        self.cache.clear()
+
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Dataflow tests.
+
+"""
+import ast
+import unittest
+
+from livesource.dataflow import Dataflow, effects
+
+
+def statement(code):
+    return effects(ast.parse(code).body)
+
+
+class EffectsTestCase(unittest.TestCase):
+    def test_assign(self):
+        result = statement('a, b = c + d')
+
+        self.assertEqual(result.binds, set(['a', 'b']))
+        self.assertEqual(result.uses, set(['c', 'd']))
+        self.assertEqual(result.mutates, set())
+        self.assertEqual(result.aliases['a'], set(['c', 'd']))
+
+    def test_mutations(self):
+        self.assertEqual(statement('a.x = 1').mutates, set(['a']))
+        self.assertEqual(statement('a[0] += 1').mutates, set(['a']))
+        self.assertEqual(statement('a.append(b)').mutates, set(['a', 'b']))
+        self.assertEqual(statement('f(a, key=b)').mutates, set(['a', 'b']))
+        self.assertEqual(statement('n = len(a) + a.count(1)').mutates, set())
+
+    def test_function(self):
+        result = statement('def f(x=a):\n    global b\n    b = x + c\n')
+
+        self.assertEqual(result.binds, set(['f']))
+        self.assertEqual(result.uses, set(['a']))
+        self.assertEqual(result.functions['f'], (set(['x', 'c']),
+                                                 set(['b'])))
+
+    def test_class(self):
+        result = statement('class A(B):\n    x = c\n'
+                           '    def m(self):\n        return d\n')
+
+        self.assertEqual(result.binds, set(['A']))
+        self.assertEqual(result.uses, set(['B', 'c']))
+        self.assertEqual(result.functions['A'], (set(['d']), set()))
+
+    def test_probes(self):
+        result = statement('_livesource_record[0](a)')
+
+        self.assertEqual(result.uses, set(['a']))
+        self.assertEqual(result.mutates, set())
+
+    def test_opaque(self):
+        self.assertTrue(statement('from os import *').opaque)
+        self.assertTrue(statement('exec("a = 1")').opaque)
+        self.assertFalse(statement('import os').opaque)
+
+
+class DataflowTestCase(unittest.TestCase):
+    def test_calls(self):
+        dataflow = Dataflow()
+        dataflow.add(statement('def f():\n    g(a)\n'))
+        dataflow.add(statement('def g(x):\n    x.append(b)\n'))
+
+        uses, mutates = dataflow.add(statement('c = f()'))
+
+        self.assertTrue(set(['f', 'g', 'a', 'b']) <= uses)
+        self.assertIn('a', mutates)
+
+    def test_aliases(self):
+        dataflow = Dataflow()
+        dataflow.add(statement('a = []'))
+        dataflow.add(statement('b = a'))
+
+        _, mutates = dataflow.add(statement('b.append(1)'))
+        _, reverse = dataflow.add(statement('a.append(1)'))
+
+        self.assertEqual(mutates, set(['a', 'b']))
+        self.assertEqual(reverse, set(['a', 'b']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+DiskCache tests.
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from livesource import DiskCache
+
+
+class DiskCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = DiskCache(os.path.join(self.path, 'cache'))
+        self.code = compile('a = 1', '<livesource>', 'exec')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_get(self):
+        self.cache.set('key', self.code)
+
+        result = self.cache.get('key')
+
+        self.assertEqual(result, self.code)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 0))
+
+    def test_get_missing(self):
+        result = self.cache.get('key')
+
+        self.assertIsNone(result)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+    def test_get_corrupted(self):
+        self.cache.set('key', self.code)
+        filename = self.cache.filename('key')
+        with open(filename, 'wb') as cache_file:
+            cache_file.write(b'garbage')
+
+        result = self.cache.get('key')
+
+        self.assertIsNone(result)
+        self.assertFalse(os.path.exists(filename))
+
+    def test_set_leaves_no_temporary_files(self):
+        self.cache.set('key', self.code)
+
+        result = os.listdir(self.cache.path)
+
+        self.assertEqual(result,
+                         [os.path.basename(self.cache.filename('key'))])
+
+    def test_clear(self):
+        self.cache.set('key', self.code)
+
+        self.cache.clear()
+
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(os.listdir(self.cache.path), [])
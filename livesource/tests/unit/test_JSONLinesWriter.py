@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+JSONLinesWriter tests.
+
+"""
+import io
+import json
+import unittest
+
+from livesource.export import JSONLinesWriter, events
+
+
+class JSONLinesWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.writer = JSONLinesWriter(self.stream, max_length=5)
+
+    def lines(self):
+        return [json.loads(line)
+                for line in self.stream.getvalue().splitlines()]
+
+    def test_scalars(self):
+        self.writer.write(1, 'a', 1)
+        self.writer.write(2, 'b', u'zaż')
+        self.writer.write(3, 'c', None)
+
+        self.assertEqual(self.lines(),
+                         [{'line': 1, 'name': 'a', 'value': 1},
+                          {'line': 2, 'name': 'b', 'value': u'zaż'},
+                          {'line': 3, 'name': 'c', 'value': None}])
+
+    def test_other_values(self):
+        self.writer.write(1, 'a', list(range(10)))
+        self.writer.write(2, 'b', float('nan'))
+
+        self.assertEqual(self.lines(),
+                         [{'line': 1, 'name': 'a', 'type': 'list',
+                           'repr': '[0, 1...'},
+                          {'line': 2, 'name': 'b', 'type': 'float',
+                           'repr': 'nan'}])
+
+    def test_events(self):
+        listing = {2: [('b', 2)], 1: [('a', 1), ('a', 2)]}
+
+        self.assertEqual(self.writer.write_all(events(listing)), 3)
+        self.assertEqual([(line['line'], line['value'])
+                          for line in self.lines()],
+                         [(1, 1), (1, 2), (2, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
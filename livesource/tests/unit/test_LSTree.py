@@ -4,35 +4,116 @@ LSTree tests.
 
 """
 import ast
-import collections
+import gc
 from mock import MagicMock
 import sys
 import unittest
 
 from livesource import LSTree
+from livesource.livesource import _collector_paused
 
 
 class LSTreeTestCase(unittest.TestCase):
     def setUp(self):
-        max_deep = 10
-        self.lst = LSTree(max_deep)
-        self.listing = collections.defaultdict(
-            lambda: collections.deque(maxlen=max_deep))
+        self.lst = LSTree(max_deep=10)
 
     def test__add_listener(self):
         lineno, var_name, val = 1, 'test_var', 'test_val'
         result = ast.dump(self.lst._add_listener(lineno, var_name, val))
 
         expected = ast.dump(
-            ast.Expr(value=ast.Call(func=ast.Attribute(value=ast.Subscript(
-                value=ast.Name(id='__livesource_listing', ctx=ast.Load()),
-                slice=ast.Index(value=ast.Num(n=lineno)), ctx=ast.Load()),
-                attr='append', ctx=ast.Load()),
-                args=[ast.Tuple(elts=[var_name, val, ], ctx=ast.Load()), ],
-                keywords=[], starargs=None, kwargs=None),
-                lineno=lineno+1, col_offset=-1))
+            ast.Expr(value=ast.Call(func=ast.Subscript(
+                value=ast.Name(id='_livesource_record', ctx=ast.Load()),
+                slice=ast.Index(value=ast.Num(n=0)), ctx=ast.Load()),
+                args=[val], keywords=[], starargs=None, kwargs=None),
+                lineno=lineno+1, col_offset=0))
 
         self.assertEqual(result, expected)
+        self.assertEqual(self.lst.probes, [(lineno, var_name, False)])
+
+    def test__add_listener_gated(self):
+        self.lst.gated = True
+        val = ast.Name(id='test_val', ctx=ast.Load())
+        result = ast.dump(self.lst._add_listener(1, 'test_var', val))
+
+        expected = ast.dump(ast.parse(
+            '_livesource_gate[0]() and _livesource_record[0](test_val)'
+        ).body[0])
+
+        self.assertEqual(result, expected)
+
+    def test__watched(self):
+        self.lst.kinds = frozenset(['Name', 'Attribute'])
+        self.lst.lines = ((1, 2), (5, 5))
+        self.lst.names = frozenset(['a'])
+
+        self.assertTrue(self.lst._watched('Name', 5, 'a'))
+        self.assertTrue(self.lst._watched('Attribute', 1, 'a.x'))
+        self.assertFalse(self.lst._watched('If', 1, None))
+        self.assertFalse(self.lst._watched('Name', 3, 'a'))
+        self.assertFalse(self.lst._watched('Name', 1, 'b'))
+
+    def test_release(self):
+        self.lst.probes = [(1, 'a', False), (2, 'b', False)]
+        nodes = [self.lst._add_listener(3, 'c', ast.Name(id='c',
+                                                         ctx=ast.Load()))]
+
+        self.lst.release(nodes)
+
+        self.assertEqual(self.lst.probes,
+                         [(1, 'a', False), (2, 'b', False), None])
+
+    def test__batched(self):
+        listeners = [self.lst._add_listener(lineno, name,
+                                            ast.Name(id=name, ctx=ast.Load()))
+                     for lineno, name in ((1, 'a'), (1, 'b'), (2, 'c'))]
+
+        result = self.lst._batched(listeners)
+
+        self.assertEqual(len(result), 2)
+        self.assertEqual(ast.dump(result[0]), ast.dump(ast.parse(
+            '_livesource_record[0]((a, b))').body[0]))
+        self.assertIs(result[1], listeners[2])
+        self.assertEqual(self.lst.batches, {0: (0, 1)})
+
+    def test_release_batch(self):
+        nodes = self.lst._batched([
+            self.lst._add_listener(1, name, ast.Name(id=name, ctx=ast.Load()))
+            for name in ('a', 'b')])
+
+        self.assertEqual(self.lst.probe_ids(nodes), [0, 1])
+
+        self.lst.release(nodes)
+
+        self.assertEqual(self.lst.probes, [None, None])
+        self.assertEqual(self.lst.batches, {})
+
+    def test_compact(self):
+        removed = [self.lst._add_listener(1, 'a', ast.Name(id='a',
+                                                           ctx=ast.Load()))]
+        kept = self.lst._batched([
+            self.lst._add_listener(2, name, ast.Name(id=name, ctx=ast.Load()))
+            for name in ('b', 'c')])
+        self.lst.release(removed)
+
+        self.assertEqual(self.lst.released, 1)
+
+        self.lst.compact(kept)
+
+        self.assertEqual(self.lst.probes, [(2, 'b', False), (2, 'c', False)])
+        self.assertEqual(self.lst.batches, {0: (0, 1)})
+        self.assertEqual(self.lst.released, 0)
+        self.assertEqual(ast.dump(kept[0]), ast.dump(ast.parse(
+            '_livesource_record[0]((b, c))').body[0]))
+
+    def test_shift(self):
+        nodes = [self.lst._add_listener(3, 'c', ast.Name(id='c',
+                                                         ctx=ast.Load()))]
+
+        self.lst.shift(nodes, 2)
+
+        self.assertEqual(self.lst.probes, [(5, 'c', False)])
+        self.assertEqual(nodes[0].lineno, 6)
 
 
 class ExpressionsTestCase(unittest.TestCase):
@@ -64,10 +145,13 @@ class ModulesTestCase(unittest.TestCase):
         self.node.body.return_value = ''
 
     def test_expression(self):
-        result = ast.dump(self.lst.visit_Expression(self.node))
+        node = ast.parse('[x for x in y]', mode='eval')
 
-        expected = ast.dump(ast.Expression(body=[]))
+        result = ast.dump(self.lst.visit_Expression(node))
 
+        expected = ast.dump(ast.parse(
+            '[x for x in y if _livesource_record[0](x) or True]',
+            mode='eval'))
         self.assertEqual(result, expected)
 
     def test_interactive(self):
@@ -80,7 +164,7 @@ class ModulesTestCase(unittest.TestCase):
     def test_module(self):
         result = ast.dump(self.lst.visit_Module(self.node))
 
-        expected = ast.dump(ast.Module(body=[]))
+        expected = ast.dump(ast.Module(body=[], type_ignores=[]))
 
         self.assertEqual(result, expected)
 
@@ -156,4 +240,79 @@ class VisitorTestCase(unittest.TestCase):
 
         result = self.lst.block_visit(fields)
 
-        self.assertEqual(result, [])
+        self.assertEqual(result, [obj])
+        self.assertEqual(self.lst.stack, [obj])
+
+    def test_block_visit_order(self):
+        statements = ast.parse('a = 1; b = 2\nreturn a\n').body
+
+        result = self.lst.block_visit(statements)
+
+        expected = ast.parse('a = 1\n_livesource_record[0](a)\n'
+                             'b = 2\n_livesource_record[1](b)\n'
+                             '_livesource_record[2](a)\nreturn a\n').body
+        self.assertEqual([ast.dump(node) for node in result],
+                         [ast.dump(node) for node in expected])
+        self.assertEqual(self.lst.stack, [])
+
+    def test_locations(self):
+        self.lst.gated = True
+        self.lst.framed = True
+        tree = ast.parse('a = [x for x in y]\n')
+
+        result = self.lst.visit(tree)
+
+        for node in ast.walk(result):
+            if 'lineno' in node._attributes:
+                self.assertIsInstance(node.lineno, int)
+                self.assertIsInstance(node.col_offset, int)
+
+    def test_profiled(self):
+        self.lst.profiled = True
+        tree = ast.parse('"""doc"""\nglobal a\na = 1; b = 2\n')
+
+        result = self.lst.visit(tree)
+
+        expected = ast.parse(
+            '"""doc"""\n'
+            'global a\n'
+            '_livesource_t0 = _livesource_clock()\n'
+            'try:\n'
+            '    a = 1; b = 2\n'
+            'finally:\n'
+            '    _livesource_times[3] += '
+            '_livesource_clock() - _livesource_t0\n'
+            '    _livesource_counts[3] += 1\n')
+        self.assertEqual(ast.dump(result), ast.dump(expected))
+        self.assertEqual(self.lst.probes, [])
+
+    def test_profiled_nested(self):
+        self.lst.profiled = True
+        tree = ast.parse('for i in x:\n    if i: y = i\nclass A:\n    z = 1\n')
+
+        result = self.lst.visit(tree)
+
+        loop, try_loop = result.body[:2]
+        self.assertEqual(loop.targets[0].id, '_livesource_t0')
+        condition = try_loop.body[0].body
+        self.assertEqual(condition[0].targets[0].id, '_livesource_t1')
+        self.assertEqual(len(condition[1].body[0].body), 1)  # same line
+        class_body = result.body[3].body[0].body
+        self.assertEqual(ast.dump(class_body[0]),
+                         ast.dump(ast.parse('z = 1').body[0]))
+
+    def test_collector_paused(self):
+        enabled = gc.isenabled()
+        self.addCleanup(gc.enable if enabled else gc.disable)
+        gc.enable()
+
+        with _collector_paused:
+            with _collector_paused:  # e.g. other thread
+                self.lst.visit(ast.parse('a = 1'))
+                self.assertFalse(gc.isenabled())
+            self.assertFalse(gc.isenabled())
+        self.assertTrue(gc.isenabled())
+
+        gc.disable()
+        self.lst.visit(ast.parse('a = 1'))
+        self.assertFalse(gc.isenabled())
@@ -6,15 +6,16 @@ LiveSource tests.
 from mock import MagicMock, patch
 import unittest
 
-from livesource import LiveSource
+from livesource import CodeCache, LiveSource
 
 
 class LiveSourceTestCase(unittest.TestCase):
     @patch('livesource.livesource.LSTree', MagicMock())
     def setUp(self):
         self.source = LiveSource('test_code')
+        self.source.cache = CodeCache()
         self.source.lst.globals = {}
-        self.source.lst.locals = {'__livesource_listing': ''}
+        self.source.lst.recorder.listing.return_value = ''
         self.source.lst.visit = MagicMock(side_effect=lambda x: x)
 
     @patch('livesource.livesource.LSTree', MagicMock(side_effect=lambda x: x))
@@ -34,6 +35,37 @@ class LiveSourceTestCase(unittest.TestCase):
 
         self.assertEqual(result, '')
 
+    def test_get_values_cached(self):
+        self.source._parse = MagicMock(return_value='')
+
+        self.source.get_values()
+        self.source.get_values()
+
+        self.assertEqual(self.source._parse.call_count, 1)
+        self.assertEqual((self.source.cache.hits, self.source.cache.misses),
+                         (1, 1))
+
+    def test_get_values_disk_cached(self):
+        self.source._parse = MagicMock(return_value='')
+        self.source.disk_cache = MagicMock()
+        self.source.disk_cache.get.return_value = (compile('', '', 'exec'),
+                                                   (), {})
+
+        self.source.get_values()
+
+        self.assertFalse(self.source._parse.called)
+        self.assertFalse(self.source.disk_cache.set.called)
+
+    def test_select(self):
+        self.source._tree = MagicMock()
+
+        self.source.select(lines=[(5, 6), (1, 2)], names=['a'])
+
+        self.assertEqual(self.source.lst.lines, ((1, 2), (5, 6)))
+        self.assertEqual(self.source.lst.names, frozenset(['a']))
+        self.assertIsNone(self.source.lst.kinds)
+        self.assertIsNone(self.source._tree)
+
     @unittest.skip("Not Implemented")
     def test_set_variable(self):
         pass
@@ -45,9 +77,21 @@ class LiveSourceTestCase(unittest.TestCase):
 
         self.assertEqual(self.source.code, code)
 
-    @patch('ast.parse', MagicMock(side_effect=lambda x: 'parsed {}'.format(x)))
+    def test_update_invalid(self):
+        self.source._tree = MagicMock()
+        self.source._splice = MagicMock(side_effect=SyntaxError)
+
+        self.source.update('new_code')
+
+        self.assertEqual(self.source.code, 'new_code')
+        self.assertIsNone(self.source._tree)
+
+    @patch('ast.parse', MagicMock(side_effect=lambda x: MagicMock(
+        body=[MagicMock(lineno=1, decorator_list=[], code=x)])))
     @patch('ast.fix_missing_locations', MagicMock(side_effect=lambda x: x))
     def test__parse(self):
         result = self.source._parse()
 
-        self.assertEqual(result, 'parsed test_code')
+        self.assertEqual(result.body[0].code, 'test_code')
+        self.assertEqual(self.source._tree, result)
+        self.assertEqual(self.source._chunks, [(1, result.body)])
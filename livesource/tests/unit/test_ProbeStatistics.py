@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+ProbeStatistics tests.
+
+"""
+import unittest
+
+from livesource.statistics import ProbeStatistics
+
+
+class ProbeStatisticsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.probes = ((1, 'a', False), None, (2, 'b', False))
+        self.statistics = ProbeStatistics(self.probes)
+        self.statistics.call_cost = 0.5
+
+    def test_timed(self):
+        values = []
+        timed = self.statistics.timed(values.append, 2,
+                                      self.statistics.hits,
+                                      self.statistics.recorded)
+
+        timed(1)
+        timed(2)
+
+        self.assertEqual(values, [1, 2])
+        self.assertEqual(self.statistics.hits, [0, 0, 2])
+        self.assertEqual(self.statistics.recorded, [0, 0, 2])
+        self.assertGreater(self.statistics.seconds[2], 0.0)
+
+    def test_timed_batch(self):
+        probes = ((1, 'a', False), (1, 'b', False))
+        statistics = ProbeStatistics(probes, {0: (0, 1)})
+        statistics.call_cost = 0.5
+        timed = statistics.timed(len, 0, statistics.hits)
+
+        timed((1, 2))
+
+        self.assertEqual(statistics.hits, [1, 1])
+        self.assertEqual(statistics.seconds[0], statistics.seconds[1])
+        self.assertAlmostEqual(statistics.overhead,
+                               statistics.recording_time + 0.5)
+
+    def test_timed_error(self):
+        def failing(value):
+            raise ValueError(value)
+        timed = self.statistics.timed(failing, 0, self.statistics.hits)
+
+        self.assertRaises(ValueError, timed, 1)
+        self.assertEqual(self.statistics.hits, [1, 0, 0])
+
+    def test_measure(self):
+        result = self.statistics.measure(sum, [1, 2])
+
+        self.assertEqual(result, 3)
+        self.assertGreater(self.statistics.run_time, 0.0)
+
+    def test_sites(self):
+        self.statistics.hits[:] = [4, 0, 2]
+        self.statistics.recorded[:] = [4, 0, 2]
+        self.statistics.seconds[:] = [1.0, 0.0, 4.0]
+
+        sites = self.statistics.sites()
+
+        self.assertEqual([dict(site) for site in sites],
+                         [{'probe': 2, 'line': 2, 'name': 'b', 'hits': 2,
+                           'recorded': 2, 'seconds': 4.0, 'overhead': 5.0},
+                          {'probe': 0, 'line': 1, 'name': 'a', 'hits': 4,
+                           'recorded': 4, 'seconds': 1.0, 'overhead': 3.0}])
+
+    def test_gated_calls(self):
+        self.statistics.gated = True
+        self.statistics.hits[:] = [4, 0, 0]
+        self.statistics.recorded[:] = [2, 0, 0]
+
+        self.assertEqual(self.statistics.overhead, 3.0)
+
+    def test_lines(self):
+        probes = ((1, 'a', False), (1, 'b', False))
+        statistics = ProbeStatistics(probes)
+        statistics.call_cost = 0.0
+        statistics.hits[:] = [1, 2]
+        statistics.recorded[:] = [1, 2]
+        statistics.seconds[:] = [1.0, 2.0]
+
+        self.assertEqual(statistics.lines(), {1: (3, 3, 3.0)})
+
+    def test_summary(self):
+        self.statistics.hits[:] = [2, 0, 0]
+        self.statistics.recorded[:] = [2, 0, 0]
+        self.statistics.seconds[:] = [1.0, 0.0, 0.0]
+        self.statistics.run_time = 4.0
+
+        summary = self.statistics.summary()
+
+        self.assertEqual(dict(summary),
+                         {'run_time': 4.0, 'user_time': 2.0,
+                          'recording_time': 1.0, 'overhead': 2.0,
+                          'overhead_ratio': 0.5, 'hits': 2, 'recorded': 2})
+
+    def test_calibrate(self):
+        self.assertGreaterEqual(ProbeStatistics.calibrate(), 0.0)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Profile tests.
+
+"""
+import pickle
+import unittest
+
+from livesource.profile import Profile
+from livesource.recorder import Aborted
+
+
+class ProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.profile = Profile(5)
+        self.profile.counts[1] = 2
+        self.profile.times[1] = 30
+        self.profile.counts[3] = 1
+        self.profile.times[3] = 50
+
+    def test_mapping(self):
+        self.assertEqual(dict(self.profile), {1: (2, 30), 3: (1, 50)})
+        self.assertEqual(len(self.profile), 2)
+        self.assertNotIn(2, self.profile)
+        self.assertNotIn(7, self.profile)
+
+    def test_hottest(self):
+        self.assertEqual(self.profile.hottest(1), [(3, 1, 50)])
+
+    def test_namespace(self):
+        namespace = self.profile.namespace()
+
+        self.assertIs(namespace['_livesource_counts'], self.profile.counts)
+        self.assertIs(namespace['_livesource_times'], self.profile.times)
+        self.assertIsInstance(namespace['_livesource_clock'](), int)
+
+    def test_pickle(self):
+        self.profile.namespace()
+        self.profile.run_time = 100
+
+        profile = pickle.loads(pickle.dumps(self.profile))
+
+        self.assertEqual(dict(profile), dict(self.profile))
+        self.assertEqual(profile.run_time, 100)
+
+    def test_abort(self):
+        namespace = self.profile.namespace()
+
+        self.profile.abort()
+
+        self.assertRaises(Aborted, namespace['_livesource_clock'])
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Recorder tests.
+
+"""
+import collections
+from mock import MagicMock
+import unittest
+
+from livesource import Backoff, Every, TimeBudget
+from livesource.recorder import Aborted, Delta, Recorder
+
+
+class RecorderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.recorder = Recorder(max_deep=2)
+
+    def test_start(self):
+        self.recorder.start(((1, 'a', False), None, (2, 'b', False)))
+
+        self.assertEqual(len(self.recorder.record), 3)
+        self.assertIsNone(self.recorder.record[1])
+
+    def test_start_keeps_record_list(self):
+        record = self.recorder.record
+
+        self.recorder.start(((1, 'a', False),))
+
+        self.assertIs(self.recorder.record, record)
+
+    def test_record_single_probe(self):
+        self.recorder.start(((1, 'a', False),))
+
+        for value in range(3):
+            self.recorder.record[0](value)
+
+        self.assertEqual(self.recorder.listing()[1],
+                         collections.deque([('a', 1), ('a', 2)]))
+
+    def test_record_many_probes(self):
+        self.recorder.start(((1, 'a', False), (1, 'b', False)))
+
+        self.recorder.record[1](2)
+        self.recorder.record[0](1)
+
+        self.assertEqual(self.recorder.listing()[1],
+                         collections.deque([('b', 2), ('a', 1)]))
+
+    def test_record_batch(self):
+        self.recorder.start(((1, 'a', False), (1, 'b', False),
+                             (2, 'c', True), (2, 'd', True), (2, 'e', True)),
+                            batches={0: (0, 1), 2: (2, 3)})
+
+        self.recorder.record[0]((1, 2))
+        self.recorder.record[4]((6, 5))
+        self.recorder.record[2]((6, 3, 4))
+
+        self.assertIsNone(self.recorder.record[1])
+        listing = self.recorder.listing()
+        self.assertEqual(listing[1], collections.deque([('a', 1), ('b', 2)]))
+        self.assertEqual(dict(listing.calls(2)),
+                         {6: [('e', 5), ('c', 3), ('d', 4)]})
+
+    def test_restore_batch(self):
+        probes = ((1, 'a', True), (1, 'b', True), (1, 'c', False))
+        batches = {0: (0, 1)}
+        self.recorder.start(probes, batches=batches)
+        self.recorder.record[0]((7, 1, 2))
+        self.recorder.record[2](3)
+        entries = list(self.recorder.listing().entries())
+
+        self.recorder.start(probes, batches=batches)
+        self.recorder.restore(entries)
+
+        self.assertEqual(entries, [(0, 7, 1), (1, 7, 2), (2, None, 3)])
+        self.assertEqual(list(self.recorder.listing().entries()), entries)
+
+    def test_stream_batch(self):
+        events = []
+        self.recorder.start(((1, 'a', True), (1, 'b', True)), events.append,
+                            batches={0: (0, 1)})
+
+        self.recorder.record[0]((5, 1, 2))
+
+        self.assertEqual(events, [(1, 'a', 1), (1, 'b', 2)])
+
+    def test_abort(self):
+        self.recorder.policy = Every(1)
+        self.recorder.start(((1, 'a', False),))
+        record = self.recorder.record
+
+        self.recorder.abort()
+
+        self.assertIs(self.recorder.record, record)
+        self.assertRaises(Aborted, self.recorder.record[0], 1)
+        self.assertRaises(Aborted, self.recorder.gate[0])
+
+
+class ListingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.recorder = Recorder()
+        self.recorder.start(((1, 'a', False), (2, 'b', False)))
+        self.recorder.record[0](1)
+
+    def test_mapping(self):
+        listing = self.recorder.listing()
+
+        self.assertEqual(list(listing), [1])
+        self.assertEqual(len(listing), 1)
+        self.assertRaises(KeyError, lambda: listing[2])
+
+    def test_previous_run(self):
+        listing = self.recorder.listing()
+
+        self.recorder.start(((1, 'a', False),))
+
+        self.assertEqual(dict(listing), {1: collections.deque([('a', 1)])})
+        self.assertEqual(dict(self.recorder.listing()), {})
+
+    def test_calls(self):
+        self.recorder.start(((1, 'a', True), (1, 'b', True), (2, 'c', True)))
+        self.recorder.record[0]((5, 1))
+        self.recorder.record[1]((6, 2))
+        self.recorder.record[0]((5, 3))
+        self.recorder.record[2]((7, 4))
+        listing = self.recorder.listing()
+
+        self.assertEqual(listing[1], collections.deque([('a', 1), ('b', 2),
+                                                        ('a', 3)]))
+        self.assertEqual(list(listing.calls(1).items()),
+                         [(5, [('a', 1), ('a', 3)]), (6, [('b', 2)])])
+        self.assertEqual(dict(listing.calls(2)), {7: [('c', 4)]})
+
+    def test_calls_outside_function(self):
+        listing = self.recorder.listing()
+
+        self.assertEqual(dict(listing.calls(1)), {None: [('a', 1)]})
+        self.assertRaises(KeyError, listing.calls, 2)
+
+
+class PolicyTestCase(unittest.TestCase):
+    def hits(self, policy, count):
+        gates = [None]
+        gates[0] = policy.gate(gates, 0)
+        return [index + 1 for index in range(count) if gates[0]()]
+
+    def test_every(self):
+        result = self.hits(Every(3), 10)
+
+        self.assertEqual(result, [1, 4, 7, 10])
+
+    def test_every_single_hit(self):
+        result = self.hits(Every(10), 1)
+
+        self.assertEqual(result, [1])
+
+    def test_backoff(self):
+        result = self.hits(Backoff(2), 20)
+
+        self.assertEqual(result, [1, 2, 4, 8, 16])
+
+    def test_time_budget(self):
+        policy = TimeBudget(1)
+        policy.clock = MagicMock(side_effect=[0, 0.5, 2])
+
+        result = self.hits(policy, 5)
+
+        self.assertEqual(result, [1, 2])
+
+    def test_recorder_gates(self):
+        recorder = Recorder(policy=Every(2))
+
+        recorder.start(((1, 'a', False), None))
+
+        self.assertEqual([recorder.gate[0]() for _ in range(4)],
+                         [True, False, True, False])
+        self.assertIsNone(recorder.gate[1])
+
+
+class DeltaTestCase(unittest.TestCase):
+    def test_between(self):
+        previous = {1: (('a', 1),), 2: (('b', 2),), 3: (('c', 3),)}
+        current = {1: (('a', 1),), 2: (('b', 2), ('b', 3)), 4: (('d', 4),)}
+
+        delta = Delta.between(previous, current, 2, 1)
+
+        self.assertEqual(delta.changed, {2: [('b', 2), ('b', 3)],
+                                         4: [('d', 4)]})
+        self.assertEqual(delta.removed, [3])
+
+    def test_incomparable_values(self):
+        value = MagicMock()
+        value.__eq__.side_effect = ValueError
+
+        delta = Delta.between({1: (('a', value),)}, {1: (('a', value),)},
+                              2, 1)
+        other = Delta.between({1: (('a', value),)}, {1: (('a', MagicMock()),)},
+                              2, 1)
+
+        self.assertEqual(delta.changed, {})
+        self.assertEqual(list(other.changed), [1])
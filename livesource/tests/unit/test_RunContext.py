@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+RunContext tests.
+
+"""
+from mock import patch
+import unittest
+
+from livesource import RunContext
+
+
+class RunContextTestCase(unittest.TestCase):
+    def test_namespace(self):
+        context = RunContext()
+        tables = {'_livesource_record': []}
+
+        first = context.namespace(tables)
+        first['a'] = 1
+        second = context.namespace(tables)
+
+        self.assertEqual(second, tables)
+        self.assertIsNot(second, first)
+        self.assertIs(second['_livesource_record'],
+                      tables['_livesource_record'])
+
+    @patch('importlib.import_module')
+    def test_warm(self, import_module):
+        context = RunContext(['json', 'decimal'])
+
+        context.namespace({})
+        context.namespace({})
+
+        self.assertEqual([call[0][0] for call in
+                          import_module.call_args_list], ['json', 'decimal'])
+        self.assertEqual(sorted(context.modules), ['decimal', 'json'])
+
+    def test_warm_error(self):
+        context = RunContext(['livesource_missing_module'])
+
+        self.assertRaises(ImportError, context.warm)
+        self.assertEqual(context.modules, {})
+
+    def test_repr(self):
+        self.assertEqual(repr(RunContext(('json',))),
+                         "RunContext(preload=['json'])")
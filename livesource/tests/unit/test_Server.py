@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Server tests.
+
+"""
+import json
+import unittest
+
+from mock import patch
+
+from livesource.server import (EVALUATION_ERROR, INTERNAL_ERROR,
+                               INVALID_PARAMS, INVALID_REQUEST,
+                               METHOD_NOT_FOUND, PARSE_ERROR,
+                               UNKNOWN_DOCUMENT, Server)
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+        self.request_id = 0
+
+    def call(self, method, **params):
+        self.request_id += 1
+        response = json.loads(self.server.handle(json.dumps(
+            {'jsonrpc': '2.0', 'id': self.request_id, 'method': method,
+             'params': params})))
+        self.assertEqual(response['id'], self.request_id)
+        return response
+
+    def test_get_values(self):
+        self.call('update', uri='doc', code='a = 1\nb = 2\n')
+
+        response = self.call('get_values', uri='doc')
+
+        self.assertEqual(response['result'],
+                         {'generation': 1, 'base': 0,
+                          'changed': {'1': [['a', '1']], '2': [['b', '2']]},
+                          'removed': []})
+
+    def test_delta(self):
+        self.call('update', uri='doc', code='a = 1\nb = 2\nc = 3\n')
+        self.call('get_values', uri='doc')
+        self.call('update', uri='doc', code='a = 1\nb = 5\n')
+
+        response = self.call('get_values', uri='doc')
+
+        self.assertEqual(response['result'],
+                         {'generation': 2, 'base': 1,
+                          'changed': {'2': [['b', '5']]}, 'removed': [3]})
+        self.assertEqual(len(self.call('get_values', uri='doc',
+                                       full=True)['result']['changed']), 2)
+        self.assertEqual(self.call('get_values', uri='doc',
+                                   since=1)['result']['base'], 0)
+
+    def test_errors(self):
+        self.assertEqual(json.loads(self.server.handle('{'))['error']['code'],
+                         PARSE_ERROR)
+        self.assertEqual(json.loads(self.server.handle('[]'))['error']['code'],
+                         INVALID_REQUEST)
+        self.assertEqual(self.call('run')['error']['code'], METHOD_NOT_FOUND)
+        self.assertEqual(self.call('update', uri='doc')['error']['code'],
+                         INVALID_PARAMS)
+        self.assertEqual(self.call('get_values', uri='doc')['error']['code'],
+                         UNKNOWN_DOCUMENT)
+
+        self.call('update', uri='doc', code='a = 1 / 0')
+        error = self.call('get_values', uri='doc')['error']
+
+        self.assertEqual(error['code'], EVALUATION_ERROR)
+        self.assertIn('ZeroDivisionError', error['message'])
+
+    def test_invalid_params(self):
+        self.assertEqual(self.call('update', uri='doc',
+                                   code=5)['error']['code'], INVALID_PARAMS)
+        self.assertEqual(self.call('update', uri=['doc'],
+                                   code='a = 1')['error']['code'],
+                         INVALID_PARAMS)
+        self.assertEqual(self.call('get_values', uri='doc',
+                                   since='1')['error']['code'],
+                         INVALID_PARAMS)
+        self.assertEqual(self.call('close', uri=None)['error']['code'],
+                         INVALID_PARAMS)
+        self.assertEqual(self.server.documents, {})
+
+    def test_internal_error(self):
+        with patch('livesource.server.LiveSource',
+                   side_effect=AttributeError('broken')):
+            error = self.call('update', uri='doc', code='a = 1')['error']
+
+        self.assertEqual(error['code'], INTERNAL_ERROR)
+        self.assertIn('broken', error['message'])
+
+    def test_close(self):
+        self.call('update', uri='doc', code='a = 1')
+
+        self.assertIsNone(self.call('close', uri='doc')['result'])
+        self.assertEqual(self.call('close', uri='doc')['error']['code'],
+                         UNKNOWN_DOCUMENT)
+
+    def test_notification(self):
+        self.assertIsNone(self.server.handle(json.dumps(
+            {'jsonrpc': '2.0', 'method': 'update',
+             'params': {'uri': 'doc', 'code': 'a = 1'}})))
+        self.assertIn('doc', self.server.documents)
+
+    def test_invalid_notification(self):
+        for params in ({'uri': 'doc', 'code': 5}, {'uri': 'doc'}, []):
+            self.assertIsNone(self.server.handle(json.dumps(
+                {'jsonrpc': '2.0', 'method': 'update', 'params': params})))
+        self.assertIsNone(self.server.handle(json.dumps(
+            {'jsonrpc': '2.0', 'method': 'run'})))
+        self.assertEqual(self.server.documents, {})
+
+    def test_serve(self):
+        output = []
+        lines = [json.dumps({'jsonrpc': '2.0', 'id': 1,
+                             'method': 'shutdown'}),
+                 json.dumps({'jsonrpc': '2.0', 'id': 2,
+                             'method': 'shutdown'})]
+
+        self.server.serve(lines, output.append)
+
+        self.assertEqual(len(output), 1)
+        self.assertFalse(self.server.running)
+
+
+if __name__ == '__main__':
+    unittest.main()
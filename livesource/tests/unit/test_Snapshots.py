@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshots tests.
+
+"""
+import collections
+import pickle
+import unittest
+
+from livesource import Snapshots, Summary
+
+
+class Point(object):
+    def __repr__(self):
+        return 'Point()'
+
+
+class SnapshotsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.capture = Snapshots(max_items=3, max_length=5).capturer()
+
+    def test_scalars(self):
+        for value in (1, 1.5, 1j, True, None):
+            self.assertIs(self.capture(value), value)
+
+    def test_short_string(self):
+        value = 'abc'
+
+        self.assertIs(self.capture(value), value)
+
+    def test_long_string(self):
+        snapshot = self.capture('abcdefgh')
+
+        self.assertEqual((snapshot.type_name, snapshot.length, snapshot.head),
+                         ('str', 8, 'abcde'))
+        self.assertEqual(repr(snapshot), "<str of length 8: 'abcde'...>")
+
+    def test_small_container_is_copied(self):
+        value = [1, {'a': 2}]
+
+        snapshot = self.capture(value)
+        value[1]['a'] = 3
+
+        self.assertEqual(snapshot, [1, {'a': 2}])
+
+    def test_large_container(self):
+        snapshot = self.capture(list(range(100)))
+
+        self.assertEqual((snapshot.type_name, snapshot.length, snapshot.head),
+                         ('list', 100, (0, 1, 2)))
+        self.assertEqual(repr(snapshot),
+                         '<list of length 100: [0, 1, 2, ...]>')
+
+    def test_large_dict(self):
+        snapshot = self.capture(dict((key, key) for key in range(4)))
+
+        self.assertEqual(snapshot.length, 4)
+        self.assertEqual(len(snapshot.head), 3)
+        self.assertTrue(repr(snapshot).endswith(', ...}>'))
+
+    def test_max_depth(self):
+        snapshot = self.capture([[[1]]])
+
+        self.assertEqual(repr(snapshot), '[[<list of length 1>]]')
+
+    def test_objects_by_reference(self):
+        value = Point()
+
+        self.assertIs(self.capture(value), value)
+
+    def test_objects_by_repr(self):
+        capture = Snapshots(objects='repr').capturer()
+
+        snapshot = capture(Point())
+
+        self.assertEqual(repr(snapshot), 'Point()')
+
+    def test_unknown_objects_storage(self):
+        self.assertRaises(ValueError, Snapshots, objects='copy')
+
+    def test_budget(self):
+        capture = Snapshots(budget=1).capturer()
+        capture('a')
+
+        snapshot = capture([1, 2])
+
+        self.assertEqual(repr(snapshot), '<list of length 2>')
+        self.assertEqual(repr(capture(Point())), '<Point object>')
+        self.assertEqual(capture(1), 1)
+
+    def test_used(self):
+        capture = Snapshots().capturer()
+
+        capture(1)
+        self.assertEqual(capture.used, [0])
+
+        capture([1, 2])
+        self.assertGreater(capture.used[0], 0)
+
+    def test_budget_of_every_capturer(self):
+        snapshots = Snapshots(budget=1)
+        snapshots.capturer()('a')
+
+        self.assertEqual(snapshots.capturer()([1, 2]), [1, 2])
+
+
+class SummaryTestCase(unittest.TestCase):
+    def test_pickle(self):
+        summary = Summary('list', 100, (0, 1))
+
+        result = pickle.loads(pickle.dumps(summary))
+
+        self.assertEqual(repr(result), repr(summary))
+
+    def test_lazy_repr(self):
+        head = collections.deque([1])
+        summary = Summary('deque', 20, head)
+        text = repr(summary)
+
+        head.append(2)
+
+        self.assertEqual(repr(summary), text)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Stream tests.
+
+"""
+import threading
+import unittest
+
+from livesource.recorder import Aborted
+from livesource.stream import Stream
+
+
+class StreamTestCase(unittest.TestCase):
+    def test_unknown_overflow(self):
+        self.assertRaises(ValueError, Stream, overflow='ignore')
+
+    def test_iteration(self):
+        stream = Stream()
+        stream.put((1, 'a', 1))
+        stream.put((2, 'b', 2))
+        stream.finish()
+
+        self.assertEqual(list(stream), [(1, 'a', 1), (2, 'b', 2)])
+
+    def test_error(self):
+        stream = Stream()
+        stream.put((1, 'a', 1))
+        stream.finish(ValueError('error'))
+
+        self.assertEqual(next(stream), (1, 'a', 1))
+        self.assertRaises(ValueError, next, stream)
+        self.assertRaises(StopIteration, next, stream)
+
+    def test_drop(self):
+        stream = Stream(maxsize=2, overflow='drop')
+        for value in range(4):
+            stream.put((1, 'a', value))
+        stream.finish()
+
+        self.assertEqual([event[2] for event in stream], [0, 1])
+        self.assertEqual(stream.dropped, 2)
+
+    def test_drop_oldest(self):
+        stream = Stream(maxsize=2, overflow='drop_oldest')
+        for value in range(4):
+            stream.put((1, 'a', value))
+        stream.finish()
+
+        self.assertEqual([event[2] for event in stream], [2, 3])
+        self.assertEqual(stream.dropped, 2)
+
+    def test_block(self):
+        stream = Stream(maxsize=1)
+        stream.put((1, 'a', 0))
+        producer = threading.Thread(target=stream.put, args=((1, 'a', 1),))
+        producer.start()
+
+        producer.join(0.1)
+        self.assertTrue(producer.is_alive())
+
+        self.assertEqual(next(stream), (1, 'a', 0))
+        producer.join()
+        self.assertEqual(next(stream), (1, 'a', 1))
+
+    def test_close(self):
+        stream = Stream()
+        stream.put((1, 'a', 0))
+
+        stream.close()
+
+        self.assertRaises(Aborted, stream.put, (1, 'a', 1))
+        self.assertEqual(list(stream), [])
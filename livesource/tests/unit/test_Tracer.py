@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Tracer tests.
+
+"""
+import collections
+from textwrap import dedent as d
+import threading
+import unittest
+
+from livesource.recorder import Aborted
+from livesource.trace import Tracer, bound_names
+
+
+def run(code, **options):
+    return Tracer(**options).run(compile(code, '<livesource>', 'exec'), {})
+
+
+class TracerTestCase(unittest.TestCase):
+    def test_assignments(self):
+        values = run('a = 1\nb = a + 1\na = 3\n')
+
+        self.assertEqual(values, {1: collections.deque([('a', 1)]),
+                                  2: collections.deque([('b', 2)]),
+                                  3: collections.deque([('a', 3)])})
+
+    def test_loop(self):
+        code = d("""\
+                    for i in range(3):
+                        pass
+                 """)
+
+        values = run(code, max_deep=2)
+
+        self.assertEqual(values[1], collections.deque([('i', 1), ('i', 2)]))
+
+    def test_function(self):
+        code = d("""\
+                    def f(a):
+                        b = a * 2
+                        return b
+                    c = f(1)
+                 """)
+
+        values = run(code)
+
+        self.assertEqual(values[1], collections.deque([('f', values[1][0][1]),
+                                                       ('a', 1)]))
+        self.assertEqual(values[2], collections.deque([('b', 2)]))
+        self.assertEqual(values[4], collections.deque([('c', 2)]))
+
+    def test_watched(self):
+        values = run('a = 1\nb = 2\n',
+                     watched=lambda lineno, name: name == 'b')
+
+        self.assertEqual(list(values), [2])
+
+    def test_capture(self):
+        values = run('a = [1]\n', capture=lambda value: len(value))
+
+        self.assertEqual(values[1], collections.deque([('a', 1)]))
+
+    def test_cancelled(self):
+        cancelled = threading.Event()
+        cancelled.set()
+
+        self.assertRaises(Aborted, run, 'a = 1\n', cancelled=cancelled)
+
+    def test_bound_names(self):
+        code = compile('a = 1\nb, c = a, 2\n', '<livesource>', 'exec')
+
+        stores = bound_names(code)
+
+        self.assertEqual(stores[code], {1: ['a'], 2: ['b', 'c']})
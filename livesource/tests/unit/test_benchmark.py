@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark tests.
+
+"""
+import unittest
+
+from livesource import benchmark
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_workloads(self):
+        for generate, _ in benchmark.WORKLOADS.values():
+            code = generate(4)
+
+            compile(code, '<benchmark>', 'exec')
+
+    def test_run(self):
+        result = benchmark.run(['loops'], repeat=1, scale=0.05)
+
+        self.assertEqual(list(result['results']), ['loops'])
+        self.assertIn('slowdown', result['results']['loops'])
+
+    def test_run_scaling(self):
+        result = benchmark.run_scaling(['large'], repeat=1, scale=0.01)
+
+        sizes = result['results']['large']['sizes']
+        self.assertEqual(len(sizes), len(benchmark.SCALING_SIZES))
+        self.assertIn('growth', result['results']['large'])
+        self.assertGreater(sizes[-1]['lines'], sizes[0]['lines'])
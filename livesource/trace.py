@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Recording of values by tracing of executed code.
+
+Alternative to instrumentation of source code: local variables of traced
+code are compared after every executed line and changed ones are
+recorded. Uses low-overhead monitoring (PEP 669) on Python 3.12+ and
+sys.settrace() on older versions.
+
+"""
+import collections
+import sys
+try:
+    import dis
+    get_instructions = dis.get_instructions
+except AttributeError:  # Python < 3.4
+    get_instructions = None
+
+from .recorder import Aborted
+from .snapshot import sizes
+
+monitoring = getattr(sys, 'monitoring', None)  # Python 3.12+
+
+#: marks variable missing before executed line
+MISSING = object()
+
+#: instructions which bind local variables
+STORE_OPS = frozenset(['STORE_NAME', 'STORE_FAST', 'STORE_DEREF',
+                       'STORE_FAST_STORE_FAST', 'STORE_FAST_LOAD_FAST'])
+
+
+class Tracer(object):
+    """
+    Records changed variables of every executed line.
+
+    Only variables bound by executed line are compared (names are found in
+    bytecode), so cost of line does not depend on number of variables.
+    Only rebinding of variable is noticed, values mutated in place are not
+    recorded again.
+
+    Attributes:
+        cancelled (threading.Event): Aborts execution when set.
+        capture (callable): Converts value before it is stored, e.g.
+            capturer of Snapshots.
+        max_deep (int): Number of cached values at one line.
+        watched (callable): Tells if (line number, name) is recorded, None
+            to record all variables.
+
+    """
+    def __init__(self, max_deep=10, watched=None, capture=None,
+                 cancelled=None):
+        """
+
+        Args:
+            max_deep (int): Number of cached values at one line.
+            watched (callable): Filter of recorded (line number, name).
+            capture (callable): Converts value before it is stored.
+            cancelled (threading.Event): Aborts execution when set.
+
+        """
+        self.max_deep = max_deep
+        self.watched = watched
+        self.capture = capture
+        self.cancelled = cancelled
+        self._frames = {}  # frame -> (executed line, variables before it)
+        self._stores = {}  # code -> line -> names bound by line
+        self._values = {}
+        self._retained = {}  # line -> snapshot.sizes() of its values
+
+    def run(self, code, namespace, stores=None):
+        """
+        Executes code with tracing of its frames.
+
+        Args:
+            code: Code object.
+            namespace (dict): Globals of executed code.
+            stores (dict): Result of bound_names(code), computed when not
+                given.
+
+        Returns:
+            dict: Line number -> deque of (name, value) tuples.
+
+        Raises:
+            Aborted: Execution was cancelled.
+
+        """
+        self._frames = {}
+        self._values = {}
+        self._retained = {}
+        self._stores = bound_names(code) if stores is None else stores
+        if monitoring is not None:
+            self._run_monitored(code, namespace)
+        else:
+            self._run_traced(code, namespace)
+        return self._values
+
+    def _run_traced(self, code, namespace):
+        """
+        Executes code with sys.settrace().
+
+        """
+        filename = code.co_filename
+
+        def trace_line(frame, event, arg):
+            if event == 'line':
+                self._line(frame, frame.f_lineno)
+            elif event == 'return':
+                self._leave(frame)
+            return trace_line
+
+        def trace_call(frame, event, arg):
+            if frame.f_code.co_filename != filename:
+                return None  # other code is not traced line by line
+            return trace_line
+
+        previous = sys.gettrace()
+        sys.settrace(trace_call)
+        try:
+            exec(code, namespace)
+        finally:
+            sys.settrace(previous)
+
+    def _run_monitored(self, code, namespace):
+        """
+        Executes code with sys.monitoring, events of other code are not
+        generated at all.
+
+        """
+        events = monitoring.events
+        tool_id = self._free_tool_id()
+        codes = list(_code_objects(code))
+        monitoring.use_tool_id(tool_id, 'livesource')
+        try:
+            monitoring.register_callback(tool_id, events.LINE, self._on_line)
+            monitoring.register_callback(tool_id, events.PY_RETURN,
+                                         self._on_leave)
+            monitoring.register_callback(tool_id, events.PY_YIELD,
+                                         self._on_leave)
+            for code_object in codes:
+                monitoring.set_local_events(tool_id, code_object,
+                                            events.LINE | events.PY_RETURN |
+                                            events.PY_YIELD)
+            exec(code, namespace)
+        finally:
+            for code_object in codes:
+                monitoring.set_local_events(tool_id, code_object, 0)
+            for event in (events.LINE, events.PY_RETURN, events.PY_YIELD):
+                monitoring.register_callback(tool_id, event, None)
+            monitoring.free_tool_id(tool_id)
+
+    def _on_line(self, code, lineno):
+        self._line(sys._getframe(1), lineno)
+
+    def _on_leave(self, code, offset, value):
+        self._leave(sys._getframe(1))
+
+    def _line(self, frame, lineno):
+        """
+        Records variables changed by previous line of frame.
+
+        Args:
+            frame: Traced frame.
+            lineno (int): Line which is going to be executed.
+
+        Raises:
+            Aborted: Execution was cancelled.
+
+        """
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise Aborted()
+        variables = frame.f_locals
+        state = self._frames.get(frame)
+        if state is None:
+            # arguments are recorded at line of function definition
+            self._record(frame.f_code.co_firstlineno, {}, variables.items())
+        else:
+            self._changed(state, variables)
+
+        stores = self._stores.get(frame.f_code)
+        if stores is None:
+            previous = dict(variables)
+        else:
+            previous = dict((name, variables.get(name, MISSING))
+                            for name in stores.get(lineno, ()))
+        self._frames[frame] = (lineno, previous, stores is None)
+
+    def _leave(self, frame):
+        """
+        Records variables changed by last line of frame.
+
+        Args:
+            frame: Traced frame.
+
+        """
+        state = self._frames.pop(frame, None)
+        if state is not None:
+            self._changed(state, frame.f_locals)
+
+    def _changed(self, state, variables):
+        """
+        Stores variables changed by executed line.
+
+        Args:
+            state (tuple): Executed line, variables before it and flag of
+                comparison of all variables.
+            variables (dict): Variables after the line was executed.
+
+        """
+        lineno, previous, full = state
+        if full:
+            items = variables.items()
+        else:
+            items = ((name, variables[name]) for name in previous
+                     if name in variables)
+        self._record(lineno, previous, items)
+
+    def _record(self, lineno, previous, items):
+        """
+        Stores changed variables.
+
+        Args:
+            lineno (int): Executed line.
+            previous (dict): Variables before the line was executed.
+            items (iterable): (name, value) of variables after the line
+                was executed.
+
+        """
+        for name, value in items:
+            if previous.get(name, MISSING) is value:
+                continue
+            if name.startswith(('__', '_livesource', '.')):
+                continue  # internal names, e.g. '.0' of comprehension
+            if self.watched is not None and not self.watched(lineno, name):
+                continue
+            capture = self.capture
+            if capture is not None:
+                used = getattr(capture, 'used', None)
+                if used is None:
+                    value = capture(value)
+                else:  # budget of values kept in buffer of line
+                    retained = self._retained.get(lineno)
+                    if retained is None:
+                        retained = self._retained[lineno] = sizes(
+                            self.max_deep)
+                    used[0] -= retained[0]  # evicted by stored value
+                    before = used[0]
+                    value = capture(value)
+                    retained.append(used[0] - before)
+            values = self._values.get(lineno)
+            if values is None:
+                values = collections.deque(maxlen=self.max_deep)
+                self._values[lineno] = values
+            values.append((name, value))
+
+    @staticmethod
+    def _free_tool_id():
+        """
+        Returns:
+            int: Monitoring tool id which is not used.
+
+        Raises:
+            RuntimeError: All tool ids are used.
+
+        """
+        for tool_id in range(6):
+            if monitoring.get_tool(tool_id) is None:
+                return tool_id
+        raise RuntimeError('no free monitoring tool id')
+
+
+def bound_names(code):
+    """
+    Finds variables bound by every line of code, including its functions,
+    classes and comprehensions.
+
+    Args:
+        code: Code object.
+
+    Returns:
+        dict: Code object -> line number -> names of variables. Empty when
+        bytecode cannot be inspected.
+
+    """
+    if get_instructions is None:
+        return {}
+    return dict((code_object, _line_stores(code_object))
+                for code_object in _code_objects(code))
+
+
+def _line_stores(code):
+    """
+    Returns:
+        dict: Line number -> names of variables bound by line.
+
+    """
+    stores = collections.defaultdict(list)
+    lineno = code.co_firstlineno
+    for instruction in get_instructions(code):
+        positions = getattr(instruction, 'positions', None)
+        if positions is not None and positions.lineno is not None:
+            lineno = positions.lineno
+        elif isinstance(instruction.starts_line, int):  # Python < 3.11
+            lineno = instruction.starts_line
+        if instruction.opname not in STORE_OPS:
+            continue
+        names = instruction.argval
+        if instruction.opname == 'STORE_FAST_LOAD_FAST':
+            names = names[:1]
+        elif not isinstance(names, tuple):
+            names = (names,)
+        for name in names:
+            if name not in stores[lineno]:
+                stores[lineno].append(name)
+    return dict(stores)
+
+
+def _code_objects(code):
+    """
+    Yields code object and code objects of its functions, classes and
+    comprehensions.
+
+    """
+    stack = [code]
+    while stack:
+        code = stack.pop()
+        yield code
+        stack.extend(const for const in code.co_consts
+                     if isinstance(const, type(code)))